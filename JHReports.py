@@ -1,5 +1,8 @@
 import json
 import os
+import time
+import uuid
+import random
 import requests
 
 stores_cache = None
@@ -44,6 +47,35 @@ API_BASE = "https://api-server-jh.onrender.com"  # Render URL
 # API + STORE HELPERS
 # -----------------------------------
 
+# Mutating calls carry an Idempotency-Key so they can be retried safely.
+RETRY_ATTEMPTS = 4
+RETRY_BACKOFF = 0.5   # seconds, doubled on every retry
+RETRY_STATUSES = {502, 503, 504}
+
+def sendWithRetry(method: str, url: str, **kwargs):
+    """
+    requests.request() with an Idempotency-Key and exponential backoff.
+    Retries connection errors, timeouts and 502/503/504 with the same key;
+    the server replays its stored response to an attempt that got through.
+    Raises requests.RequestException if every attempt fails.
+    """
+    headers = dict(kwargs.pop("headers", None) or {})
+    headers.setdefault("Idempotency-Key", uuid.uuid4().hex)
+
+    for attempt in range(RETRY_ATTEMPTS):
+        last_try = attempt == RETRY_ATTEMPTS - 1
+        try:
+            resp = requests.request(method, url, headers=headers, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if last_try:
+                raise
+        else:
+            if resp.status_code not in RETRY_STATUSES or last_try:
+                return resp
+
+        time.sleep(RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, RETRY_BACKOFF))
+
+
 def displayIssues(store_name: str, store_number, issues: list):
     """Pretty-print issues for a store using DB column names."""
     print(f"\n{store_name} {store_number}")
@@ -179,6 +211,23 @@ def getIssuesForStore(store_number=None, store_name=None):
         print(c.red(f"Error fetching issues from server: {e}"))
         return []
 
+def apiLookupStores(term: str, limit: int = 25):
+    """
+    Ranked store lookup via GET /stores/lookup (number/ZIP prefix, name, city).
+    Returns a list of legacy store dicts (best match first), or None on error.
+    """
+    try:
+        resp = requests.get(
+            f"{API_BASE}/stores/lookup",
+            params={"q": term, "limit": limit},
+            timeout=10,
+        )
+        resp.raise_for_status()
+        return resp.json().get("matches", [])
+    except requests.RequestException as e:
+        print(c.red(f"Error looking up stores on server: {e}"))
+        return None
+
 def get_stores():
     """Cached loader for store metadata."""
     global stores_cache
@@ -219,25 +268,25 @@ def apiUpdate(issue_id: int, updated_issue: dict) -> bool:
     }
 
     try:
-        resp = requests.post(f"{API_BASE}/issues/update", json=payload, timeout=10)
+        resp = sendWithRetry("POST", f"{API_BASE}/issues/update", json=payload, timeout=10)
         resp.raise_for_status()
         return True
     except requests.RequestException as e:
         print(c.red(f"Error updating issue on server: {e}"))
         return False
 
-def apiDelete(issue_id: int) -> bool:
+def apiDeleteMany(issue_ids: list):
     """
-    Delete an issue on the server via POST /issues/delete.
+    Delete several issues in one request via POST /issues/batch-delete.
+    Returns the per-id results ([{"issue_id", "status"}]) or None on error.
     """
-    payload = {"issue_id": issue_id}
     try:
-        resp = requests.post(f"{API_BASE}/issues/delete", json=payload, timeout=10)
+        resp = sendWithRetry("POST", f"{API_BASE}/issues/batch-delete", json={"ids": issue_ids}, timeout=20)
         resp.raise_for_status()
-        return True
-    except requests.RequestException as e:
-        print(c.red(f"Error deleting issue on server: {e}"))
-        return False
+        return resp.json().get("results", [])
+    except (requests.RequestException, ValueError) as e:
+        print(c.red(f"Error deleting issues on server: {e}"))
+        return None
 
 def prompt_with_exit(prompt: str):
     """
@@ -258,11 +307,6 @@ def pause():
 # STORE SEARCH / SELECTION
 # -----------------------------------
 def issueStoreSearch():
-    stores = get_stores()
-    if stores is None:
-        print(c.red("Could not connect to server!"))
-        return None
-
     while True:
         query = input("\nEnter store number or part of store name (or type 'exit' to cancel): ").strip()
 
@@ -273,21 +317,21 @@ def issueStoreSearch():
         if query.lower() == "exit":
             return None
 
+        found = apiLookupStores(query)
+        if found is None:
+            print(c.red("Could not connect to server!"))
+            return None
+
         # --- SEARCH BY STORE NUMBER ---
         if query.isdigit():
-            sNum_int = int(query)
-            for sName, details in stores.items():
-                if details.get("Store Number") == sNum_int:
-                    return sName
+            for details in found:
+                if str(details.get("Store Number")) == query:
+                    return details.get("Store Name")
             print(c.red("No store found with that number."))
             continue
 
-        # --- SEARCH BY STORE NAME ---
-        matches = [
-            (sName, details)
-            for sName, details in stores.items()
-            if query.lower() in sName.lower()
-        ]
+        # --- SEARCH BY STORE NAME (ranked by the server) ---
+        matches = [(details.get("Store Name"), details) for details in found]
 
         if not matches:
             print(c.red("No stores found matching that name."))
@@ -416,6 +460,48 @@ def select_issue_for_store(store_name: str, store_number: int):
                 return issues[issue_index - 1]
         print(c.red("Invalid selection. Please enter a valid issue number."))
 
+def parse_selection(choice: str, count: int):
+    """
+    "1,3,5-7" -> [1, 3, 5, 6, 7] (1-based, each between 1 and count).
+    Returns None if any part is invalid.
+    """
+    picked = []
+    for part in choice.replace(" ", "").split(","):
+        start, _, end = part.partition("-")
+        if not start.isdigit() or (end and not end.isdigit()):
+            return None
+        first, last = int(start), int(end or start)
+        if not 1 <= first <= last <= count:
+            return None
+        picked.extend(n for n in range(first, last + 1) if n not in picked)
+    return picked
+
+def select_issues_for_store(store_name: str, store_number: int):
+    """
+    Like select_issue_for_store(), but the user may pick several issues
+    ("1,3,5-7"). Returns the chosen DB rows, or None.
+    """
+    issues = getIssuesForStore(store_number=store_number)
+    if not issues:
+        print(c.yellow(f"\nNo issues for {store_name}."))
+        return None
+
+    print(f"\nIssues for {store_name} (Store {store_number}):")
+    for idx, issue in enumerate(issues, start=1):
+        issue_name = issue.get("issue_name") or "Unnamed Issue"
+        status = issue.get("status") or "Unresolved"
+        comp = issue.get("computer_number") or "N/A"
+        dev = issue.get("device_type") or "N/A"
+        cat = issue.get("category") or "N/A"
+        print(f"{idx}. {issue_name} [{status}] (Device: {dev}, Category: {cat}, Computer: {comp})")
+
+    while True:
+        choice = input("\nSelect issue number(s), e.g. 1,3,5-7: ").strip()
+        picked = parse_selection(choice, len(issues)) if choice else None
+        if picked:
+            return [issues[n - 1] for n in picked]
+        print(c.red("Invalid selection. Please enter valid issue numbers."))
+
 # -----------------------------------
 # ISSUE CREATION
 # -----------------------------------
@@ -544,7 +630,7 @@ def issueAdd():
     }
 
     try:
-        response = requests.post(f"{API_BASE}/issues", json=payload, timeout=60)
+        response = sendWithRetry("POST", f"{API_BASE}/issues", json=payload, timeout=60)
         response.raise_for_status()
     except requests.RequestException as e:
         print("\n" + c.red(f"Error sending issue to server: {e}"))
@@ -626,12 +712,15 @@ def issueViewOne():
 def issueViewAll():
     """
     View all issues for all stores.
-    This loops over store metadata, and for each store calls /issues/by-store.
+    Store metadata carries per-store issue counters, so /issues/by-store is
+    only called for stores that actually have issues.
     """
-    stores = get_stores()
+    global stores_cache
+    stores = apiLoad()  # fresh counters, not the cached copy
     if stores is None:
         print(c.red("Could not connect to server!"))
         return
+    stores_cache = stores
 
     print("\n" + c.blue_bg(c.yellow("*****Stores with Known issues*****\n")))
     has_issues = False
@@ -641,6 +730,10 @@ def issueViewAll():
         if sNum is None:
             continue
 
+        counts = details.get("Issue Counts")
+        if counts is not None and not counts.get("total"):
+            continue
+
         issues = getIssuesForStore(store_number=sNum)
         if not issues:
             continue
@@ -927,33 +1020,37 @@ def issueRemove():
         print(c.red("Store number not found. Please try again."))
         return
 
-    # Choose an issue from DB rows
-    chosen_row = select_issue_for_store(sName, sNum_int)
-    if chosen_row is None:
+    # Choose one or more issues from DB rows
+    chosen_rows = select_issues_for_store(sName, sNum_int)
+    if not chosen_rows:
         return
 
-    issue_id = chosen_row.get("id")
-    if issue_id is None:
-        print(c.red("Selected issue has no 'id'; cannot delete."))
+    if any(row.get("id") is None for row in chosen_rows):
+        print(c.red("A selected issue has no 'id'; cannot delete."))
         return
 
-    issue_name = chosen_row.get("issue_name") or "Unnamed Issue"
-    status = chosen_row.get("status") or "Unresolved"
-
-    print(f"\nYou are about to DELETE this issue:")
+    label = "this issue" if len(chosen_rows) == 1 else f"these {len(chosen_rows)} issues"
+    print(f"\nYou are about to DELETE {label}:")
     print(f"  Store: {sName} ({sNum_int})")
-    print(f"  Issue: {issue_name} [{status}]")
+    for row in chosen_rows:
+        issue_name = row.get("issue_name") or "Unnamed Issue"
+        status = row.get("status") or "Unresolved"
+        print(f"  Issue: {issue_name} [{status}]")
     confirm = input("\nAre you sure? This cannot be undone. (Y/N): ").strip().lower()
 
     if confirm != "y":
         print(c.yellow("Delete cancelled."))
         return
 
-    print("\n" + c.yellow("Deleting issue on server..."))
-    if apiDelete(issue_id):
-        print(c.green("Issue successfully deleted from the database."))
+    print("\n" + c.yellow("Deleting on server..."))
+    results = apiDeleteMany([row["id"] for row in chosen_rows])
+    if results is None:
+        print(c.red("Issues could not be deleted."))
     else:
-        print(c.red("Issue could not be deleted."))
+        deleted = sum(1 for r in results if r.get("status") == "deleted")
+        print(c.green(f"{deleted} issue(s) deleted from the database."))
+        if deleted < len(results):
+            print(c.yellow(f"{len(results) - deleted} issue(s) were already gone."))
 
     pause()
 
@@ -963,13 +1060,9 @@ def issueRemove():
 
 def issuePrintAll():
     """
-    Export all known issues (from DB) grouped by store into a text file.
+    Export all known issues grouped by store into a text file.
+    The report is built server-side and streamed straight to disk.
     """
-    stores = get_stores()
-    if stores is None:
-        print(c.red("Could not connect to server!"))
-        return
-
     print("\nCreating dump file...")
 
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -979,47 +1072,24 @@ def issuePrintAll():
 
     txt_file_path = os.path.join(reports_dir, "KnownIssuesReport.txt")
 
-    with open(txt_file_path, "w") as txt_file:
-        txt_file.write("*****Known Issues Report*****\n\n")
-        has_issues = False
-
-        for sName, details in stores.items():
-            sNum = details.get("Store Number")
-            if sNum is None:
-                continue
-
-            issues = getIssuesForStore(store_number=sNum)
-            if not issues:
-                continue
-
-            has_issues = True
-
-            txt_file.write(f"Store: {sName}\n")
-            txt_file.write(f"Store Number: {sNum}\n")
-            txt_file.write("Known Issues:\n")
-
-            for idx, issue in enumerate(issues, start=1):
-                issue_name = issue.get("issue_name", "Unnamed Issue")
-                status = issue.get("status", "Unresolved")
-                priority = issue.get("priority", "N/A")
-                computer = issue.get("computer_number", "N/A")
-                dev_type = issue.get("device_type", "N/A")
-                category = issue.get("category", "N/A")
-                desc = issue.get("description", "N/A")
-                res = issue.get("resolution", "No Resolution Provided")
-
-                txt_file.write(f"  {idx}. {issue_name}\n")
-                txt_file.write(f"     Status: {status}\n")
-                txt_file.write(f"     Priority: {priority}\n")
-                txt_file.write(f"     Computer: {computer}\n")
-                txt_file.write(f"     Device: {dev_type}\n")
-                txt_file.write(f"     Category: {category}\n")
-                txt_file.write(f"     Description: {desc}\n")
-                txt_file.write(f"     Resolution: {res}\n")
-                txt_file.write("-" * 40 + "\n\n")
-
-        if not has_issues:
-            txt_file.write("No known issues reported for any stores at this time.\n")
+    try:
+        with requests.get(
+            f"{API_BASE}/reports/known-issues",
+            params={"format": "txt"},
+            stream=True,
+            timeout=60,
+        ) as resp:
+            if resp.status_code != 200:
+                print(c.red(f"Could not build report (HTTP {resp.status_code})."))
+                pause()
+                return
+            with open(txt_file_path, "wb") as txt_file:
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    txt_file.write(chunk)
+    except requests.RequestException:
+        print(c.red("Could not connect to server!"))
+        pause()
+        return
 
     print("\n" + c.green(f"Known issues have been exported to {txt_file_path}."))
 
@@ -1038,17 +1108,13 @@ def show_store_info(name, details):
     print(f"State: {details.get('State', 'Unknown')}")
     print(f"Type: {details.get('Type', 'Unknown')}")
     print(f"Number of Computers: {details.get('Computers', 'Unknown')}")
-    print(f"Known Issues: {len(details.get('Known Issues', []))} total")
+    counts = details.get("Issue Counts") or {}
+    print(f"Known Issues: {counts.get('open', 0)} open, {counts.get('total', 0)} total")
 
     print(c.green("----------------------------"))
     print()
 
 def storeLookup():
-    stores = get_stores()
-    if stores is None:
-        print(c.red("Could not connect to server!"))
-        return
-
     print("\n" + c.yellow("Store Lookup"))
     print(c.yellow("You can enter either a store NAME or a store NUMBER."))
 
@@ -1058,27 +1124,28 @@ def storeLookup():
         print(c.red("Lookup cancelled."))
         return
 
+    found = apiLookupStores(query)
+    if found is None:
+        print(c.red("Could not connect to server!"))
+        return
+
     # --- TRY MATCHING AS STORE NUMBER ---
     if query.isdigit():
-        for name, details in stores.items():
+        for details in found:
             if str(details.get("Store Number", "")).strip() == query:
-                return show_store_info(name, details)
+                return show_store_info(details.get("Store Name"), details)
         print(c.red(f"No store found with number {query}."))
         return
 
     # --- TRY MATCHING AS STORE NAME ---
     # Case-insensitive match
     lowered_query = query.lower()
-    for name, details in stores.items():
-        if name.lower() == lowered_query:
-            return show_store_info(name, details)
-
-    # --- Partial match fallback (optional but very useful) ---
-    partial_matches = [
-        (name, det)
-        for name, det in stores.items()
-        if lowered_query in name.lower()
-    ]
+    for details in found:
+        if (details.get("Store Name") or "").lower() == lowered_query:
+            return show_store_info(details.get("Store Name"), details)
+
+    # --- Ranked partial / fuzzy matches from the server ---
+    partial_matches = [(det.get("Store Name"), det) for det in found]
 
     if len(partial_matches) == 1:
         name, details = partial_matches[0]
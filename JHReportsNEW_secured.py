@@ -1,4 +1,7 @@
 import os
+import time
+import uuid
+import random
 import requests
 import tkinter as tk
 from tkinter import messagebox, scrolledtext, simpledialog, filedialog
@@ -67,6 +70,47 @@ def _dbg_response(resp, label="HTTP"):
         _dbg(f"TEXT: {text[:2000]}")  # cap so it doesn't explode your terminal
     _dbg("------------\n")
 
+# Mutating calls are sent with an Idempotency-Key so they can be retried
+# safely over flaky store links; the server replays the first response.
+RETRY_ATTEMPTS = 4
+RETRY_BACKOFF = 0.5   # seconds, doubled on every retry
+RETRY_STATUSES = {502, 503, 504}
+
+# Username of whoever is logged in; sent with writes for the audit trail
+CURRENT_USER = None
+
+def send_with_retry(method: str, url: str, **kwargs):
+    """
+    requests.request() with an Idempotency-Key and exponential backoff.
+
+    Retries on connection errors, timeouts and 502/503/504. The same key is
+    reused for every attempt, so a request that reached the server before
+    the link dropped is not applied twice: the server replays the response
+    it stored for that attempt (after waiting for it if still running).
+    Raises requests.RequestException if every attempt fails.
+    """
+    headers = dict(kwargs.pop("headers", None) or {})
+    headers.setdefault("Idempotency-Key", uuid.uuid4().hex)
+    if CURRENT_USER:
+        # Recorded in the server's issue change log
+        headers.setdefault("X-User", CURRENT_USER)
+
+    for attempt in range(RETRY_ATTEMPTS):
+        last_try = attempt == RETRY_ATTEMPTS - 1
+        try:
+            resp = requests.request(method, url, headers=headers, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_try:
+                raise
+            _dbg(f"{method} {url} failed ({e}); retrying")
+        else:
+            if resp.status_code not in RETRY_STATUSES or last_try:
+                return resp
+            _dbg(f"{method} {url} returned {resp.status_code}; retrying")
+
+        time.sleep(RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, RETRY_BACKOFF))
+
+
 def api_admin_verify(email: str, password: str, pin: str):
     """
     POST /admin/verify
@@ -146,6 +190,34 @@ def api_get_all_issues():
         return False, [], "Server returned unexpected data format."
     return True, rows, None
 
+def api_download_known_issues_report(path: str, fmt: str = "txt"):
+    """
+    Stream GET /reports/known-issues?format=txt|csv|md straight into `path`.
+
+    Returns (ok: bool, error: str | None)
+    """
+    try:
+        with requests.get(
+            f"{API_BASE}/reports/known-issues",
+            params={"format": fmt},
+            stream=True,
+            timeout=60,
+        ) as resp:
+            if resp.status_code != 200:
+                try:
+                    msg = resp.json().get("error") or resp.text
+                except Exception:
+                    msg = resp.text
+                return False, f"Server returned {resp.status_code}: {msg}"
+            with open(path, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+    except requests.RequestException as e:
+        return False, f"Error contacting server: {e}"
+    except OSError as e:
+        return False, f"Could not save report: {e}"
+    return True, None
+
 def api_get_devices_by_store(store_number: int):
     """
     Call GET /devices/by-store
@@ -182,6 +254,99 @@ def api_get_devices_by_store(store_number: int):
 
 
 
+def api_lookup_stores(query: str, limit: int = 10):
+    """
+    Call GET /stores/lookup (ranked match on number/ZIP prefix, name, city).
+
+    Returns (ok: bool, matches: list[dict], error: str | None)
+    Each match is a legacy store dict plus a "Score"; best match first.
+    """
+    try:
+        resp = requests.get(
+            f"{API_BASE}/stores/lookup",
+            params={"q": query, "limit": str(limit)},
+            timeout=15,
+        )
+    except requests.RequestException as e:
+        return False, [], f"Error contacting server: {e}"
+
+    if resp.status_code != 200:
+        try:
+            data = resp.json()
+            msg = data.get("error") or resp.text
+        except ValueError:
+            msg = resp.text
+        return False, [], f"Store lookup failed: {msg}"
+
+    try:
+        data = resp.json()
+    except ValueError:
+        return False, [], "Server returned invalid JSON for /stores/lookup"
+
+    return True, data.get("matches", []), None
+
+
+def api_find_store_by_number(store_number) -> tuple[dict | None, str | None]:
+    """Exact store-number lookup. Returns (store dict | None, error | None)."""
+    ok, matches, error = api_lookup_stores(str(store_number).strip(), limit=1)
+    if not ok:
+        return None, error
+    for details in matches:
+        if str(details.get("Store Number")) == str(store_number).strip():
+            return details, None
+    return None, None
+
+
+# store_number -> (etag, dashboard dict); lets repeat opens come back as 304
+dashboard_cache = {}
+
+def api_get_store_dashboard(store_number: int):
+    """
+    Call GET /stores/<number>/dashboard (store + devices + open issues).
+
+    Returns (ok: bool, dashboard: dict | None, error: str | None)
+    A 404 comes back as ok=True with dashboard=None.
+    """
+    headers = {}
+    cached = dashboard_cache.get(store_number)
+    if cached:
+        headers["If-None-Match"] = f'"{cached[0]}"'
+
+    try:
+        resp = requests.get(
+            f"{API_BASE}/stores/{store_number}/dashboard",
+            headers=headers,
+            timeout=30,
+        )
+    except requests.RequestException as e:
+        return False, None, f"Error contacting server: {e}"
+
+    if resp.status_code == 304 and cached:
+        return True, cached[1], None
+
+    if resp.status_code == 404:
+        return True, None, None
+
+    if resp.status_code != 200:
+        try:
+            data = resp.json()
+            msg = data.get("error") or resp.text
+        except Exception:
+            msg = resp.text
+        return False, None, f"Server error: {msg}"
+
+    try:
+        data = resp.json()
+    except ValueError:
+        return False, None, "Server returned invalid JSON for the store dashboard"
+
+    etag = (resp.headers.get("ETag") or "").strip('"')
+    if etag:
+        dashboard_cache[store_number] = (etag, data)
+
+    return True, data, None
+
+
 def api_admin_change_password(
     admin_email: str,
     admin_password: str,
@@ -495,7 +660,7 @@ def api_add_issue(store_name: str, issue: dict):
 
     resp = None
     try:
-        resp = requests.post(f"{API_BASE}/issues", json=payload, timeout=60)
+        resp = send_with_retry("POST", f"{API_BASE}/issues", json=payload, timeout=60)
         resp.raise_for_status()
         return True, "Issue added and synced to the server."
 
@@ -515,14 +680,25 @@ def api_add_issue(store_name: str, issue: dict):
         return False, f"Error sending issue to server: {e}"
 
 
-def api_search_issues(store_number: int | None = None, name: str | None = None):
+# Facets the edit screen can narrow by: (facet, title, issue row key)
+SEARCH_FACET_FIELDS = [
+    ("status", "Status", "status_code"),
+    ("priority", "Priority", "priority_code"),
+    ("category", "Category", "category"),
+]
+
+
+def api_search_issues(store_number: int | None = None, name: str | None = None,
+                      facets: list[str] | None = None):
     """
     Call GET /issues/search on the API server.
 
     - If store_number is provided, search by that store.
     - If name is provided, search issue_name with a partial, case-insensitive match.
+    - If facets are given, the server also counts the matches per value of
+      each facet (same request).
 
-    Returns (ok: bool, rows: list[dict], error: str | None)
+    Returns (ok: bool, rows: list[dict], facets: dict, error: str | None)
     """
     params: dict[str, str] = {}
     if store_number is not None:
@@ -531,12 +707,14 @@ def api_search_issues(store_number: int | None = None, name: str | None = None):
         params["name"] = name
 
     if not params:
-        return False, [], "No search parameters provided."
+        return False, [], {}, "No search parameters provided."
+    if facets:
+        params["facets"] = ",".join(facets)
 
     try:
         resp = requests.get(f"{API_BASE}/issues/search", params=params, timeout=30)
     except requests.RequestException as e:
-        return False, [], f"Error contacting server: {e}"
+        return False, [], {}, f"Error contacting server: {e}"
 
     if resp.status_code != 200:
         try:
@@ -544,15 +722,49 @@ def api_search_issues(store_number: int | None = None, name: str | None = None):
             msg = data.get("error") or resp.text
         except ValueError:
             msg = resp.text
-        return False, [], f"Search failed: {msg}"
+        return False, [], {}, f"Search failed: {msg}"
 
     try:
-        rows = resp.json()
+        data = resp.json()
     except ValueError:
-        return False, [], "Server returned invalid JSON for /issues/search"
+        return False, [], {}, "Server returned invalid JSON for /issues/search"
 
-    if not isinstance(rows, list):
-        return False, [], "Search response was not a list."
+    # With facets the server wraps the rows: {"issues": [...], "facets": {...}}
+    counts = {}
+    if isinstance(data, dict):
+        counts = data.get("facets") or {}
+        data = data.get("issues")
+
+    if not isinstance(data, list):
+        return False, [], {}, "Search response was not a list."
+
+    return True, data, counts, None
+
+
+def api_batch_get_issues(issue_ids: list[int]):
+    """
+    Call POST /issues/batch-get to fetch a known set of issues in one request.
+
+    Returns (ok: bool, rows: list[dict], error: str | None); rows follow the
+    order of issue_ids and skip ids that no longer exist.
+    """
+    try:
+        resp = requests.post(f"{API_BASE}/issues/batch-get", json={"ids": issue_ids}, timeout=20)
+    except requests.RequestException as e:
+        return False, [], f"Error contacting server: {e}"
+
+    if resp.status_code != 200:
+        try:
+            data = resp.json()
+            msg = data.get("error") or resp.text
+        except ValueError:
+            msg = resp.text
+        return False, [], f"Fetch failed: {msg}"
+
+    try:
+        rows = resp.json().get("issues", [])
+    except (ValueError, AttributeError):
+        return False, [], "Server returned invalid JSON for /issues/batch-get"
 
     return True, rows, None
 
@@ -575,7 +787,7 @@ def api_update_issue(issue_id: int, updated_issue: dict):
     }
 
     try:
-        resp = requests.post(f"{API_BASE}/issues/update", json=payload, timeout=30)
+        resp = send_with_retry("POST", f"{API_BASE}/issues/update", json=payload, timeout=30)
     except requests.RequestException as e:
         return False, f"Error contacting server: {e}"
 
@@ -589,6 +801,67 @@ def api_update_issue(issue_id: int, updated_issue: dict):
             msg = resp.text
         return False, f"Update failed: {msg}"
 
+def api_patch_issue(issue_id: int, changes: dict, expected_version: int | None = None):
+    """
+    Call PATCH /issues/<id> with only the fields that changed.
+
+    Returns (success: bool, message: str, issue: dict | None, status: int | None)
+    On a version conflict (status 409) the server's current row is returned as `issue`.
+    """
+    payload = {"changes": changes}
+    if expected_version is not None:
+        payload["expected_version"] = expected_version
+
+    try:
+        resp = send_with_retry("PATCH", f"{API_BASE}/issues/{issue_id}", json=payload, timeout=30)
+    except requests.RequestException as e:
+        return False, f"Error contacting server: {e}", None, None
+
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {}
+
+    if resp.status_code == 200:
+        return True, "Issue updated successfully.", data.get("issue"), 200
+
+    msg = data.get("error") or resp.text
+    return False, f"Update failed: {msg}", data.get("issue"), resp.status_code
+
+def issue_edits(loaded: dict, edited: dict, latest: dict | None = None) -> dict:
+    """
+    Fields the user changed in the form since it was filled from `loaded`.
+
+    After a 409, `latest` is the other user's saved version: fields only they
+    changed are left out (the form still shows the old values), and edits that
+    already match their version are dropped, so the save applies this user's
+    edits on top of theirs instead of reverting them.
+    """
+    changes = {key: value for key, value in edited.items() if loaded.get(key) != value}
+    if latest is not None:
+        changes = {key: value for key, value in changes.items() if latest.get(key) != value}
+    return changes
+
+# Server stores priority as priority_code (1-3); older rows may only have text
+PRIORITY_LABELS = {1: "Critical", 2: "Functional", 3: "Cosmetic"}
+
+def priority_code(row: dict) -> int | None:
+    """Priority code for an issue row, falling back to the legacy text column."""
+    code = row.get("priority_code")
+    if code in PRIORITY_LABELS:
+        return code
+    raw = str(row.get("priority") or "").strip()
+    if raw[:1].isdigit() and int(raw[:1]) in PRIORITY_LABELS:
+        return int(raw[:1])
+    return None
+
+def pretty_priority(row: dict) -> str:
+    """Human label for an issue's priority ("Critical", "Functional", ...)."""
+    code = priority_code(row)
+    if code is not None:
+        return PRIORITY_LABELS[code]
+    return str(row.get("priority") or "").strip() or "Unknown"
+
 def api_get_stores():
     """
     Fetch store metadata from /stores.
@@ -1234,7 +1507,8 @@ class TechInfoByStoreFrame(GradientFrame):
         super().__init__(parent)
         self.controller = controller
 
-        self.current_devices = []
+        self.current_devices = {}  # device_category -> list of device rows
+        self.current_open_issues = []
 
         self.current_store_name = None
         self.current_store_details = None
@@ -1360,41 +1634,37 @@ class TechInfoByStoreFrame(GradientFrame):
             messagebox.showwarning("Invalid Input", "Store number must be numeric.")
             return
 
-        stores, error = api_load_stores()
-        if stores is None:
-            self.status_label.config(text=error or "Failed to load stores.")
-            messagebox.showerror("Error", error or "Failed to load stores from server.")
-            return
-
         # Reset state each load attempt
         self.current_store_name = None
         self.current_store_details = None
-        self.current_devices = []
-
-        # Find by store number
-        for name, details in stores.items():
-            if str(details.get("Store Number")) == raw:
-                self.current_store_name = name
-                self.current_store_details = details
-                self.status_label.config(text=f"Loaded store #{raw} – {name}")
-                self._set_buttons_enabled(True)
-
-                # ✅ Load devices for this store BEFORE rendering
-                ok, devices, err = api_get_devices_by_store(int(raw))
-                if not ok:
-                    self._set_text(self._preface() + f"Error loading devices: {err}\n")
-                    return
+        self.current_devices = {}
+        self.current_open_issues = []
 
-                self.current_devices = devices or []
+        # One request: store metadata, devices and open issues
+        ok, dashboard, error = api_get_store_dashboard(int(raw))
+        if not ok:
+            self.status_label.config(text=error or "Failed to load store.")
+            messagebox.showerror("Error", error or "Failed to load store from server.")
+            return
 
-                # Auto-render "All info"
-                self.render_section("all")
-                return
+        if dashboard is None:
+            self._set_buttons_enabled(False)
+            self._set_text(f"No store found with number {raw}.\n")
+            self.status_label.config(text=f"No store found with number {raw}.")
+            return
 
-        # Not found
-        self._set_buttons_enabled(False)
-        self._set_text(f"No store found with number {raw}.\n")
-        self.status_label.config(text=f"No store found with number {raw}.")
+        details = dashboard.get("store") or {}
+        name = details.get("Store Name") or "Unknown Store"
+        self.current_store_name = name
+        self.current_store_details = details
+        self.current_devices = dashboard.get("devices") or {}
+        self.current_open_issues = dashboard.get("open_issues") or []
+
+        self.status_label.config(text=f"Loaded store #{raw} – {name}")
+        self._set_buttons_enabled(True)
+
+        # Auto-render "All info"
+        self.render_section("all")
 
     # ----------------------------
     # Formatting + extraction helpers
@@ -1405,7 +1675,11 @@ class TechInfoByStoreFrame(GradientFrame):
         s_num = d.get("Store Number", "N/A")
         s_name = self.current_store_name or "Unknown Store"
         s_type = d.get("Type", "Unknown")
-        header = f"{s_num} - {s_name}\n{s_type}\n" + ("=" * 23) + "\n\n"
+        header = f"{s_num} - {s_name}\n{s_type}\n"
+        header += f"Open issues: {len(self.current_open_issues)}\n"
+        for issue in self.current_open_issues:
+            header += f"  - {issue.get('issue_name') or 'Unnamed Issue'} [{pretty_priority(issue)}]\n"
+        header += ("=" * 23) + "\n\n"
         return header
 
     def _get_inventory_root(self) -> dict:
@@ -1430,41 +1704,10 @@ class TechInfoByStoreFrame(GradientFrame):
     def _get_device_list(self, section_key: str) -> list[dict]:
         """
         section_key: computers / phones / printers / internet / other
-        devices come from store_devices table via /devices/by-store
+        The server classifies devices (store_devices.device_category) and the
+        dashboard returns them already grouped, so this is a plain lookup.
         """
-        devices = self.current_devices or []
-
-        # Normalize your naming
-        key = section_key.lower()
-
-        def is_match(d):
-            dt = (d.get("device_type") or "").strip().lower()
-
-            # Map your categories to whatever you used in CSV:
-            # (you can tweak these 5 lines once we see actual device_type values)
-            if key == "computers":
-                return dt in ("computer", "pc", "tp", "terminal") or dt.startswith("tp")
-            if key == "phones":
-                return (d.get("device_number") or "").strip().upper().startswith("P")
-            if key == "printers":
-                return dt in ("printer", "scanner", "printer/scanner", "mfp")
-            if key == "internet":
-                return dt in ("internet", "network", "cradlepoint", "router", "modem")
-            if key == "other":
-                return True  # catch-all
-            return False
-
-        # For "other", we’ll return only ones NOT caught by earlier categories
-        if key == "other":
-            cats = {"computers", "phones", "printers", "internet"}
-            used = set()
-            for c in cats:
-                for d in self._get_device_list(c):
-                    used.add(d.get("device_uid"))
-            return [d for d in devices if d.get("device_uid") not in used]
-
-        return [d for d in devices if is_match(d)]
-
+        return list(self.current_devices.get(section_key.lower(), []))
 
     def _extract_flat_tp_or_p(self, section_key: str) -> list[dict]:
         """
@@ -1799,6 +2042,25 @@ class AdminToolsFrame(GradientFrame):
             messagebox.showinfo("No Report", "There is no report to print to a file.")
             return
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if self.current_report_prefix == "issues":
+            # The full Known Issues Report is built server-side in one request
+            path = filedialog.asksaveasfilename(
+                defaultextension=".txt",
+                initialfile=f"KnownIssuesReport_{ts}.txt",
+                filetypes=[("Text files", "*.txt"), ("CSV files", "*.csv"),
+                           ("Markdown files", "*.md")],
+            )
+            if not path:
+                return
+            fmt = os.path.splitext(path)[1].lstrip(".").lower()
+            ok, error = api_download_known_issues_report(path, fmt if fmt in ("csv", "md") else "txt")
+            if ok:
+                messagebox.showinfo("Saved", f"Report saved to:\n{path}")
+            else:
+                messagebox.showerror("Error", error)
+            return
+
         suggested = f"{self.current_report_prefix}_{ts}.txt"
         path = filedialog.asksaveasfilename(
             defaultextension=".txt",
@@ -2383,61 +2645,34 @@ class StoreSearchFrame(GradientFrame):
             )
             return
 
-        stores, error = api_load_stores()
-        if stores is None:
-            self.status_label.config(text=error or "Failed to load stores.")
+        ok, matches, error = api_lookup_stores(query, limit=25)
+        if not ok:
+            self.status_label.config(text=error or "Failed to look up stores.")
             messagebox.showerror(
                 "Error",
-                error or "Failed to load stores from server.",
+                error or "Failed to look up stores on the server.",
             )
             return
 
         self.text.configure(state="normal")
         self.text.delete("1.0", "end")
 
-        # Try as number first
-        if query.isdigit():
-            for name, details in stores.items():
-                if str(details.get("Store Number")) == query:
-                    self.render_store_info(name, details)
-                    self.status_label.config(
-                        text=f"Found store #{query} – {name}"
-                    )
-                    self.text.configure(state="disabled")
-                    return
-
-            self.status_label.config(text=f"No store found with number {query}.")
-            self.text.insert("end", f"No store found with number {query}.\n")
-            self.text.configure(state="disabled")
-            return
-
-        # Otherwise treat as name (exact match, then partial)
-        lowered = query.lower()
-
-        # Exact match
-        for name, details in stores.items():
-            if name.lower() == lowered:
-                self.render_store_info(name, details)
-                self.status_label.config(text=f"Found store '{name}'.")
-                self.text.configure(state="disabled")
-                return
-
-        # Partial matches
-        matches = [
-            (name, details)
-            for name, details in stores.items()
-            if lowered in name.lower()
-        ]
-
         if not matches:
             self.status_label.config(text="No matching stores found.")
             self.text.insert("end", "No matching stores found.\n")
             self.text.configure(state="disabled")
             return
 
-        if len(matches) == 1:
-            name, details = matches[0]
-            self.render_store_info(name, details)
+        # Matches come back ranked; an exact number/name hit or a lone match wins
+        best = matches[0]
+        exact = (
+            str(best.get("Store Number")) == query
+            or (best.get("Store Name") or "").lower() == query.lower()
+        )
+
+        if exact or len(matches) == 1:
+            name = best.get("Store Name", "Unknown")
+            self.render_store_info(name, best)
             self.status_label.config(text=f"Found store '{name}'.")
         else:
             self.status_label.config(
@@ -2447,7 +2682,8 @@ class StoreSearchFrame(GradientFrame):
                 "end",
                 "Multiple stores matched your search:\n\n",
             )
-            for name, details in matches:
+            for details in matches:
+                name = details.get("Store Name", "Unknown")
                 num = details.get("Store Number", "N/A")
                 state = details.get("State", "Unknown")
                 type_ = details.get("Type", "Unknown")
@@ -2471,8 +2707,13 @@ class StoreSearchFrame(GradientFrame):
         self.text.insert("end", f"Type: {details.get('Type', 'Unknown')}\n")
         self.text.insert("end", f"Kiosk Type: {details.get('Kiosk Type', 'Unknown')}\n")
         self.text.insert("end", f"Number of Computers: {details.get('Computers', 'Unknown')}\n")
-        known_issues = len(details.get("Known Issues", []))
-        self.text.insert("end", f"Known Issues: {known_issues} total\n")
+        counts = details.get("Issue Counts") or {}
+        self.text.insert(
+            "end",
+            f"Known Issues: {counts.get('open', 0)} open, {counts.get('total', 0)} total\n",
+        )
+        for priority, n in (counts.get("open_by_priority") or {}).items():
+            self.text.insert("end", f"   {priority}: {n} open\n")
         self.text.insert("end", "----------------------------\n")
 
 class ChangePasswordFrame(GradientFrame):
@@ -2746,7 +2987,6 @@ class ReportIssueFrame(GradientFrame):
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
-        self.stores = None  # will be loaded from API
 
         title = GradientFrame.label(
             self.inner_frame, "Report New Issue", font=("Segoe UI", 20, "bold")
@@ -2873,26 +3113,16 @@ class ReportIssueFrame(GradientFrame):
         and clear status text.
         """
         self.status_label.config(text="")
-        # Optionally load stores here so first submit isn't slow
-        if self.stores is None:
-            stores, error = api_load_stores()
-            if stores is None:
-                self.status_label.config(text=error or "Could not load stores list.")
-            else:
-                self.stores = stores
 
     def resolve_store_name(self, store_number: str):
         """
-        Find store_name in the loaded stores dict from a store number.
-        Returns store_name or None.
+        Look up the store name for a store number on the server.
+        Returns (store_name | None, error | None).
         """
-        if not self.stores:
-            return None
-
-        for name, details in self.stores.items():
-            if str(details.get("Store Number", "")).strip() == str(store_number).strip():
-                return name
-        return None
+        details, error = api_find_store_by_number(store_number)
+        if details is None:
+            return None, error
+        return details.get("Store Name"), None
 
     def handle_submit(self):
         sNum = self.entry_store_num.get().strip()
@@ -2927,16 +3157,11 @@ class ReportIssueFrame(GradientFrame):
             messagebox.showerror("Validation Error", "Please enter a description.")
             return
 
-        # Load stores if not already loaded
-        if self.stores is None:
-            stores, error = api_load_stores()
-            if stores is None:
-                messagebox.showerror("Error", error or "Could not load stores list.")
-                return
-            self.stores = stores
-
         # Resolve store_name from store number
-        store_name = self.resolve_store_name(sNum)
+        store_name, error = self.resolve_store_name(sNum)
+        if error:
+            messagebox.showerror("Error", error)
+            return
         if not store_name:
             messagebox.showerror("Validation Error", "Store number not found in store list.")
             return
@@ -3038,7 +3263,12 @@ class EditIssueFrame(GradientFrame):
 
         self.matches = []      # list of row dicts from the DB
         self.match_map = {}    # display_text -> row dict
+        self.facets = {}       # facet -> [{"value", "count", ...}] for the last search
+        self.facet_vars = {}   # facet -> (StringVar, "any" label, {choice: value}, row key)
         self.current_issue_id = None
+        self.current_version = None
+        self.loaded_issue = {}  # legacy-keyed values as loaded, for diffing on save
+        self.latest_row = None  # someone else's newer row after a 409, not yet shown
 
 
         # -------------------------
@@ -3198,7 +3428,12 @@ class EditIssueFrame(GradientFrame):
         self.search_entry.delete(0, "end")
         self.matches = []
         self.match_map = {}
+        self.facets = {}
+        self.facet_vars = {}
         self.current_issue_id = None
+        self.current_version = None
+        self.loaded_issue = {}
+        self.latest_row = None
 
         self.selector_frame.pack_forget()
         self.form_frame.pack_forget()
@@ -3221,10 +3456,15 @@ class EditIssueFrame(GradientFrame):
 
         self.match_map.clear()
 
+        facet_names = [facet for facet, _, _ in SEARCH_FACET_FIELDS]
         if query.isdigit():
-            ok, rows, error = api_search_issues(store_number=int(query), name=None)
+            ok, rows, facets, error = api_search_issues(
+                store_number=int(query), name=None, facets=facet_names
+            )
         else:
-            ok, rows, error = api_search_issues(store_number=None, name=query)
+            ok, rows, facets, error = api_search_issues(
+                store_number=None, name=query, facets=facet_names
+            )
 
         if not ok:
             self.selector_frame.pack_forget()
@@ -3244,6 +3484,7 @@ class EditIssueFrame(GradientFrame):
             name = row.get("issue_name") or row.get("issue") or "Unnamed Issue"
             display = f"Store {store_num} – {name}"
             self.match_map[display] = row
+        self.facets = facets
 
         self.build_selector_ui()
         self.status_label.config(text=f"Found {len(rows)} matching issue(s).")
@@ -3252,6 +3493,8 @@ class EditIssueFrame(GradientFrame):
         for child in self.selector_frame.winfo_children():
             child.destroy()
 
+        self.build_facet_ui()
+
         GradientFrame.label(
             self.selector_frame,
             "Select an issue to edit:",
@@ -3273,6 +3516,61 @@ class EditIssueFrame(GradientFrame):
 
         self.selector_frame.pack(pady=10, fill="x")
 
+    def build_facet_ui(self):
+        """
+        One dropdown per facet the server counted, e.g. "Unresolved (12)".
+        Picking a value narrows the issue list locally - no extra request.
+        """
+        self.facet_vars = {}
+        available = [f for f in SEARCH_FACET_FIELDS if len(self.facets.get(f[0]) or []) > 1]
+        if not available:
+            return
+
+        GradientFrame.label(
+            self.selector_frame,
+            "Narrow results:",
+            font=("Segoe UI", 10, "bold")
+        ).pack(anchor="w", padx=25, pady=(5, 2))
+
+        facet_frame = GradientFrame.subframe(self.selector_frame)
+        facet_frame.pack(anchor="w", padx=25, pady=3)
+
+        for column, (facet, title, key) in enumerate(available):
+            any_label = f"Any {title.lower()}"
+            choices = {}
+            for entry in self.facets[facet]:
+                shown = entry["value"] if entry["value"] not in (None, "") else "(none)"
+                choices[f"{shown} ({entry['count']})"] = entry.get("code", entry["value"])
+
+            var = tk.StringVar(value=any_label)
+            tk.OptionMenu(
+                facet_frame, var, any_label, *choices,
+                command=lambda _choice: self.apply_facet_filters(),
+            ).grid(row=0, column=column, padx=(0, 10), sticky="w")
+            self.facet_vars[facet] = (var, any_label, choices, key)
+
+    def apply_facet_filters(self):
+        """Refill the issue dropdown with the matches that fit every chosen facet."""
+        wanted = {}
+        for var, any_label, choices, key in self.facet_vars.values():
+            if var.get() != any_label:
+                wanted[key] = choices[var.get()]
+
+        options = sorted(
+            display for display, row in self.match_map.items()
+            if all(row.get(key) == value for key, value in wanted.items())
+        )
+
+        menu = self.issue_menu["menu"]
+        menu.delete(0, "end")
+        for option in options:
+            menu.add_command(label=option, command=tk._setit(self.issue_var, option))
+        self.issue_var.set(options[0] if options else "")
+
+        self.status_label.config(
+            text=f"Showing {len(options)} of {len(self.match_map)} matching issue(s)."
+        )
+
     # ---------- Load + show issue ----------
 
     def load_selected_issue(self):
@@ -3282,7 +3580,24 @@ class EditIssueFrame(GradientFrame):
             return
 
         row = self.match_map[key]
+
+        # Search results may be minutes old; start editing from the current row
+        if row.get("id") is not None:
+            ok, rows, _ = api_batch_get_issues([row["id"]])
+            if ok and not rows:
+                messagebox.showerror("Error", "This issue has been deleted.")
+                return
+            if ok:
+                row = self.match_map[key] = rows[0]
+
+        self.show_issue(row)
+
+    def show_issue(self, row: dict):
+        """Fill the form from an issue row and remember its version for saving."""
         self.current_issue_id = row.get("id")
+        self.current_version = row.get("row_version")
+        self.loaded_issue = self._row_to_issue(row)
+        self.latest_row = None
 
         self.entry_store_num.delete(0, "end")
         self.entry_store_num.insert(0, str(row.get("store_number") or ""))
@@ -3296,15 +3611,8 @@ class EditIssueFrame(GradientFrame):
         self.entry_category.delete(0, "end")
         self.entry_category.insert(0, row.get("category") or "")
 
-        pr = str(row.get("priority") or "1")
-        if pr == "1":
-            self.priority_var.set("1 - Critical")
-        elif pr == "2":
-            self.priority_var.set("2 - Functional")
-        elif pr == "3":
-            self.priority_var.set("3 - Cosmetic")
-        else:
-            self.priority_var.set("1 - Critical")
+        pr = priority_code(row) or 1
+        self.priority_var.set(f"{pr} - {PRIORITY_LABELS[pr]}")
 
         repro = (row.get("replicable") or "").strip().lower()
         self.replicable_var.set("Yes" if repro in ("yes", "y", "true", "1") else "No")
@@ -3333,6 +3641,25 @@ class EditIssueFrame(GradientFrame):
         self.form_frame.pack(pady=10, fill="both", expand=True)
         self.canvas.after(10, lambda: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
 
+    @staticmethod
+    def _row_to_issue(row: dict) -> dict:
+        """Map a DB row to the same legacy keys handle_save sends."""
+        return {
+            "Name": row.get("issue_name") or "",
+            "Priority": str(row.get("priority") or ""),
+            "Store Number": str(row.get("store_number") or ""),
+            "Computer Number": row.get("computer_number") or "",
+            "Device": row.get("device_type") or "",
+            "Category": row.get("category") or "",
+            "Description": row.get("description") or "",
+            "Narrative": row.get("narrative") or "",
+            "Replicable?": row.get("replicable") or "",
+            "Global Issue": bool(row.get("global_issue")),
+            "Global Number": row.get("global_num"),
+            "Status": row.get("status") or "",
+            "Resolution": row.get("resolution") or "",
+        }
+
     # ---------- Saving ----------
 
     def handle_save(self):
@@ -3390,7 +3717,6 @@ class EditIssueFrame(GradientFrame):
 
         updated_issue = {
             "Name": issue_name,
-            "Issue Name": issue_name,
             "Priority": priority,
             "Store Number": sNum,
             "Computer Number": compNum,
@@ -3405,20 +3731,76 @@ class EditIssueFrame(GradientFrame):
             "Resolution": resolution_text,
         }
 
+        # Only send what this user edited since the issue was loaded
+        latest = self._row_to_issue(self.latest_row) if self.latest_row else None
+        changes = issue_edits(self.loaded_issue, updated_issue, latest)
+        if not changes:
+            if self.latest_row:
+                self.show_issue(self.latest_row)
+            self.status_label.config(text="No changes to save.")
+            return
+
         self.status_label.config(text="Saving changes...")
         self.update_idletasks()
 
-        success, msg = api_update_issue(self.current_issue_id, updated_issue)
+        success, msg, row, status = api_patch_issue(
+            self.current_issue_id, changes, expected_version=self.current_version
+        )
+
+        if status == 409:
+            self.handle_conflict(row)
+            return
 
         if success:
+            if row:
+                # Show the merged row, including anyone else's saved changes
+                self.show_issue(row)
             messagebox.showinfo("Saved", "Issue updated successfully.")
             self.status_label.config(text="Issue updated successfully.")
         else:
             messagebox.showerror("Error", msg or "Failed to update issue.")
             self.status_label.config(text=msg or "Failed to update issue.")
 
+    def handle_conflict(self, row: dict | None):
+        """
+        Someone else saved the issue first. Pick up their version so the next
+        save is checked against it instead of failing again with 409.
+
+        `loaded_issue` stays as the values the form was filled from, so the
+        next save still sends only this user's edits.
+        """
+        if row is None:
+            ok, rows, _ = api_batch_get_issues([self.current_issue_id])
+            if ok and not rows:
+                messagebox.showerror("Error", "This issue has been deleted.")
+                self.status_label.config(text="This issue has been deleted.")
+                return
+            row = rows[0] if ok else None
+        if row is None:
+            msg = "This issue was changed by someone else. Reload it and try again."
+            messagebox.showerror("Error", msg)
+            self.status_label.config(text=msg)
+            return
+
+        self.current_version = row.get("row_version")
+        self.latest_row = row
+
+        if messagebox.askyesno(
+            "Issue Changed",
+            "Someone else saved this issue after you loaded it.\n\n"
+            "Load their version? Choose No to keep your edits; saving again "
+            "will apply them on top of their version.",
+        ):
+            self.show_issue(row)
+            self.status_label.config(text="Loaded the latest version of this issue.")
+        else:
+            self.status_label.config(text="Latest version fetched. Save again to apply your edits.")
+
     def clear_form(self):
         self.current_issue_id = None
+        self.current_version = None
+        self.loaded_issue = {}
+        self.latest_row = None
 
         self.entry_store_num.delete(0, "end")
         self.entry_device.delete(0, "end")
@@ -3601,19 +3983,7 @@ class ViewOneStoreFrame(GradientFrame):
             if comp and str(comp).strip().upper() != "N/A":
                 self.text.insert("end", f"Computer: {comp}\n")
 
-            priority_raw = row.get("priority")
-            pretty_priority = "Unknown"
-            if priority_raw is not None:
-                val = str(priority_raw).strip()
-                if val == "1":
-                    pretty_priority = "Critical"
-                elif val == "2":
-                    pretty_priority = "Functional"
-                elif val == "3":
-                    pretty_priority = "Cosmetic"
-                else:
-                    pretty_priority = val
-            self.text.insert("end", f"Priority: {pretty_priority}\n")
+            self.text.insert("end", f"Priority: {pretty_priority(row)}\n")
 
             desc = row.get("description") or ""
             if desc:
@@ -3803,20 +4173,7 @@ class ViewAllIssuesFrame(GradientFrame):
                 if comp and str(comp).strip().upper() != "N/A":
                     self.text.insert("end", f"Computer: {comp}\n")
 
-                # Priority conversion
-                priority_raw = row.get("priority")
-                pretty_priority = "Unknown"
-                if priority_raw is not None:
-                    val = str(priority_raw).strip()
-                    if val == "1":
-                        pretty_priority = "Critical"
-                    elif val == "2":
-                        pretty_priority = "Functional"
-                    elif val == "3":
-                        pretty_priority = "Cosmetic"
-                    else:
-                        pretty_priority = val
-                self.text.insert("end", f"Priority: {pretty_priority}\n")
+                self.text.insert("end", f"Priority: {pretty_priority(row)}\n")
 
                 # Global issue info
                 g_issue = row.get("global_issue")
@@ -4010,6 +4367,8 @@ class JHApp(tk.Tk):
             return
 
     def set_user(self, username: str | None, email: str | None = None, is_admin: bool = False):
+        global CURRENT_USER
+        CURRENT_USER = username
         self.current_username = username
         self.current_email = email
         self.current_is_admin = is_admin  # NEW
@@ -1,16 +1,14 @@
-
-cur.execute(
-    '''
-INSERT INTO store_devices
-        (device_uid, store_number, device_type, device_number, manufacturer, model, device_notes)
-        VALUES %s
-        ON CONFLICT (device_uid) DO UPDATE SET
-            store_number = EXCLUDED.store_number,
-            device_type = EXCLUDED.device_type,
-            device_number = EXCLUDED.device_number,
-            manufacturer = EXCLUDED.manufacturer,
-            model = EXCLUDED.model,
-            device_notes = EXCLUDED.device_notes,
-            updated_at = NOW();
-    '''
-)
\ No newline at end of file
+"""
+Device metadata update.
+
+The old execute_values INSERT ... ON CONFLICT (device_uid) fragment that
+lived here has been replaced by the streaming COPY + merge importer in
+inventory_import.py (also served as POST /devices/bulk-upsert).
+
+    python "Metadata update script.py" inventory.csv --dry-run
+"""
+from inventory_import import main
+
+
+if __name__ == "__main__":
+    main()
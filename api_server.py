@@ -1,9 +1,32 @@
 import os
+import io
+import re
+import csv
 import json
+import atexit
+import select
+import socket
+import time
+import tempfile
+import hashlib
+import functools
+import threading
 import bcrypt
 import psycopg2
-from flask import Flask, jsonify, request
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from flask import Flask, jsonify, request, Response
+from inventory_import import bulk_upsert_devices, InventoryImportError
+from issue_codes import (
+    ISSUE_STATUSES, ISSUE_PRIORITIES, STATUS_ALIASES, PRIORITY_ALIASES,
+    normalize_status, normalize_priority,
+)
+from storage import (
+    open_storage, DatabaseUnavailable, ClientDisconnected, is_transient_db_error,
+    SEARCH_FACETS, SEARCH_DATE_FILTERS, SEARCH_SORT_KEYS,
+    issue_patch_sql,
+)
 from datetime import datetime, timezone, timedelta
 import logging 
 
@@ -23,32 +46,181 @@ STORES_PATH = os.path.join(BASE_DIR, "Stores.json")
 
 # --- Database connection ---
 DATABASE_URL = os.environ.get("DATABASE_URL")
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL")  # optional streaming replica
+SCHEMA_LOCK_ID = 72810029  # pg advisory lock: one worker at a time runs init_db()
+
+# --- Idempotency keys (safe client retries) ---
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_PRUNE_EVERY_SECONDS = 600
+_last_idempotency_prune = 0.0
+
+# --- Hot/cold split: resolved issues move to issues_archive ---
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get("ARCHIVE_INTERVAL_SECONDS", "3600"))  # 0 disables
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_LOCK_ID = 72810028  # pg advisory lock so only one worker archives at a time
+
+# Columns shared by issues and issues_archive (keep in sync with init_db)
+ISSUE_COLUMNS = [
+    "id", "store_name", "store_number", "issue_name", "priority",
+    "computer_number", "device_type", "category", "description",
+    "narrative", "replicable", "status", "resolution", "created_at",
+    "updated_at", "global_issue", "global_num", "row_version",
+    "status_code", "priority_code",
+]
+
+# --- Normalized status / priority ---
+# Labels, aliases and normalize_status/normalize_priority live in
+# issue_codes.py so CLI scripts can use them without importing the server.
+RESOLVED_STATUS_SQL = "status_code IN (3, 4)"
+
+# --- Store lookup ---
+STORE_LOOKUP_DEFAULT_LIMIT = 10
+STORE_LOOKUP_MAX_LIMIT = 50
+TRGM_AVAILABLE = False  # set by init_db() once pg_trgm is confirmed
+
+# --- Device categories ---
+# Default classification rules, seeded into device_category_rules when it is
+# empty: (rule_order, category, field, match_kind, pattern). First match wins;
+# anything unmatched is "other". Patterns are compared lowercased.
+DEFAULT_DEVICE_CATEGORY_RULES = [
+    (10, "computers", "device_type", "exact", "computer"),
+    (11, "computers", "device_type", "exact", "pc"),
+    (12, "computers", "device_type", "exact", "terminal"),
+    (13, "computers", "device_type", "prefix", "tp"),
+    (20, "phones", "device_number", "prefix", "p"),
+    (30, "printers", "device_type", "exact", "printer"),
+    (31, "printers", "device_type", "exact", "scanner"),
+    (32, "printers", "device_type", "exact", "printer/scanner"),
+    (33, "printers", "device_type", "exact", "mfp"),
+    (40, "internet", "device_type", "exact", "internet"),
+    (41, "internet", "device_type", "exact", "network"),
+    (42, "internet", "device_type", "exact", "cradlepoint"),
+    (43, "internet", "device_type", "exact", "router"),
+    (44, "internet", "device_type", "exact", "modem"),
+]
+DEVICE_CATEGORIES = ["computers", "phones", "printers", "internet", "other"]
+
+# --- Device search ---
+DEVICE_SEARCH_DEFAULT_LIMIT = 100
+DEVICE_SEARCH_MAX_LIMIT = 500
+
+# --- Audit trail ---
+ISSUE_EVENTS_MONTHS_AHEAD = 2
+# Partition upkeep and the nightly report snapshots run on their own timer
+# in every process (API and job workers), independent of ARCHIVE_INTERVAL_SECONDS
+MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get("MAINTENANCE_INTERVAL_SECONDS", "3600"))  # 0 disables
+PARTITION_LOCK_ID = 72810030  # pg advisory lock serializing partition creation
+# Range partition key of each monthly-partitioned table
+PARTITION_KEYS = {"issue_events": "ts", "issues_archive": "updated_at"}
+
+# --- Known issues report ---
+REPORT_FORMATS = {
+    "txt": "text/plain; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "md": "text/markdown; charset=utf-8",
+}
+REPORT_FETCH_SIZE = 500  # rows per round trip of the server-side cursor
+REPORT_SNAPSHOT_DIR = os.environ.get(
+    "REPORT_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_snapshots"),
+)
+REPORT_SNAPSHOT_HOUR_UTC = int(os.environ.get("REPORT_SNAPSHOT_HOUR_UTC", "3"))
+REPORT_SNAPSHOT_LOCK_ID = 72810039
+REPORT_CSV_COLUMNS = [
+    "store_number", "store_name", "id", "issue_name", "status", "priority",
+    "computer_number", "device_type", "category", "description",
+    "resolution", "created_at", "updated_at",
+]
+
+# --- Login timestamps (write-behind) ---
+LOGIN_FLUSH_SECONDS = float(os.environ.get("LOGIN_FLUSH_SECONDS", "5"))
+QUICK_LOGIN_WINDOW_HOURS = 156
+_login_buffer = {}  # email -> latest login time not yet written to users
+_login_buffer_lock = threading.Lock()
+
+# --- Issue search paging ---
+ISSUE_SEARCH_DEFAULT_LIMIT = 100
+ISSUE_SEARCH_MAX_LIMIT = 500
+
+# --- /issues/search result cache ---
+# Postgres only: invalidation relies on the issues_changed NOTIFY, and a
+# SQLite file can be written by other processes this one never hears about
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "256"))  # 0 disables
+SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", "60"))
+
+# --- Background jobs ---
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "300"))  # no heartbeat this long -> requeue
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_RETRY_BASE_SECONDS = 30  # retry backoff: 30s, 60s, 120s, ...
+JOB_DEFAULT_MAX_ATTEMPTS = 3
+# Bad input (including InventoryImportError) fails the job at once; retrying cannot help
+JOB_PERMANENT_ERRORS = (ValueError, TypeError)
+# Async device imports stage their CSV here and pass only the file name in
+# the job payload; the directory must be shared with the job workers
+JOB_UPLOAD_DIR = os.environ.get(
+    "JOB_UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_uploads"),
+)
+JOB_UPLOAD_MAX_AGE_DAYS = 7  # maintenance deletes staged files no job cleaned up
+
+# --- Storage backend ---
+# Postgres normally; DATABASE_URL=sqlite:///file.db runs the core endpoints
+# (SQLITE_ENDPOINTS) on a local SQLite file with no database server.
+STORAGE = open_storage(DATABASE_URL, ISSUE_COLUMNS, read_url=DATABASE_READ_URL)
+USE_SQLITE = STORAGE.name == "sqlite"
+SQLITE_ENDPOINTS = {
+    "home", "get_stores", "lookup_stores", "auth_register", "auth_login",
+    "auth_quick_login", "add_issue", "get_all_issues", "get_issues_by_store",
+    "search_issues", "update_issue", "patch_issue", "delete_issue", "get_devices_by_store", "cache_stats",
+    "db_query_stats", "db_health", "batch_get_issues", "batch_delete_issues",
+}
 
-def get_user_by_email(conn, email: str):
+# --- Database timeouts / circuit breaker ---
+# statement_timeout applied to a request's queries (pooled checkout or new
+# connection); background threads keep the server default
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "5000"))
+ENDPOINT_STATEMENT_TIMEOUT_MS = {
+    "lookup_stores": 2000,
+    "search_issues": 10000,
+    "search_devices": 10000,
+    "get_store_dashboard": 15000,
+    "get_all_issues": 30000,
+    "known_issues_report": 120000,
+    "devices_bulk_upsert": 300000,
+}
+# Served from their last good response while the breaker is open
+STALE_READ_ENDPOINTS = {"get_stores", "get_devices_by_store"}
+STALE_READ_CACHE_SIZE = int(os.environ.get("STALE_READ_CACHE_SIZE", "512"))
+# Answer without touching the database, so the breaker never blocks them
+DB_FREE_ENDPOINTS = {"home", "cache_stats", "db_query_stats", "db_health", "static"}
+
+# --- Read replica routing ---
+# Read-only endpoints whose queries may go to DATABASE_READ_URL
+READ_REPLICA_ENDPOINTS = {
+    "get_stores", "lookup_stores", "get_store_dashboard", "get_all_issues",
+    "get_issues_by_store", "search_issues", "get_devices_by_store",
+    "search_devices", "get_issue_history", "known_issues_report",
+    "batch_get_issues",
+}
+# After a write the client gets its WAL position (cookie + header); its
+# reads stay on the primary until the replica has replayed that far
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
+LSN_COOKIE = "db_lsn"
+LSN_HEADER = "X-DB-LSN"
+LSN_PATTERN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+# --- Issue batch endpoints ---
+ISSUE_BATCH_MAX = int(os.environ.get("ISSUE_BATCH_MAX", "500"))  # ids per request
+BATCH_MAX_OPERATIONS = int(os.environ.get("BATCH_MAX_OPERATIONS", "200"))  # ops per /batch
+
+def get_user_by_email(email: str):
     """
     Return a single user row (dict) by email, or None if not found.
-    Email is normalized to lowercase.
+    Email is normalized to lowercase. Runs the prepared user_by_email
+    statement on a pooled connection (see storage.PREPARED_STATEMENTS).
     """
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT
-            id,
-            email,
-            username,
-            password_hash,
-            pin_hash,
-            has_password,
-            has_pin,
-            last_login_at,
-            created_at,
-            updated_at
-        FROM users
-        WHERE email = %s;
-        """,
-        (email.lower(),),
-    )
-    return cur.fetchone()
+    return STORAGE.get_user_by_email(email)
 
 def is_trusted_admin_email(email: str | None) -> bool:
     if not email:
@@ -57,17 +229,122 @@ def is_trusted_admin_email(email: str | None) -> bool:
     return email in {e.lower() for e in TRUSTED_ADMINS}
     
 
-def get_db_conn():
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL is not set")
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+def check_admin_credentials(admin_email: str, admin_password: str, admin_pin: str):
+    """
+    Verify a trusted admin's password and PIN.
+    Returns None when valid, else a (json response, status) error tuple.
+    """
+    if not admin_email or not admin_password or not admin_pin:
+        return jsonify({"error": "Missing admin credentials."}), 400
+    if not is_trusted_admin_email(admin_email):
+        return jsonify({"error": "Email is not a trusted admin."}), 403
+
+    admin_user = get_user_by_email(admin_email)
+    if not admin_user:
+        return jsonify({"error": "Admin user not found."}), 404
+    if not admin_user.get("password_hash") or not verify_secret(admin_password, admin_user["password_hash"]):
+        return jsonify({"error": "Invalid admin password."}), 403
+    if not admin_user.get("pin_hash") or not verify_secret(admin_pin, admin_user["pin_hash"]):
+        return jsonify({"error": "Invalid admin PIN."}), 403
+    return None
+
+
+def normalize_status_priority(status, priority):
+    """
+    Validate incoming status/priority values and return their canonical
+    text plus codes: ((status, status_code, priority, priority_code), error).
+    """
+    try:
+        status_code = normalize_status(status)
+    except ValueError:
+        allowed = ", ".join(ISSUE_STATUSES.values())
+        return None, f"Unknown Status '{status}'. Use one of: {allowed}"
+    try:
+        priority_code = normalize_priority(priority)
+    except ValueError:
+        return None, f"Unknown Priority '{priority}'. Use 1 (Critical), 2 (Functional) or 3 (Cosmetic)"
+
+    if status_code is not None:
+        status = ISSUE_STATUSES[status_code]
+    if priority_code is not None:
+        priority = str(priority_code)
+
+    return (status, status_code, priority, priority_code), None
+
+
+def alias_case_sql(column: str, labels: dict, aliases: dict) -> str:
+    """SQL CASE mirroring normalize_code(), used to backfill existing rows."""
+    whens = {label.lower(): code for code, label in labels.items()}
+    whens.update(aliases)
+    parts = [f"WHEN '{text}' THEN {code}" for text, code in whens.items()]
+    digits = "".join(str(code) for code in labels)
+    return (
+        f"COALESCE(CASE LOWER(BTRIM({column})) {' '.join(parts)} END, "
+        f"NULLIF(substring({column} from '^\\s*([{digits}])(\\D|$)'), '')::smallint)"
+    )
+
+
+def rebuild_store_issue_counts(cur):
+    """
+    Recount store_issue_counts from issues. The SHARE lock holds off issue
+    writes until the caller commits.
+    """
+    cur.execute(
+        """
+        LOCK TABLE issues IN SHARE MODE;
+
+        DELETE FROM store_issue_counts;
+
+        INSERT INTO store_issue_counts (store_number, status_code, priority_code, issue_count)
+        SELECT store_number, COALESCE(status_code, 0), COALESCE(priority_code, 0), COUNT(*)
+        FROM issues
+        WHERE store_number IS NOT NULL
+        GROUP BY 1, 2, 3;
+        """
+    )
+
+
+def migration_pending(cur, name: str) -> bool:
+    """
+    True the first time init_db() reaches the one-time step `name`, which is
+    then recorded in schema_migrations (in init_db's transaction, so a failed
+    step is retried on the next start). Give a changed step a new name.
+    """
+    cur.execute(
+        "INSERT INTO schema_migrations (name) VALUES (%s) ON CONFLICT (name) DO NOTHING RETURNING name;",
+        (name,),
+    )
+    return cur.fetchone() is not None
 
 
 def init_db():
-    """Create/upgrade tables (issues, users, stores) and ensure new columns exist."""
-    conn = get_db_conn()
+    """Create/upgrade the Postgres schema on a pooled connection (see migrate_schema)."""
+    with STORAGE.session() as conn:
+        migrate_schema(conn)
+
+
+def migrate_schema(conn):
+    """
+    Create/upgrade tables (issues, users, stores) and ensure new columns exist.
+
+    Runs in one transaction under SCHEMA_LOCK_ID, so workers starting together
+    take turns; the later ones find everything in place. Backfills, ALTER
+    TABLEs and trigger (re)creation are one-time steps (migration_pending):
+    they lock or rewrite whole tables and must not repeat on every start.
+    """
     cur = conn.cursor()
 
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """
+    )
+    conn.commit()
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_ID,))
+
     # =========================
     # ISSUES TABLE
     # =========================
@@ -116,6 +393,88 @@ def init_db():
         """
     )
 
+    # =========================
+    # STORES TABLE
+    # =========================
+    # Base definition (in case table doesn't exist yet)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stores (
+            id SERIAL PRIMARY KEY,
+            store_number INTEGER UNIQUE NOT NULL,
+            store_name TEXT NOT NULL,
+            type TEXT,
+            state TEXT,
+            num_comp INTEGER,
+            address TEXT,
+            city TEXT,
+            zip TEXT,
+            phone TEXT,
+            kiosk TEXT
+        );
+        """
+    )
+
+    # Store lookup indexes: prefix search on number/ZIP, trigram on name/city
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_stores_number_text
+            ON stores ((store_number::text) text_pattern_ops);
+        CREATE INDEX IF NOT EXISTS idx_stores_zip
+            ON stores (zip text_pattern_ops);
+        """
+    )
+    global TRGM_AVAILABLE
+    cur.execute("SAVEPOINT trgm;")
+    try:
+        cur.execute(
+            """
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+            CREATE INDEX IF NOT EXISTS idx_stores_name_trgm
+                ON stores USING gin (store_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_stores_city_trgm
+                ON stores USING gin (city gin_trgm_ops);
+            """
+        )
+        cur.execute("RELEASE SAVEPOINT trgm;")
+        TRGM_AVAILABLE = True
+    except psycopg2.Error as e:
+        # No rights to install extensions: lookup falls back to plain ILIKE
+        cur.execute("ROLLBACK TO SAVEPOINT trgm;")
+        logging.warning("pg_trgm unavailable, store lookup will not use trigram indexes: %s", e)
+
+    # Cache generations: bumped whenever the data behind a cached response
+    # changes, so every worker can tell its copy is stale with one PK lookup
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            name TEXT PRIMARY KEY,
+            generation BIGINT NOT NULL DEFAULT 0
+        );
+
+        INSERT INTO cache_generations (name) VALUES ('stores')
+        ON CONFLICT (name) DO NOTHING;
+
+        CREATE OR REPLACE FUNCTION bump_stores_generation() RETURNS trigger AS $$
+        BEGIN
+            UPDATE cache_generations SET generation = generation + 1
+            WHERE name = 'stores';
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    if migration_pending(cur, "stores_cache_generation trigger"):
+        cur.execute(
+            """
+            DROP TRIGGER IF EXISTS stores_cache_generation ON stores;
+            CREATE TRIGGER stores_cache_generation
+                AFTER INSERT OR UPDATE OR DELETE ON stores
+                FOR EACH ROW EXECUTE FUNCTION bump_stores_generation();
+            """
+        )
+
     # =======================
     # Tech Table
     # =======================
@@ -138,159 +497,1705 @@ def init_db():
             ON store_devices(store_number);
         """
     )
+
+    # =========================
+    # DEVICE CATEGORIES
+    # =========================
+    # device_category is computed in the database on insert/update from the
+    # rules table, and re-applied to existing rows once per distinct rule set
+    # so rule edits take effect on the next deploy.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS device_category_rules (
+            id SERIAL PRIMARY KEY,
+            rule_order INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            field TEXT NOT NULL CHECK (field IN ('device_type', 'device_number')),
+            match_kind TEXT NOT NULL CHECK (match_kind IN ('exact', 'prefix')),
+            pattern TEXT NOT NULL
+        );
+        """
+    )
+    cur.execute("SELECT COUNT(*) AS n FROM device_category_rules;")
+    if cur.fetchone()["n"] == 0:
+        for rule in DEFAULT_DEVICE_CATEGORY_RULES:
+            cur.execute(
+                """
+                INSERT INTO device_category_rules (rule_order, category, field, match_kind, pattern)
+                VALUES (%s, %s, %s, %s, %s);
+                """,
+                rule,
+            )
+
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION device_category_for(p_type TEXT, p_number TEXT)
+        RETURNS TEXT AS $$
+            SELECT COALESCE((
+                SELECT r.category
+                FROM device_category_rules r
+                CROSS JOIN LATERAL (
+                    SELECT LOWER(BTRIM(CASE r.field
+                                           WHEN 'device_type' THEN p_type
+                                           ELSE p_number
+                                       END)) AS val
+                ) AS v
+                WHERE (r.match_kind = 'exact' AND v.val = r.pattern)
+                   OR (r.match_kind = 'prefix' AND left(v.val, length(r.pattern)) = r.pattern)
+                ORDER BY r.rule_order, r.id
+                LIMIT 1
+            ), 'other');
+        $$ LANGUAGE sql STABLE;
+
+        CREATE OR REPLACE FUNCTION set_device_category() RETURNS trigger AS $$
+        BEGIN
+            NEW.device_category := device_category_for(NEW.device_type, NEW.device_number);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    if migration_pending(cur, "store_devices.device_category column and trigger"):
+        cur.execute(
+            """
+            ALTER TABLE store_devices
+                ADD COLUMN IF NOT EXISTS device_category TEXT;
+
+            DROP TRIGGER IF EXISTS trg_set_device_category ON store_devices;
+            CREATE TRIGGER trg_set_device_category
+                BEFORE INSERT OR UPDATE OF device_type, device_number, device_category
+                ON store_devices
+                FOR EACH ROW EXECUTE FUNCTION set_device_category();
+            """
+        )
+    cur.execute(
+        """
+        SELECT md5(COALESCE(string_agg(
+            concat_ws('|', rule_order, category, field, match_kind, pattern), ','
+            ORDER BY rule_order, id
+        ), '')) AS fingerprint
+        FROM device_category_rules;
+        """
+    )
+    rules = cur.fetchone()["fingerprint"]
+    if migration_pending(cur, f"store_devices.device_category rules {rules}"):
+        cur.execute(
+            """
+            UPDATE store_devices
+            SET device_category = device_category_for(device_type, device_number)
+            WHERE device_category IS DISTINCT FROM device_category_for(device_type, device_number);
+            """
+        )
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_store_devices_store_category
+            ON store_devices (store_number, device_category);
+        """
+    )
+
+    # Cross-store device search / analytics
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_store_devices_manufacturer_model
+            ON store_devices (LOWER(manufacturer), LOWER(model));
+        CREATE INDEX IF NOT EXISTS idx_store_devices_type
+            ON store_devices (LOWER(device_type));
+        CREATE INDEX IF NOT EXISTS idx_store_devices_store_id
+            ON store_devices (store_number, id);
+        CREATE INDEX IF NOT EXISTS idx_stores_state
+            ON stores (state);
+        """
+    )
+    if TRGM_AVAILABLE:
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_store_devices_model_trgm
+                ON store_devices USING gin (model gin_trgm_ops);
+            """
+        )
     
     
+    # ======================
+    # One Time Updates
+    # ======================
+
+    # Row version for optimistic locking on PATCH /issues/<id>
+    if migration_pending(cur, "issues.row_version"):
+        cur.execute(
+            """
+            ALTER TABLE issues
+                ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 1;
+            """
+        )
+
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_issues_store_number
+            ON issues(store_number);
+        """
+    )
+
     # =========================
-    # STORES TABLE
+    # STATUS / PRIORITY LOOKUPS
     # =========================
-    # Base definition (in case table doesn't exist yet)
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS stores (
-            id SERIAL PRIMARY KEY,
-            store_number INTEGER UNIQUE NOT NULL,
-            store_name TEXT NOT NULL,
-            type TEXT,
-            state TEXT,
-            num_comp INTEGER,
-            address TEXT,
-            city TEXT,
-            zip TEXT,
-            phone TEXT,
-            kiosk TEXT
+        CREATE TABLE IF NOT EXISTS issue_statuses (
+            code SMALLINT PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS issue_priorities (
+            code SMALLINT PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        );
+        """
+    )
+    for code, label in ISSUE_STATUSES.items():
+        cur.execute(
+            """
+            INSERT INTO issue_statuses (code, label) VALUES (%s, %s)
+            ON CONFLICT (code) DO UPDATE SET label = EXCLUDED.label;
+            """,
+            (code, label),
+        )
+    for code, label in ISSUE_PRIORITIES.items():
+        cur.execute(
+            """
+            INSERT INTO issue_priorities (code, label) VALUES (%s, %s)
+            ON CONFLICT (code) DO UPDATE SET label = EXCLUDED.label;
+            """,
+            (code, label),
+        )
+
+    if migration_pending(cur, "issues.status_code and priority_code"):
+        cur.execute(
+            """
+            ALTER TABLE issues
+                ADD COLUMN IF NOT EXISTS status_code SMALLINT REFERENCES issue_statuses(code),
+                ADD COLUMN IF NOT EXISTS priority_code SMALLINT REFERENCES issue_priorities(code);
+            """
+        )
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_issues_status_code
+            ON issues(status_code);
+        CREATE INDEX IF NOT EXISTS idx_issues_store_status
+            ON issues(store_number, status_code);
+        CREATE INDEX IF NOT EXISTS idx_issues_priority_code
+            ON issues(priority_code);
+        """
+    )
+
+    # Composite indexes for the common /issues/search shapes; each ends in
+    # (sort column, id) so a sorted page is an index range scan that keyset
+    # paging can seek into. benchmarks/search_plans.py checks each plan.
+    #   recent activity across stores:       ORDER BY updated_at / created_at
+    #   one store's issues, newest first:    store_number = ? ORDER BY updated_at
+    #   triage ("critical open, last week"): status/priority + updated_at range
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_issues_updated
+            ON issues(updated_at, id);
+        CREATE INDEX IF NOT EXISTS idx_issues_created
+            ON issues(created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_issues_store_updated
+            ON issues(store_number, updated_at, id);
+        CREATE INDEX IF NOT EXISTS idx_issues_status_priority_updated
+            ON issues(status_code, priority_code, updated_at, id);
+        """
+    )
+
+    # Backfill codes from the old free-text values, then rewrite the text
+    # columns to their canonical form. New writes are normalized by the API.
+    if migration_pending(cur, "issues status/priority code backfill"):
+        cur.execute(
+            f"""
+            UPDATE issues
+            SET status_code = {alias_case_sql("status", ISSUE_STATUSES, STATUS_ALIASES)}
+            WHERE status_code IS NULL AND status IS NOT NULL;
+
+            UPDATE issues
+            SET priority_code = {alias_case_sql("priority", ISSUE_PRIORITIES, PRIORITY_ALIASES)}
+            WHERE priority_code IS NULL AND priority IS NOT NULL;
+
+            UPDATE issues i
+            SET status = s.label
+            FROM issue_statuses s
+            WHERE i.status_code = s.code AND i.status IS DISTINCT FROM s.label;
+
+            UPDATE issues
+            SET priority = priority_code::text
+            WHERE priority_code IS NOT NULL AND priority IS DISTINCT FROM priority_code::text;
+            """
+        )
+
+    # =========================
+    # ISSUE EVENTS (audit trail)
+    # =========================
+    # Append-only, partitioned by month of ts. Written by trigger only:
+    # I = created (all non-null columns), U = updated (changed columns only),
+    # D = deleted (the row as it was). The acting user comes from the
+    # app.actor setting, see set_request_actor().
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS issue_events (
+            event_id BIGSERIAL,
+            issue_id INTEGER NOT NULL,
+            op CHAR(1) NOT NULL,
+            ts TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            actor TEXT,
+            changes JSONB NOT NULL,
+            PRIMARY KEY (event_id, ts)
+        ) PARTITION BY RANGE (ts);
+
+        CREATE TABLE IF NOT EXISTS issue_events_default
+            PARTITION OF issue_events DEFAULT;
+
+        CREATE INDEX IF NOT EXISTS idx_issue_events_issue_ts
+            ON issue_events(issue_id, ts);
+
+        CREATE OR REPLACE FUNCTION log_issue_event() RETURNS trigger AS $$
+        DECLARE
+            diff JSONB;
+            who TEXT := NULLIF(current_setting('app.actor', true), '');
+        BEGIN
+            IF current_setting('app.archiving', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO issue_events (issue_id, op, actor, changes)
+                VALUES (NEW.id, 'I', who, jsonb_strip_nulls(to_jsonb(NEW)));
+            ELSIF TG_OP = 'UPDATE' THEN
+                SELECT jsonb_object_agg(n.key, n.value) INTO diff
+                FROM jsonb_each(to_jsonb(NEW)) AS n
+                JOIN jsonb_each(to_jsonb(OLD)) AS o USING (key)
+                WHERE n.value IS DISTINCT FROM o.value
+                  AND n.key NOT IN ('updated_at', 'row_version');
+
+                IF diff IS NULL THEN
+                    RETURN NULL;
+                END IF;
+
+                INSERT INTO issue_events (issue_id, op, actor, changes)
+                VALUES (NEW.id, 'U', who, diff);
+            ELSE
+                INSERT INTO issue_events (issue_id, op, actor, changes)
+                VALUES (OLD.id, 'D', who, to_jsonb(OLD));
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    if migration_pending(cur, "trg_issue_events trigger"):
+        cur.execute(
+            """
+            DROP TRIGGER IF EXISTS trg_issue_events ON issues;
+            CREATE TRIGGER trg_issue_events
+                AFTER INSERT OR UPDATE OR DELETE ON issues
+                FOR EACH ROW EXECUTE FUNCTION log_issue_event();
+            """
+        )
+    ensure_event_partitions(cur)
+
+    # Broadcast "issues changed" to every worker's search cache. One NOTIFY
+    # per statement; Postgres folds duplicates within a transaction.
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_issues_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('issues_changed', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    if migration_pending(cur, "trg_issues_changed_notify trigger"):
+        cur.execute(
+            """
+            DROP TRIGGER IF EXISTS trg_issues_changed_notify ON issues;
+            CREATE TRIGGER trg_issues_changed_notify
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON issues
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_issues_changed();
+            """
+        )
+
+    # =========================
+    # STORE ISSUE COUNTERS
+    # =========================
+    # Trigger-maintained number of issues (hot table only) per store, status
+    # and priority. Unknown status/priority codes are counted under 0.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS store_issue_counts (
+            store_number INTEGER NOT NULL,
+            status_code SMALLINT NOT NULL,
+            priority_code SMALLINT NOT NULL,
+            issue_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (store_number, status_code, priority_code)
         );
+
+        CREATE OR REPLACE FUNCTION maintain_store_issue_counts() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE'
+               AND NEW.store_number IS NOT DISTINCT FROM OLD.store_number
+               AND NEW.status_code IS NOT DISTINCT FROM OLD.status_code
+               AND NEW.priority_code IS NOT DISTINCT FROM OLD.priority_code THEN
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.store_number IS NOT NULL THEN
+                UPDATE store_issue_counts
+                SET issue_count = issue_count - 1
+                WHERE store_number = OLD.store_number
+                  AND status_code = COALESCE(OLD.status_code, 0)
+                  AND priority_code = COALESCE(OLD.priority_code, 0);
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.store_number IS NOT NULL THEN
+                INSERT INTO store_issue_counts (store_number, status_code, priority_code, issue_count)
+                VALUES (NEW.store_number, COALESCE(NEW.status_code, 0), COALESCE(NEW.priority_code, 0), 1)
+                ON CONFLICT (store_number, status_code, priority_code)
+                DO UPDATE SET issue_count = store_issue_counts.issue_count + 1;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    if migration_pending(cur, "trg_store_issue_counts trigger"):
+        cur.execute(
+            """
+            DROP TRIGGER IF EXISTS trg_store_issue_counts ON issues;
+            CREATE TRIGGER trg_store_issue_counts
+                AFTER INSERT OR UPDATE OR DELETE ON issues
+                FOR EACH ROW EXECUTE FUNCTION maintain_store_issue_counts();
+            """
+        )
+
+    # Fill the counters the first time (table new or empty). Later drift is
+    # fixed by the rebuild_store_issue_counts job, not on every start: the
+    # rebuild locks out issue writes while it runs.
+    cur.execute("SELECT NOT EXISTS (SELECT 1 FROM store_issue_counts) AS empty;")
+    if cur.fetchone()["empty"]:
+        rebuild_store_issue_counts(cur)
+
+    # =========================
+    # ISSUES ARCHIVE (cold)
+    # =========================
+    # Resolved issues older than ARCHIVE_AFTER_DAYS, partitioned by month of
+    # updated_at. Monthly partitions are created on demand by the archiver.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS issues_archive (
+            id INTEGER NOT NULL,
+            store_name TEXT NOT NULL,
+            store_number INTEGER,
+            issue_name TEXT,
+            priority TEXT,
+            computer_number TEXT,
+            device_type TEXT,
+            category TEXT,
+            description TEXT,
+            narrative TEXT,
+            replicable TEXT,
+            status TEXT,
+            resolution TEXT,
+            created_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL,
+            global_issue BOOLEAN NOT NULL DEFAULT FALSE,
+            global_num INTEGER,
+            row_version INTEGER NOT NULL DEFAULT 1,
+            status_code SMALLINT,
+            priority_code SMALLINT,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, updated_at)
+        ) PARTITION BY RANGE (updated_at);
+
+        CREATE INDEX IF NOT EXISTS idx_issues_archive_store_number
+            ON issues_archive(store_number);
         """
     )
+    if migration_pending(cur, "issues_archive.status_code and priority_code"):
+        cur.execute(
+            """
+            ALTER TABLE issues_archive
+                ADD COLUMN IF NOT EXISTS status_code SMALLINT,
+                ADD COLUMN IF NOT EXISTS priority_code SMALLINT;
+            """
+        )
+
+    # /issues/search pages on (created_at, id) / (updated_at, id), which
+    # only works if neither timestamp is ever NULL
+    if migration_pending(cur, "issues timestamps NOT NULL"):
+        cur.execute(
+            """
+            UPDATE issues SET created_at = COALESCE(updated_at, NOW()) WHERE created_at IS NULL;
+            UPDATE issues SET updated_at = created_at WHERE updated_at IS NULL;
+            ALTER TABLE issues
+                ALTER COLUMN created_at SET NOT NULL,
+                ALTER COLUMN updated_at SET NOT NULL;
+
+            UPDATE issues_archive SET created_at = updated_at WHERE created_at IS NULL;
+            ALTER TABLE issues_archive ALTER COLUMN created_at SET NOT NULL;
+            """
+        )
+
+    # =========================
+    # IDEMPOTENCY KEYS TABLE
+    # =========================
+    # Stored responses for mutating requests sent with an Idempotency-Key
+    # header. A row is committed together with its response (see idempotent).
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            idem_key TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            request_hash TEXT NOT NULL,
+            status_code INTEGER,
+            response_body TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (idem_key, endpoint)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at
+            ON idempotency_keys(created_at);
+        """
+    )
+
+    # =========================
+    # JOB QUEUE
+    # =========================
+    # Background work claimed by job_worker.py with FOR UPDATE SKIP LOCKED.
+    # status: queued -> running -> succeeded | failed (queued again on retry)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id BIGSERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            progress SMALLINT NOT NULL DEFAULT 0,
+            progress_message TEXT,
+            result JSONB,
+            last_error TEXT,
+            locked_by TEXT,
+            heartbeat_at TIMESTAMPTZ,
+            created_by TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_jobs_queued
+            ON jobs (run_after, id) WHERE status = 'queued';
+        CREATE INDEX IF NOT EXISTS idx_jobs_running_heartbeat
+            ON jobs (heartbeat_at) WHERE status = 'running';
+        """
+    )
+
+
+    conn.commit()
+    cur.close()
+
+# ------------------------
+# PASSWORD HASHING
+# ------------------------
+def hash_secret(plain: str) -> str:
+    """Hash a password or PIN using bcrypt."""
+    salt = bcrypt.gensalt(rounds=12)
+    hashed = bcrypt.hashpw(plain.encode("utf-8"), salt)
+    return hashed.decode("utf-8")
+#SECRET MEANS LIKE A PASSWORD OR PIN IT'S LIKE AN AUTH KEY
+
+def verify_secret(plain: str, stored_hash: str) -> bool:
+    """Check if plain password/PIN matches stored bcrypt hash."""
+    if not stored_hash:
+        return False
+    try:
+        return bcrypt.checkpw(plain.encode("utf-8"), stored_hash.encode("utf-8"))
+    except ValueError:
+        return False
+
+
+SPECIAL_CHARS = set('!@#$%^&*":><')
+
+
+def check_password_policy(password: str, username: str):
+    """Return (ok: bool, errors: list[str]) based on your rules."""
+    errors = []
+
+    if len(password) < 8:
+        errors.append("Password must be at least 8 characters long.")
+    if password.lower() == username.lower():
+        errors.append("Password cannot be the same as your username.")
+    if not any(ch.isupper() for ch in password):
+        errors.append("Password must contain at least one uppercase letter.")
+    if not any(ch.islower() for ch in password):
+        errors.append("Password must contain at least one lowercase letter.")
+    if not any(ch.isdigit() for ch in password):
+        errors.append("Password must contain at least one number.")
+    if not any(ch in SPECIAL_CHARS for ch in password):
+        errors.append("Password must contain at least one special character (! @ # $ % ^&*\":><).")
+
+    return len(errors) == 0, errors
+
+
+def check_pin_policy(pin: str):
+    """Simple PIN rule: 4–6 digits only."""
+    if not pin.isdigit():
+        return False, "PIN must contain only digits."
+    if not (4 <= len(pin) <= 6):
+        return False, "PIN must be between 4 and 6 digits."
+    if len(set(pin)) == 1:
+        return False, "PIN cannot be all one digit (e.g., 0000, 1111)."
+
+        
+    return True, None
+
+
+def load_stores():
+    """
+    Load store metadata from the `stores` table and return it in the
+    legacy Stores.json structure, keyed by store name.
+    """
+    rows = STORAGE.list_stores()
+    # Counts change with every issue write, so they are always read live
+    issue_counts = summarize_issue_counts(STORAGE.issue_count_rows())
+
+    stores_legacy = {}
+    for row in rows:
+        legacy = db_store_row_to_legacy(row, issue_counts.get(row["store_number"]))
+        # Legacy structure used store name as the key
+        stores_legacy[legacy["Store Name"]] = legacy
+
+    return stores_legacy
+
+
+def summarize_issue_counts(rows) -> dict:
+    """
+    Fold (store_number, status_code, priority_code, issue_count) rows (see
+    Storage.issue_count_rows) into per-store summaries:
+
+      {store_number: {"total": 9, "open": 3,
+                      "by_status": {"Unresolved": 2, "In Progress": 1, "Resolved": 6},
+                      "open_by_priority": {"Critical": 1, "Functional": 2}}}
+
+    Only stores with at least one issue appear.
+    """
+    counts = {}
+    for row in rows:
+        summary = counts.setdefault(row["store_number"], {
+            "total": 0,
+            "open": 0,
+            "by_status": {},
+            "open_by_priority": {},
+        })
+        n = row["issue_count"]
+        status = ISSUE_STATUSES.get(row["status_code"], "Unknown")
+        summary["total"] += n
+        summary["by_status"][status] = summary["by_status"].get(status, 0) + n
+
+        if row["status_code"] not in (3, 4):
+            priority = ISSUE_PRIORITIES.get(row["priority_code"], "Unknown")
+            summary["open"] += n
+            summary["open_by_priority"][priority] = summary["open_by_priority"].get(priority, 0) + n
+
+    return counts
+
+
+EMPTY_ISSUE_COUNTS = {"total": 0, "open": 0, "by_status": {}, "open_by_priority": {}}
+
+
+def db_store_row_to_legacy(row, issue_counts: dict | None = None):
+    """
+    Adapt a row from the `stores` DB table into the legacy Stores.json structure.
+    This keeps older client code working without caring that the backend changed.
+    """
+    return {
+        "Store Number": row["store_number"],
+        "Store Name": row["store_name"],
+        "State": row.get("state"),
+        "Type": row.get("type"),
+        "Computers": row.get("num_comp"),
+        "Address": row.get("address"),
+        "City": row.get("city"),
+        "ZIP": row.get("zip"),
+        "Phone": row.get("phone"),
+        "Kiosk Type": row.get("kiosk"),
+        # Legacy structure kept issues inside each store; issues now live in a
+        # separate table, so stores carry counters instead of the issue list.
+        "Issue Counts": issue_counts or EMPTY_ISSUE_COUNTS,
+    }
+
+
+def request_actor() -> str | None:
+    """The acting user from the X-User header, if any."""
+    return (request.headers.get("X-User") or "").strip()[:200] or None
+
+
+def set_request_actor(cur):
+    """
+    Tag the current transaction with the acting user (X-User header) so the
+    issue_events trigger can record who made the change.
+    """
+    actor = request_actor()
+    if actor:
+        cur.execute("SELECT set_config('app.actor', %s, true);", (actor,))
+
+
+# -----------------------------------------
+#             IDEMPOTENCY
+# -----------------------------------------
+
+def prune_idempotency_keys():
+    """Drop stored responses older than IDEMPOTENCY_TTL_HOURS (at most every few minutes)."""
+    global _last_idempotency_prune
+    now = time.monotonic()
+    if now - _last_idempotency_prune < IDEMPOTENCY_PRUNE_EVERY_SECONDS:
+        return
+    _last_idempotency_prune = now
+    STORAGE.prune_idempotency_keys(IDEMPOTENCY_TTL_HOURS)
+
+
+class IdempotentRollback(Exception):
+    """Raised inside an idempotent transaction to undo it and answer `response`."""
+
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def idempotent(view):
+    """
+    Make a mutating endpoint safe to retry.
+
+    If the request carries an Idempotency-Key header, the first response is
+    stored and any repeat of the same key on the same endpoint gets that
+    response back instead of running the handler again. Requests without
+    the header behave exactly as before.
+
+    The key is claimed, the handler's storage calls run and the response is
+    stored in one STORAGE.transaction(), so a key is committed together with
+    the writes it answered for, or not at all. A retry that arrives while
+    the first attempt is still running waits on the claim, then replays.
+    An exception or a 5xx response rolls everything back, so the retry runs
+    the handler for real.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        idem_key = (request.headers.get("Idempotency-Key") or "").strip()
+        if not idem_key:
+            return view(*args, **kwargs)
+
+        if len(idem_key) > 200:
+            return jsonify({"error": "Idempotency-Key is too long"}), 400
+
+        endpoint = f"{request.method} {request.path}"
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        prune_idempotency_keys()
+
+        try:
+            with STORAGE.transaction():
+                stored = STORAGE.claim_idempotency_key(idem_key, endpoint, request_hash)
+                if stored is None:
+                    response = app.make_response(view(*args, **kwargs))
+                    if response.status_code >= 500:
+                        raise IdempotentRollback(response)
+                    STORAGE.save_idempotent_response(
+                        idem_key, endpoint, response.status_code, response.get_data(as_text=True)
+                    )
+                    return response
+        except IdempotentRollback as e:
+            return e.response
+
+        if stored["request_hash"] != request_hash:
+            return jsonify(
+                {"error": "Idempotency-Key was already used with a different request"}
+            ), 422
+
+        replay = Response(
+            stored["response_body"],
+            status=stored["status_code"],
+            mimetype="application/json",
+        )
+        replay.headers["Idempotent-Replayed"] = "true"
+        return replay
+
+    return wrapper
+
+
+# -----------------------------------------
+#             ARCHIVING (hot/cold split)
+# -----------------------------------------
+
+def wants_archived() -> bool:
+    """True when the request asked for ?include_archived=true."""
+    val = str(request.args.get("include_archived", "")).strip().lower()
+    return val in ("true", "1", "yes", "y")
+
+
+def issues_source(include_archived: bool) -> str:
+    """FROM-clause target for issue reads (see PostgresStorage.issues_source)."""
+    return STORAGE.issues_source(include_archived)
+
+
+def next_month_start(month_start: datetime) -> datetime:
+    if month_start.month == 12:
+        return month_start.replace(year=month_start.year + 1, month=1)
+    return month_start.replace(month=month_start.month + 1)
+
+
+def ensure_month_partition(cur, table: str, month_start: datetime):
+    """
+    Create the monthly partition of `table` for the month starting at
+    month_start, in the caller's transaction. Months are UTC months: the
+    bounds are sent with a +00 offset, so they do not depend on the
+    session TimeZone.
+
+    If `table` has a default partition that already holds rows for that
+    month (upkeep fell behind), CREATE ... PARTITION OF would fail. Those rows
+    are moved into a standalone table that is then attached as the partition.
+    """
+    month_start = month_start.astimezone(timezone.utc)
+    name = f"{table}_{month_start:%Y_%m}"
+    bounds = (month_start, next_month_start(month_start))
+
+    # Concurrent workers would otherwise race on the same CREATE / ATTACH
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_ID,))
+    cur.execute(
+        "SELECT to_regclass(%s) IS NOT NULL AS present, to_regclass(%s) IS NOT NULL AS has_default;",
+        (name, f"{table}_default"),
+    )
+    found = cur.fetchone()
+    if found["present"]:
+        return
+
+    if not found["has_default"]:
+        cur.execute(
+            f"""
+            CREATE TABLE {name}
+                PARTITION OF {table}
+                FOR VALUES FROM (%s) TO (%s);
+            """,
+            bounds,
+        )
+        return
+
+    key = PARTITION_KEYS[table]
+    cur.execute(
+        f"""
+        CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+
+        WITH moved AS (
+            DELETE FROM {table}_default
+            WHERE {key} >= %(start)s AND {key} < %(end)s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+
+        ALTER TABLE {table} ATTACH PARTITION {name}
+            FOR VALUES FROM (%(start)s) TO (%(end)s);
+        """,
+        {"start": bounds[0], "end": bounds[1]},
+    )
+
+
+def archive_resolved_issues(older_than_days: int = ARCHIVE_AFTER_DAYS,
+                            batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move resolved issues not touched for `older_than_days` from issues into
+    issues_archive, in batches. Returns how many rows were moved.
+    """
+    cols = ", ".join(ISSUE_COLUMNS)
+    moved_total = 0
+    with STORAGE.session() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (ARCHIVE_LOCK_ID,))
+        if not cur.fetchone()["locked"]:
+            # Another worker is already archiving
+            return 0
+
+        try:
+            # One cutoff for the whole run: the partitions created here must
+            # cover every row a later batch moves
+            cur.execute("SELECT NOW() - %s * INTERVAL '1 day' AS cutoff;", (older_than_days,))
+            cutoff = cur.fetchone()["cutoff"]
+
+            cur.execute(
+                f"""
+                SELECT DISTINCT
+                    date_trunc('month', updated_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS month_start
+                FROM issues
+                WHERE {RESOLVED_STATUS_SQL}
+                  AND updated_at < %s;
+                """,
+                (cutoff,),
+            )
+            for row in cur.fetchall():
+                ensure_month_partition(cur, "issues_archive", row["month_start"])
+            conn.commit()
+
+            while True:
+                # Moving to the archive is not a user delete; keep it out of issue_events
+                cur.execute("SELECT set_config('app.archiving', 'on', true);")
+                cur.execute(
+                    f"""
+                    WITH moved AS (
+                        DELETE FROM issues
+                        WHERE id IN (
+                            SELECT id FROM issues
+                            WHERE {RESOLVED_STATUS_SQL}
+                              AND updated_at < %s
+                            ORDER BY id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING {cols}
+                    )
+                    INSERT INTO issues_archive ({cols})
+                    SELECT {cols} FROM moved;
+                    """,
+                    (cutoff, batch_size),
+                )
+                moved = cur.rowcount
+                conn.commit()
+                moved_total += moved
+                if moved < batch_size:
+                    break
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s);", (ARCHIVE_LOCK_ID,))
+            conn.commit()
+            cur.close()
+
+    return moved_total
+
+
+def ensure_event_partitions(cur, months_ahead: int = ISSUE_EVENTS_MONTHS_AHEAD):
+    """Make sure issue_events has partitions for this month and the next few."""
+    month_start = datetime.now(timezone.utc).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    for _ in range(months_ahead + 1):
+        ensure_month_partition(cur, "issue_events", month_start)
+        month_start = next_month_start(month_start)
+
+
+# -----------------------------------------
+#          KNOWN ISSUES REPORT
+# -----------------------------------------
+
+def iter_known_issue_rows(conn):
+    """
+    Stream every live issue ordered by store, through a server-side cursor
+    so the whole table is never held in memory.
+    """
+    cur = conn.cursor(name="known_issues_report")
+    cur.itersize = REPORT_FETCH_SIZE
+    cur.execute(
+        """
+        SELECT
+            id, store_number, store_name, issue_name, status, priority,
+            priority_code, computer_number, device_type, category,
+            description, resolution, created_at, updated_at
+        FROM issues
+        ORDER BY store_number NULLS LAST, store_name, id;
+        """
+    )
+    try:
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+
+
+def _report_priority(row) -> str:
+    label = ISSUE_PRIORITIES.get(row["priority_code"])
+    return f"{row['priority_code']} - {label}" if label else (row["priority"] or "N/A")
+
+
+def _md_cell(value) -> str:
+    return " ".join(str(value if value is not None else "").split()).replace("|", "\\|")
+
+
+def render_known_issues(rows, fmt: str):
+    """
+    Yield the Known Issues Report in `fmt` (txt, csv or md) chunk by chunk,
+    one store group at a time. `rows` must be ordered by store.
+    """
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(REPORT_CSV_COLUMNS)
+        for row in rows:
+            writer.writerow([
+                _report_priority(row) if c == "priority" else row[c]
+                for c in REPORT_CSV_COLUMNS
+            ])
+            if out.tell() >= 64 * 1024:
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+        yield out.getvalue()
+        return
+
+    if fmt == "md":
+        yield "# Known Issues Report\n"
+    else:
+        yield "*****Known Issues Report*****\n\n"
+
+    current_store = object()
+    chunk = []
+    idx = 0
+    for row in rows:
+        store = (row["store_number"], row["store_name"])
+        if store != current_store:
+            if chunk:
+                yield "".join(chunk)
+                chunk = []
+            current_store = store
+            idx = 0
+            if fmt == "md":
+                chunk.append(f"\n## {row['store_number'] or '????'} - {_md_cell(row['store_name'])}\n\n")
+                chunk.append("| # | Issue | Status | Priority | Computer | Device | Category | Description | Resolution |\n")
+                chunk.append("|---|---|---|---|---|---|---|---|---|\n")
+            else:
+                chunk.append(f"Store: {row['store_name']}\n")
+                chunk.append(f"Store Number: {row['store_number']}\n")
+                chunk.append("Known Issues:\n")
+
+        idx += 1
+        if fmt == "md":
+            cells = [
+                idx, row["issue_name"] or "Unnamed Issue", row["status"] or "Unresolved",
+                _report_priority(row), row["computer_number"] or "N/A",
+                row["device_type"] or "N/A", row["category"] or "N/A",
+                row["description"] or "", row["resolution"] or "",
+            ]
+            chunk.append("| " + " | ".join(_md_cell(c) for c in cells) + " |\n")
+        else:
+            chunk.append(f"  {idx}. {row['issue_name'] or 'Unnamed Issue'}\n")
+            chunk.append(f"     Status: {row['status'] or 'Unresolved'}\n")
+            chunk.append(f"     Priority: {_report_priority(row)}\n")
+            chunk.append(f"     Computer: {row['computer_number'] or 'N/A'}\n")
+            chunk.append(f"     Device: {row['device_type'] or 'N/A'}\n")
+            chunk.append(f"     Category: {row['category'] or 'N/A'}\n")
+            chunk.append(f"     Description: {row['description'] or 'N/A'}\n")
+            chunk.append(f"     Resolution: {row['resolution'] or 'No Resolution Provided'}\n")
+            chunk.append("-" * 40 + "\n\n")
+
+    if chunk:
+        yield "".join(chunk)
+    else:
+        yield "No known issues reported for any stores at this time.\n"
+
+
+def _snapshot_manifest_path() -> str:
+    return os.path.join(REPORT_SNAPSHOT_DIR, "known-issues-latest.json")
+
+
+def load_snapshot_manifest() -> dict:
+    """{fmt: {"file", "sha256", "generated_at", "date"}} for the latest snapshots."""
+    try:
+        with open(_snapshot_manifest_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def snapshots_written_since(manifest: dict, since: datetime) -> bool:
+    """Was every report format snapshotted at or after `since`?"""
+    return all(
+        fmt in manifest and datetime.fromisoformat(manifest[fmt]["generated_at"]) >= since
+        for fmt in REPORT_FORMATS
+    )
+
+
+@contextmanager
+def report_snapshot_lock(wait: bool = True):
+    """
+    Hold REPORT_SNAPSHOT_LOCK_ID on a pooled connection, so only one worker
+    writes snapshots at a time. Yields that connection, or None if wait is
+    False and another worker holds the lock.
+    """
+    with STORAGE.session() as conn:
+        cur = conn.cursor()
+        if wait:
+            cur.execute("SELECT pg_advisory_lock(%s);", (REPORT_SNAPSHOT_LOCK_ID,))
+        else:
+            cur.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (REPORT_SNAPSHOT_LOCK_ID,))
+            if not cur.fetchone()["locked"]:
+                yield None
+                return
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s);", (REPORT_SNAPSHOT_LOCK_ID,))
+
+
+def write_known_issues_snapshots(conn) -> dict:
+    """
+    Render every report format to REPORT_SNAPSHOT_DIR, reading through conn,
+    which must hold report_snapshot_lock(). Files are named by content hash,
+    so an unchanged report reuses the existing file and the hash doubles as
+    the download ETag. Returns the new manifest.
+    """
+    os.makedirs(REPORT_SNAPSHOT_DIR, exist_ok=True)
+    manifest = load_snapshot_manifest()  # under the lock: the latest one
+    now = datetime.now(timezone.utc)
+
+    for fmt in REPORT_FORMATS:
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(REPORT_SNAPSHOT_DIR, f".known-issues-{os.getpid()}.{fmt}.tmp")
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            for chunk in render_known_issues(iter_known_issue_rows(conn), fmt):
+                f.write(chunk)
+                digest.update(chunk.encode("utf-8"))
+        conn.rollback()  # end the read transaction behind the named cursor
+
+        sha = digest.hexdigest()
+        filename = f"known-issues-{sha[:16]}.{fmt}"
+        final_path = os.path.join(REPORT_SNAPSHOT_DIR, filename)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, final_path)
+
+        previous = manifest.get(fmt)
+        manifest[fmt] = {
+            "file": filename,
+            "sha256": sha,
+            "generated_at": now.isoformat(),
+            "date": now.date().isoformat(),
+        }
+        if previous and previous.get("file") != filename:
+            try:
+                os.remove(os.path.join(REPORT_SNAPSHOT_DIR, previous["file"]))
+            except OSError:
+                pass
+
+    tmp_manifest = _snapshot_manifest_path() + f".{os.getpid()}.tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, _snapshot_manifest_path())
+    return manifest
+
+
+def snapshot_known_issues_if_due() -> bool:
+    """Write the nightly snapshots once per UTC day, after REPORT_SNAPSHOT_HOUR_UTC."""
+    now = datetime.now(timezone.utc)
+    if now.hour < REPORT_SNAPSHOT_HOUR_UTC:
+        return False
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if snapshots_written_since(load_snapshot_manifest(), today):
+        return False
+
+    with report_snapshot_lock(wait=False) as conn:
+        if conn is None:
+            return False
+        # Checked again under the lock: another worker may have just written them
+        if snapshots_written_since(load_snapshot_manifest(), today):
+            return False
+        write_known_issues_snapshots(conn)
+    return True
+
+
+def start_maintenance():
+    """
+    Every MAINTENANCE_INTERVAL_SECONDS on a daemon thread: keep issue_events
+    partitions ISSUE_EVENTS_MONTHS_AHEAD months ahead, write the nightly
+    known issues report snapshots when due and delete stale job uploads. Runs whether or not this process
+    archives, so long-lived workers never write events into months that have
+    no partition and snapshots do not stop when archiving is turned off.
+    """
+    if MAINTENANCE_INTERVAL_SECONDS <= 0:
+        return
+
+    def loop():
+        while True:
+            time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+            try:
+                with STORAGE.session() as conn:
+                    cur = conn.cursor()
+                    ensure_event_partitions(cur)
+                    conn.commit()
+                    cur.close()
+            except Exception:
+                logging.exception("Creating issue_events partitions failed")
+
+            try:
+                if snapshot_known_issues_if_due():
+                    logging.info("Wrote nightly known issues report snapshots")
+            except Exception:
+                logging.exception("Writing known issues report snapshots failed")
+
+            try:
+                purged = purge_stale_job_uploads()
+                if purged:
+                    logging.info("Deleted %s stale job uploads", purged)
+            except Exception:
+                logging.exception("Deleting stale job uploads failed")
+
+    threading.Thread(target=loop, name="db-maintenance", daemon=True).start()
+
+
+def start_archiver():
+    """Run archive_resolved_issues every ARCHIVE_INTERVAL_SECONDS on a daemon thread."""
+    if ARCHIVE_INTERVAL_SECONDS <= 0:
+        return
+
+    def loop():
+        while True:
+            time.sleep(ARCHIVE_INTERVAL_SECONDS)
+            try:
+                moved = archive_resolved_issues()
+                if moved:
+                    logging.info("Archived %d resolved issue(s)", moved)
+            except Exception:
+                logging.exception("Archiving resolved issues failed")
+
+    threading.Thread(target=loop, name="issue-archiver", daemon=True).start()
+
+
+# -----------------------------------------
+#        LOGIN TIMESTAMPS (write-behind)
+# -----------------------------------------
+
+def record_login(email: str) -> None:
+    """Buffer a successful login; flush_login_buffer() writes it to users."""
+    with _login_buffer_lock:
+        _login_buffer[email.lower()] = datetime.now(timezone.utc)
+
+
+def effective_last_login(email: str, db_value):
+    """
+    last_login_at as this worker knows it: the stored value, or a newer
+    login still waiting in the buffer. Other workers flush within
+    LOGIN_FLUSH_SECONDS, far inside the quick-login window.
+    """
+    with _login_buffer_lock:
+        buffered = _login_buffer.get(email.lower())
+    if buffered is None:
+        return db_value
+    if db_value is None:
+        return buffered
+    return max(db_value, buffered)
+
+
+def flush_login_buffer() -> int:
+    """Write all buffered login times in one UPDATE. Returns rows flushed."""
+    global _login_buffer
+    with _login_buffer_lock:
+        pending, _login_buffer = _login_buffer, {}
+    if not pending:
+        return 0
+
+    try:
+        STORAGE.record_logins(pending)
+    except Exception:
+        # Put the entries back (keeping any newer login) for the next flush
+        with _login_buffer_lock:
+            for email, ts in pending.items():
+                if email not in _login_buffer or _login_buffer[email] < ts:
+                    _login_buffer[email] = ts
+        raise
+    return len(pending)
+
+
+def start_login_flusher():
+    """Flush buffered logins every LOGIN_FLUSH_SECONDS, and once more at exit."""
+    def loop():
+        while True:
+            time.sleep(LOGIN_FLUSH_SECONDS)
+            try:
+                flush_login_buffer()
+            except Exception:
+                logging.exception("Flushing login timestamps failed")
+
+    threading.Thread(target=loop, name="login-flusher", daemon=True).start()
+    atexit.register(flush_login_buffer)
+
+
+# -----------------------------------------
+#          ISSUE SEARCH CACHE
+# -----------------------------------------
+
+class IssueSearchCache:
+    """
+    Per-worker LRU + TTL cache of /issues/search results.
+
+    Entries are tagged with the generation current when their query
+    started. A trigger NOTIFYs 'issues_changed' on every write to issues;
+    the listener thread bumps the generation, so older entries stop
+    matching. While the listener is disconnected the cache is bypassed,
+    since invalidations could be missed. The SQLite backend has no listener,
+    so there it is never enabled.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self.listening = False
+        self._entries = OrderedDict()  # key -> (generation, expires_at, rows)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.listening
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == self.generation and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[2]
+            if entry:
+                del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, generation: int, rows) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return  # issues changed while the query ran
+            self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "generation": self.generation,
+                "listening": self.listening,
+            }
+
+
+issue_search_cache = IssueSearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL_SECONDS)
+
+
+class StaleReadCache:
+    """
+    Last good response body of the STALE_READ_ENDPOINTS, per path and query
+    string, kept so they can still answer while the database breaker is open.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # full path -> (body, mimetype, stored_at)
+        self.served = 0
+
+    def put(self, key, body: bytes, mimetype: str):
+        with self._lock:
+            self._entries[key] = (body, mimetype, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def response(self, key):
+        """A stale Response for key, or None when nothing was cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.served += 1
+        body, mimetype, stored_at = entry
+        response = Response(body, mimetype=mimetype)
+        response.headers["Age"] = str(int(time.time() - stored_at))
+        response.headers["Warning"] = '110 - "Response is Stale"'
+        response.headers["X-Stale"] = "1"
+        return response
+
+
+stale_reads = StaleReadCache(STALE_READ_CACHE_SIZE)
+
+
+def client_disconnect_probe():
+    """
+    disconnected() -> bool for the current request's client socket, or None
+    when the server does not expose it (gunicorn and the Werkzeug dev server do).
+    """
+    sock = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    if sock is None:
+        return None
+
+    def disconnected():
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            # Readable with nothing to read means the peer closed the connection
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+        except ValueError:
+            return False  # e.g. TLS sockets cannot peek; assume still connected
+        except OSError:
+            return True
+
+    return disconnected
+
+
+def database_unavailable_response(retry_after: float):
+    """Stale copy for STALE_READ_ENDPOINTS if one exists, else 503 + Retry-After."""
+    if request.endpoint in STALE_READ_ENDPOINTS:
+        stale = stale_reads.response(request.full_path)
+        if stale is not None:
+            return stale
+    response = jsonify({"error": "Database temporarily unavailable, retry later"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def start_issue_change_listener():
+    """
+    LISTEN for issues_changed and invalidate the search cache. The listener
+    holds its connection for good, so it has one of its own outside the pool.
+    """
+    if SEARCH_CACHE_SIZE <= 0:
+        return
+
+    def loop():
+        while True:
+            conn = None
+            try:
+                conn = STORAGE.connect()
+                conn.autocommit = True
+                conn.cursor().execute("LISTEN issues_changed;")
+                # Anything cached before (re)connecting may have missed a notify
+                issue_search_cache.invalidate()
+                issue_search_cache.listening = True
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        conn.cursor().execute("SELECT 1;")  # keep-alive, surfaces dead sockets
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        issue_search_cache.invalidate()
+            except Exception:
+                logging.exception("Issue change listener lost its connection")
+            issue_search_cache.listening = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            time.sleep(5)
+
+    threading.Thread(target=loop, name="issue-change-listener", daemon=True).start()
+
+
+# -----------------------------------------
+#               JOB QUEUE
+# -----------------------------------------
+
+class JobContext:
+    """Handed to job handlers so long tasks can report progress."""
+
+    def __init__(self, job_id: int, last_attempt: bool = False):
+        self.job_id = job_id
+        self.last_attempt = last_attempt  # a failure now will not be retried
+
+    def progress(self, percent: int, message: str | None = None):
+        """Record progress (0-100) and refresh the lease heartbeat."""
+        STORAGE.set_job_progress(self.job_id, percent, message)
+
+
+def stage_job_upload(upload) -> str:
+    """Stream an uploaded file into JOB_UPLOAD_DIR; returns the name to put in a job payload."""
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="device_import_", suffix=".csv", dir=JOB_UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            upload.save(f)
+    except Exception:
+        os.remove(path)
+        raise
+    return os.path.basename(path)
+
+
+def job_upload_path(name: str) -> str:
+    """Path of a staged upload; rejects names that would leave JOB_UPLOAD_DIR."""
+    if not name or os.path.basename(name) != name:
+        raise ValueError(f"Invalid upload reference '{name}'")
+    return os.path.join(JOB_UPLOAD_DIR, name)
+
+
+def discard_job_upload(name: str) -> None:
+    try:
+        os.remove(job_upload_path(name))
+    except (OSError, ValueError):
+        pass
+
+
+def purge_stale_job_uploads() -> int:
+    """Delete staged uploads older than JOB_UPLOAD_MAX_AGE_DAYS (e.g. from crashed workers)."""
+    cutoff = time.time() - JOB_UPLOAD_MAX_AGE_DAYS * 86400
+    removed = 0
+    try:
+        entries = list(os.scandir(JOB_UPLOAD_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _job_device_import(payload: dict, ctx: JobContext):
+    upload = payload.get("upload", "")
+    path = job_upload_path(upload)
+    try:
+        ctx.progress(10, "Merging inventory")
+        with STORAGE.session() as conn, open(path, encoding="utf-8-sig", newline="") as f:
+            report = bulk_upsert_devices(
+                conn,
+                f,
+                dry_run=bool(payload.get("dry_run")),
+                prune=bool(payload.get("prune")),
+            )
+    except Exception as e:
+        # Keep the file while a retry may still need it
+        if ctx.last_attempt or isinstance(e, JOB_PERMANENT_ERRORS):
+            discard_job_upload(upload)
+        raise
+    discard_job_upload(upload)
+    return report
+
+
+def _job_known_issues_snapshot(payload: dict, ctx: JobContext):
+    with report_snapshot_lock() as conn:
+        return write_known_issues_snapshots(conn)
+
+
+def _job_archive_resolved(payload: dict, ctx: JobContext):
+    days = int(payload.get("older_than_days", ARCHIVE_AFTER_DAYS))
+    return {"moved": archive_resolved_issues(older_than_days=days)}
+
+
+def _job_rebuild_store_issue_counts(payload: dict, ctx: JobContext):
+    with STORAGE.session() as conn:
+        cur = conn.cursor()
+        rebuild_store_issue_counts(cur)
+        conn.commit()
+        cur.execute("SELECT COUNT(*) AS n FROM store_issue_counts;")
+        return {"counter_rows": cur.fetchone()["n"]}
 
-    # ======================
-    # One Time Updates
-    # ======================
 
+# kind -> handler(payload, ctx). The return value is stored as the job result.
+JOB_HANDLERS = {
+    "device_import": _job_device_import,
+    "known_issues_snapshot": _job_known_issues_snapshot,
+    "archive_resolved": _job_archive_resolved,
+    "rebuild_store_issue_counts": _job_rebuild_store_issue_counts,
+}
 
 
-    conn.commit()
-    cur.close()
-    conn.close()
+def enqueue_job(kind: str, payload: dict | None = None,
+                max_attempts: int = JOB_DEFAULT_MAX_ATTEMPTS, created_by: str | None = None) -> int:
+    """Queue a job (in the caller's STORAGE.transaction(), if any); returns the job id."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    return STORAGE.insert_job(kind, payload, max_attempts, created_by)
 
-# ------------------------
-# PASSWORD HASHING
-# ------------------------
-def hash_secret(plain: str) -> str:
-    """Hash a password or PIN using bcrypt."""
-    salt = bcrypt.gensalt(rounds=12)
-    hashed = bcrypt.hashpw(plain.encode("utf-8"), salt)
-    return hashed.decode("utf-8")
-#SECRET MEANS LIKE A PASSWORD OR PIN IT'S LIKE AN AUTH KEY
 
-def verify_secret(plain: str, stored_hash: str) -> bool:
-    """Check if plain password/PIN matches stored bcrypt hash."""
-    if not stored_hash:
-        return False
+def run_job(job) -> None:
+    """
+    Run one claimed job and record success, a scheduled retry or failure.
+    JOB_PERMANENT_ERRORS fail the job without retrying. The outcome is only
+    written while this worker still holds the job, so a run whose lease
+    expired cannot overwrite the retry that replaced it.
+    """
+    handler = JOB_HANDLERS.get(job["kind"])
+    done = threading.Event()
+
+    def heartbeat():
+        # Keep the lease alive for handlers that never report progress
+        while not done.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                STORAGE.touch_job(job["id"], job["locked_by"])
+            except Exception:
+                logging.exception("Job %s heartbeat failed", job["id"])
+
+    threading.Thread(target=heartbeat, name=f"job-{job['id']}-heartbeat", daemon=True).start()
     try:
-        return bcrypt.checkpw(plain.encode("utf-8"), stored_hash.encode("utf-8"))
-    except ValueError:
-        return False
+        if handler is None:
+            raise ValueError(f"No handler for job kind '{job['kind']}'")
+        ctx = JobContext(job["id"], last_attempt=job["attempts"] >= job["max_attempts"])
+        result = handler(job["payload"] or {}, ctx)
+        error, permanent = None, False
+    except Exception as e:
+        logging.exception("Job %s (%s) failed", job["id"], job["kind"])
+        result, error = None, f"{type(e).__name__}: {e}"
+        permanent = isinstance(e, JOB_PERMANENT_ERRORS)
+    finally:
+        done.set()
 
+    if error is None:
+        STORAGE.finish_job(job["id"], job["locked_by"], result)
+    else:
+        STORAGE.fail_job(job["id"], job["locked_by"], error, permanent, JOB_RETRY_BASE_SECONDS)
 
-SPECIAL_CHARS = set('!@#$%^&*":><')
 
+def run_job_worker(worker_id: str | None = None, once: bool = False) -> None:
+    """
+    Worker loop (see job_worker.py): requeue stale jobs, claim one, run it.
+    Sleeps JOB_POLL_SECONDS when the queue is empty. With once=True, returns
+    after the queue has been drained.
+    """
+    worker_id = worker_id or f"{os.uname().nodename}:{os.getpid()}"
+    logging.info("Job worker %s started", worker_id)
 
-def check_password_policy(password: str, username: str):
-    """Return (ok: bool, errors: list[str]) based on your rules."""
-    errors = []
+    while True:
+        job = STORAGE.claim_job(worker_id, JOB_LEASE_SECONDS)
+        if job is None:
+            if once:
+                return
+            time.sleep(JOB_POLL_SECONDS)
+            continue
 
-    if len(password) < 8:
-        errors.append("Password must be at least 8 characters long.")
-    if password.lower() == username.lower():
-        errors.append("Password cannot be the same as your username.")
-    if not any(ch.isupper() for ch in password):
-        errors.append("Password must contain at least one uppercase letter.")
-    if not any(ch.islower() for ch in password):
-        errors.append("Password must contain at least one lowercase letter.")
-    if not any(ch.isdigit() for ch in password):
-        errors.append("Password must contain at least one number.")
-    if not any(ch in SPECIAL_CHARS for ch in password):
-        errors.append("Password must contain at least one special character (! @ # $ % ^&*\":><).")
+        logging.info("Running job %s (%s), attempt %s", job["id"], job["kind"], job["attempts"])
+        run_job(job)
 
-    return len(errors) == 0, errors
 
+# -----------------------------------------
+#             ENDPOINTS
+# -----------------------------------------
 
-def check_pin_policy(pin: str):
-    """Simple PIN rule: 4–6 digits only."""
-    if not pin.isdigit():
-        return False, "PIN must contain only digits."
-    if not (4 <= len(pin) <= 6):
-        return False, "PIN must be between 4 and 6 digits."
-    if len(set(pin)) == 1:
-        return False, "PIN cannot be all one digit (e.g., 0000, 1111)."
 
-        
-    return True, None
+@app.before_request
+def require_postgres_features():
+    """On the SQLite backend, only the core endpoints (SQLITE_ENDPOINTS) are served."""
+    if USE_SQLITE and request.endpoint and request.endpoint not in SQLITE_ENDPOINTS:
+        return jsonify({"error": "This endpoint needs the Postgres backend"}), 501
 
 
-def load_stores():
+@app.before_request
+def guard_database():
     """
-    Load store metadata from the Postgres `stores` table and return it in the
-    legacy Stores.json structure, keyed by store name.
+    Fail fast while the database breaker is open, and scope this request's
+    queries: per-endpoint statement timeout plus cancellation if the client
+    disconnects.
     """
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT
-            store_number,
-            store_name,
-            type,
-            state,
-            num_comp,
-            address,
-            city,
-            zip,
-            phone,
-            kiosk
-        FROM stores
-        ORDER BY store_number;
-        """
+    if USE_SQLITE or request.endpoint is None or request.endpoint in DB_FREE_ENDPOINTS:
+        return None
+
+    retry_after = STORAGE.breaker.retry_after()
+    if retry_after > 0:
+        return database_unavailable_response(retry_after)
+
+    STORAGE.begin_request(
+        ENDPOINT_STATEMENT_TIMEOUT_MS.get(request.endpoint, DB_STATEMENT_TIMEOUT_MS),
+        client_disconnect_probe(),
+        use_replica=request.endpoint in READ_REPLICA_ENDPOINTS,
+        min_lsn=client_lsn_token(),
     )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    stores_legacy = {}
-    for row in rows:
-        legacy = db_store_row_to_legacy(row)
-        # Legacy structure used store name as the key
-        stores_legacy[legacy["Store Name"]] = legacy
+    return None
 
-    return stores_legacy
 
+def client_lsn_token() -> str | None:
+    """The client's last-write WAL position (header wins over cookie), if well-formed."""
+    token = (request.headers.get(LSN_HEADER) or request.cookies.get(LSN_COOKIE) or "").strip()
+    return token if LSN_PATTERN.match(token) else None
 
 
-def db_store_row_to_legacy(row):
+@app.after_request
+def route_reads_after_writes(response):
     """
-    Adapt a row from the `stores` DB table into the legacy Stores.json structure.
-    This keeps older client code working without caring that the backend changed.
+    After a successful write, hand the client the primary's WAL position so
+    its next reads wait for (or skip) a replica that has not replayed it.
     """
-    return {
-        "Store Number": row["store_number"],
-        "Store Name": row["store_name"],
-        "State": row.get("state"),
-        "Type": row.get("type"),
-        "Computers": row.get("num_comp"),
-        "Address": row.get("address"),
-        "City": row.get("city"),
-        "ZIP": row.get("zip"),
-        "Phone": row.get("phone"),
-        "Kiosk Type": row.get("kiosk"),
-        # Legacy structure kept issues inside each store; issues now live in a
-        # separate table, so this is left as an empty list for compatibility.
-        "Known Issues": row.get("Known Issues", []),
-    }
+    if STORAGE.request_settings.source:
+        response.headers["X-DB-Source"] = STORAGE.request_settings.source
+    if (
+        not STORAGE.has_replica
+        or request.method in ("GET", "HEAD", "OPTIONS")
+        or response.status_code >= 400
+        or request.endpoint in DB_FREE_ENDPOINTS
+        or request.endpoint in READ_REPLICA_ENDPOINTS  # read-only, even when POSTed
+    ):
+        return response
+    try:
+        lsn = STORAGE.current_lsn()
+    except Exception:
+        logging.exception("Reading the primary WAL position failed")
+        return response
+    response.headers[LSN_HEADER] = lsn
+    response.set_cookie(LSN_COOKIE, lsn, max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite="Lax")
+    return response
 
 
-# -----------------------------------------
-#             ENDPOINTS
-# -----------------------------------------
+@app.after_request
+def remember_stale_reads(response):
+    if (
+        request.endpoint in STALE_READ_ENDPOINTS
+        and response.status_code == 200
+        and "X-Stale" not in response.headers
+        and not response.is_streamed
+    ):
+        stale_reads.put(request.full_path, response.get_data(), response.mimetype)
+    return response
+
+
+@app.teardown_request
+def end_database_request(exc):
+    STORAGE.end_request()
+
+
+@app.errorhandler(DatabaseUnavailable)
+def handle_database_unavailable(e):
+    return database_unavailable_response(e.retry_after)
+
+
+@app.errorhandler(ClientDisconnected)
+def handle_client_disconnected(e):
+    # Nobody is listening; 499 is what nginx logs for this
+    return jsonify({"error": str(e)}), 499
+
+
+@app.errorhandler(psycopg2.extensions.QueryCanceledError)
+def handle_statement_timeout(e):
+    return jsonify({"error": "Database query timed out"}), 504
+
+
+@app.errorhandler(psycopg2.OperationalError)
+def handle_database_down(e):
+    if not is_transient_db_error(e):
+        # Bad credentials, missing database...: retrying will not help
+        logging.exception("Database error")
+        return jsonify({"error": "Database error"}), 500
+    return database_unavailable_response(STORAGE.breaker.retry_after() or 1)
 
 
 @app.get("/")
@@ -317,42 +2222,111 @@ def get_stores():
         "ZIP": "...",
         "Phone": "...",
         "Kiosk Type": "...",
-        "Known Issues": []
+        "Issue Counts": {
+          "total": 4,
+          "open": 3,
+          "by_status": {"Unresolved": 2, "In Progress": 1, "Resolved": 1},
+          "open_by_priority": {"Critical": 1, "Functional": 2}
+        }
       },
       ...
     }
     """
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT
-            store_number,
-            store_name,
-            type,
-            state,
-            num_comp,
-            address,
-            city,
-            zip,
-            phone,
-            kiosk
-        FROM stores
-        ORDER BY store_number;
-        """
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    rows = STORAGE.list_stores()
+    # Counts change with every issue write, so they are always read live
+    issue_counts = summarize_issue_counts(STORAGE.issue_count_rows())
 
     stores_legacy = {}
     for row in rows:
-        legacy = db_store_row_to_legacy(row)
+        legacy = db_store_row_to_legacy(row, issue_counts.get(row["store_number"]))
         # Legacy structure keyed by store name, just like Stores.json was
         stores_legacy[legacy["Store Name"]] = legacy
 
     return jsonify(stores_legacy)
 
+
+@app.get("/stores/lookup")
+def lookup_stores():
+    """
+    Ranked store lookup for search boxes and typeahead.
+
+    Query params:
+      q=123            store number prefix, ZIP prefix, name or city text
+      limit=10         optional, max 50
+
+    Ranking: exact store number, then number prefix, ZIP prefix, name
+    prefix, name substring, city, then fuzzy (trigram) name/city matches
+    (Postgres with pg_trgm only).
+
+    Returns:
+      {"query": "...", "matches": [ {legacy store dict + "Score": 100}, ... ]}
+    """
+    q = " ".join((request.args.get("q") or "").split())
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+
+    try:
+        limit = int(request.args.get("limit", STORE_LOOKUP_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, STORE_LOOKUP_MAX_LIMIT))
+
+    # Fuzzy (trigram) matches need pg_trgm, so never on SQLite
+    rows = STORAGE.lookup_stores(q, limit, fuzzy=TRGM_AVAILABLE)
+    issue_counts = summarize_issue_counts(
+        STORAGE.issue_count_rows([r["store_number"] for r in rows])
+    )
+
+    matches = []
+    for row in rows:
+        legacy = db_store_row_to_legacy(row, issue_counts.get(row["store_number"]))
+        legacy["Score"] = round(float(row["score"]), 1)
+        matches.append(legacy)
+
+    return jsonify({"query": q, "matches": matches}), 200
+
+
+@app.get("/stores/<int:store_number>/dashboard")
+def get_store_dashboard(store_number):
+    """
+    Everything a store screen needs in one request:
+    store metadata (legacy shape), devices grouped by device_category, and the
+    store's open issues.
+
+    Returns:
+      {
+        "store": {"Store Number": 123, "Store Name": "...", ...},
+        "devices": {"computers": [{device row...}, ...], "printers": [...]},
+        "device_count": 7,
+        "open_issues": [{issue row...}, ...]
+      }
+
+    Responses carry an ETag. A fingerprint of the store row, its devices
+    and its open issues' versions is checked first, so a matching
+    If-None-Match gets a 304 without building the payload.
+    """
+    etag, row = STORAGE.store_dashboard(store_number, request.if_none_match)
+    if row is None:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    if not row["store"]:
+        return jsonify({"error": f"No store found with number {store_number}"}), 404
+
+    store = db_store_row_to_legacy(row["store"])
+    store.pop("Issue Counts")  # open_issues below is the authoritative list
+
+    response = jsonify({
+        "store": store,
+        "devices": row["devices"],
+        "device_count": row["device_count"],
+        "open_issues": row["open_issues"],
+    })
+    response.set_etag(etag)
+    return response, 200
+
+
 @app.post("/auth/register")
 def auth_register():
     """
@@ -398,29 +2372,8 @@ def auth_register():
     pw_hash = hash_secret(password)
     pin_hash = hash_secret(pin)
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-
     # Upsert-like behavior: if email exists, update; otherwise insert.
-    cur.execute(
-        """
-        INSERT INTO users (email, username, password_hash, pin_hash, has_password, has_pin)
-        VALUES (%s, %s, %s, %s, TRUE, TRUE)
-        ON CONFLICT (email)
-        DO UPDATE SET
-            username = EXCLUDED.username,
-            password_hash = EXCLUDED.password_hash,
-            pin_hash = EXCLUDED.pin_hash,
-            has_password = TRUE,
-            has_pin = TRUE,
-            updated_at = NOW();
-        """,
-        (email.lower(), username_norm, pw_hash, pin_hash),
-    )
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    STORAGE.upsert_user(email.lower(), username_norm, pw_hash, pin_hash)
 
     return jsonify({"message": "User registered/updated successfully."}), 200
 
@@ -451,19 +2404,7 @@ def auth_login():
         return jsonify({"error": "email, username, password, and pin are required"}), 400
 
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT email, username, password_hash, pin_hash, has_password, has_pin
-        FROM users
-        WHERE email = %s;
-        """,
-        (email,),
-    )
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row = get_user_by_email(email)
 
     if not row:
         return jsonify({"error": "No user found with that email"}), 404
@@ -483,21 +2424,8 @@ def auth_login():
     if not verify_secret(pin, row["pin_hash"]):
         return jsonify({"error": "Unable to log in at this time"}), 401
 
-    #update last_login_at
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE users
-        SET last_login_at = NOW(),
-            updated_at = NOW()
-        WHERE email = %s;
-        """,
-        (email,),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    # last_login_at is written by the login flusher
+    record_login(email)
 
     # If we get here, everything is good
     return jsonify({"message": "Login successful"}), 200
@@ -525,19 +2453,7 @@ def auth_quick_login():
     if not username or not password:
         return jsonify({"error": "username and password are required"}), 400
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT email, username, password_hash, has_password, last_login_at
-        FROM users
-        WHERE username = %s;
-        """,
-        (username,),
-    )
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row = STORAGE.get_user_by_username(username)
 
     # Generic failure message to not leak info
     generic_error = {"error": "Unable to log in at this time", "require_full": True}
@@ -552,33 +2468,21 @@ def auth_quick_login():
     if not verify_secret(password, row["password_hash"]):
         return jsonify(generic_error), 401
 
-    last_login_at = row["last_login_at"]
+    # Include a login this worker has buffered but not yet flushed
+    last_login_at = effective_last_login(row["email"], row["last_login_at"])
     if last_login_at is None:
         # Never logged in before with full protocol
         return jsonify(generic_error), 401
 
     # Check if last_login_at is within the last 156 hours
     now = datetime.now(timezone.utc)
-    cutoff = now - timedelta(hours=156)
+    cutoff = now - timedelta(hours=QUICK_LOGIN_WINDOW_HOURS)
     if last_login_at < cutoff:
         # Too old, require full login
         return jsonify(generic_error), 401
 
-    # Quick login OK – refresh last_login_at
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE users
-        SET last_login_at = NOW(),
-            updated_at = NOW()
-        WHERE username = %s;
-        """,
-        (username,),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Quick login OK – refresh last_login_at (written by the login flusher)
+    record_login(row["email"])
 
     is_admin = is_trusted_admin_email(row["email"])
 
@@ -620,19 +2524,7 @@ def auth_change_password():
         ), 400
 
     # Look up user
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT email, username, password_hash, pin_hash, has_password, has_pin
-        FROM users
-        WHERE email = %s;
-        """,
-        (email,),
-    )
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row = get_user_by_email(email)
 
     if not row:
         return jsonify({"error": "Unable to change password at this time"}), 401
@@ -663,21 +2555,7 @@ def auth_change_password():
     # Hash and update
     new_pw_hash = hash_secret(new_password)
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE users
-        SET password_hash = %s,
-            has_password = TRUE,
-            updated_at = NOW()
-        WHERE email = %s;
-        """,
-        (new_pw_hash, email),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    STORAGE.set_user_password(email, new_pw_hash)
 
     return jsonify({"message": "Password changed successfully"}), 200
 
@@ -713,19 +2591,7 @@ def auth_change_pin():
             {"error": "email, username, password, current_pin, and new_pin are required"}
         ), 400
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT email, username, password_hash, pin_hash, has_password, has_pin
-        FROM users
-        WHERE email = %s;
-        """,
-        (email,),
-    )
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row = get_user_by_email(email)
 
     if not row:
         return jsonify({"error": "Unable to change PIN at this time"}), 401
@@ -754,21 +2620,7 @@ def auth_change_pin():
     # Hash and update
     new_pin_hash = hash_secret(new_pin)
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE users
-        SET pin_hash = %s,
-            has_pin = TRUE,
-            updated_at = NOW()
-        WHERE email = %s;
-        """,
-        (new_pin_hash, email),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    STORAGE.set_user_pin(email, new_pin_hash)
 
     return jsonify({"message": "PIN changed successfully"}), 200
 
@@ -801,28 +2653,24 @@ def admin_verify():
         return jsonify({"ok": False, "error": "Email is not a trusted admin."}), 403
 
     try:
-        conn = get_db_conn()
+        user = get_user_by_email(email)
     except Exception as e:
         return jsonify({"ok": False, "error": f"Database error: {e}"}), 500
 
-    try:
-        user = get_user_by_email(conn, email)
-        if not user:
-            return jsonify({"ok": False, "error": "Admin user not found."}), 404
+    if not user:
+        return jsonify({"ok": False, "error": "Admin user not found."}), 404
 
-        if not user.get("has_password") or not user.get("password_hash"):
-            return jsonify({"ok": False, "error": "Admin password not set."}), 403
-        if not user.get("has_pin") or not user.get("pin_hash"):
-            return jsonify({"ok": False, "error": "Admin PIN not set."}), 403
+    if not user.get("has_password") or not user.get("password_hash"):
+        return jsonify({"ok": False, "error": "Admin password not set."}), 403
+    if not user.get("has_pin") or not user.get("pin_hash"):
+        return jsonify({"ok": False, "error": "Admin PIN not set."}), 403
 
-        if not verify_secret(password, user["password_hash"]):
-            return jsonify({"ok": False, "error": "Invalid password."}), 403
-        if not verify_secret(pin, user["pin_hash"]):
-            return jsonify({"ok": False, "error": "Invalid PIN."}), 403
+    if not verify_secret(password, user["password_hash"]):
+        return jsonify({"ok": False, "error": "Invalid password."}), 403
+    if not verify_secret(pin, user["pin_hash"]):
+        return jsonify({"ok": False, "error": "Invalid PIN."}), 403
 
-        return jsonify({"ok": True, "message": "Admin verified."}), 200
-    finally:
-        conn.close()
+    return jsonify({"ok": True, "message": "Admin verified."}), 200
 
 
 @app.post("/admin/users")
@@ -848,45 +2696,25 @@ def admin_users():
     if not is_trusted_admin_email(admin_email):
         return jsonify({"error": "Email is not a trusted admin."}), 403
 
-    try:
-        conn = get_db_conn()
-    except Exception as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-
-    try:
-        admin_user = get_user_by_email(conn, admin_email)
-        if not admin_user:
-            return jsonify({"error": "Admin user not found."}), 404
+    admin_user = get_user_by_email(admin_email)
+    if not admin_user:
+        return jsonify({"error": "Admin user not found."}), 404
 
-        if not admin_user.get("has_password") or not admin_user.get("password_hash"):
-            return jsonify({"error": "Admin password not set."}), 403
-        if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
-            return jsonify({"error": "Admin PIN not set."}), 403
+    if not admin_user.get("has_password") or not admin_user.get("password_hash"):
+        return jsonify({"error": "Admin password not set."}), 403
+    if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
+        return jsonify({"error": "Admin PIN not set."}), 403
 
-        if not verify_secret(admin_password, admin_user["password_hash"]):
-            return jsonify({"error": "Invalid admin password."}), 403
-        if not verify_secret(admin_pin, admin_user["pin_hash"]):
-            return jsonify({"error": "Invalid admin PIN."}), 403
+    if not verify_secret(admin_password, admin_user["password_hash"]):
+        return jsonify({"error": "Invalid admin password."}), 403
+    if not verify_secret(admin_pin, admin_user["pin_hash"]):
+        return jsonify({"error": "Invalid admin PIN."}), 403
 
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT
-                id,
-                username,
-                email,
-                has_password,
-                has_pin,
-                last_login_at
-            FROM users
-            ORDER BY email ASC;
-            """
-        )
-        users = cur.fetchall()
+    users = STORAGE.list_users()
+    for user in users:
+        user["last_login_at"] = effective_last_login(user["email"], user["last_login_at"])
 
-        return jsonify({"users": users}), 200
-    finally:
-        conn.close()
+    return jsonify({"users": users}), 200
 
 
 @app.post("/admin/change-user-password")
@@ -916,64 +2744,45 @@ def admin_change_user_password():
     if not is_trusted_admin_email(admin_email):
         return jsonify({"error": "Email is not a trusted admin."}), 403
 
-    try:
-        conn = get_db_conn()
-    except Exception as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-
-    try:
-        # Verify admin
-        admin_user = get_user_by_email(conn, admin_email)
-        if not admin_user:
-            return jsonify({"error": "Admin user not found."}), 404
-
-        if not admin_user.get("has_password") or not admin_user.get("password_hash"):
-            return jsonify({"error": "Admin password not set."}), 403
-        if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
-            return jsonify({"error": "Admin PIN not set."}), 403
-
-        if not verify_secret(admin_password, admin_user["password_hash"]):
-            return jsonify({"error": "Invalid admin password."}), 403
-        if not verify_secret(admin_pin, admin_user["pin_hash"]):
-            return jsonify({"error": "Invalid admin PIN."}), 403
-
-        # Get target user
-        target_user = get_user_by_email(conn, target_email)
-        if not target_user:
-            return jsonify({"error": "Target user not found."}), 404
-
-        # Check password policy using target's username
-        ok_pw, pw_errors = check_password_policy(
-            new_password, target_user["username"]
-        )
-        if not ok_pw:
-            return jsonify(
-                {
-                    "error": "New password does not meet requirements",
-                    "details": pw_errors,
-                }
-            ), 400
+    # Verify admin
+    admin_user = get_user_by_email(admin_email)
+    if not admin_user:
+        return jsonify({"error": "Admin user not found."}), 404
+
+    if not admin_user.get("has_password") or not admin_user.get("password_hash"):
+        return jsonify({"error": "Admin password not set."}), 403
+    if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
+        return jsonify({"error": "Admin PIN not set."}), 403
+
+    if not verify_secret(admin_password, admin_user["password_hash"]):
+        return jsonify({"error": "Invalid admin password."}), 403
+    if not verify_secret(admin_pin, admin_user["pin_hash"]):
+        return jsonify({"error": "Invalid admin PIN."}), 403
+
+    # Get target user
+    target_user = get_user_by_email(target_email)
+    if not target_user:
+        return jsonify({"error": "Target user not found."}), 404
+
+    # Check password policy using target's username
+    ok_pw, pw_errors = check_password_policy(
+        new_password, target_user["username"]
+    )
+    if not ok_pw:
+        return jsonify(
+            {
+                "error": "New password does not meet requirements",
+                "details": pw_errors,
+            }
+        ), 400
 
-        new_pw_hash = hash_secret(new_password)
+    new_pw_hash = hash_secret(new_password)
 
-        cur = conn.cursor()
-        cur.execute(
-            """
-            UPDATE users
-            SET password_hash = %s,
-                has_password = TRUE,
-                updated_at = NOW()
-            WHERE email = %s;
-            """,
-            (new_pw_hash, target_email),
-        )
-        conn.commit()
+    STORAGE.set_user_password(target_email, new_pw_hash)
 
-        return jsonify(
-            {"message": f"Password updated for {target_email}."}
-        ), 200
-    finally:
-        conn.close()
+    return jsonify(
+        {"message": f"Password updated for {target_email}."}
+    ), 200
 
 
 @app.post("/admin/change-user-pin")
@@ -1010,52 +2819,33 @@ def admin_change_user_pin():
             {"error": "New PIN does not meet requirements", "details": [pin_error]}
         ), 400
 
-    try:
-        conn = get_db_conn()
-    except Exception as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-
-    try:
-        # Verify admin
-        admin_user = get_user_by_email(conn, admin_email)
-        if not admin_user:
-            return jsonify({"error": "Admin user not found."}), 404
+    # Verify admin
+    admin_user = get_user_by_email(admin_email)
+    if not admin_user:
+        return jsonify({"error": "Admin user not found."}), 404
 
-        if not admin_user.get("has_password") or not admin_user.get("password_hash"):
-            return jsonify({"error": "Admin password not set."}), 403
-        if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
-            return jsonify({"error": "Admin PIN not set."}), 403
+    if not admin_user.get("has_password") or not admin_user.get("password_hash"):
+        return jsonify({"error": "Admin password not set."}), 403
+    if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
+        return jsonify({"error": "Admin PIN not set."}), 403
 
-        if not verify_secret(admin_password, admin_user["password_hash"]):
-            return jsonify({"error": "Invalid admin password."}), 403
-        if not verify_secret(admin_pin, admin_user["pin_hash"]):
-            return jsonify({"error": "Invalid admin PIN."}), 403
+    if not verify_secret(admin_password, admin_user["password_hash"]):
+        return jsonify({"error": "Invalid admin password."}), 403
+    if not verify_secret(admin_pin, admin_user["pin_hash"]):
+        return jsonify({"error": "Invalid admin PIN."}), 403
 
-        # Target user
-        target_user = get_user_by_email(conn, target_email)
-        if not target_user:
-            return jsonify({"error": "Target user not found."}), 404
+    # Target user
+    target_user = get_user_by_email(target_email)
+    if not target_user:
+        return jsonify({"error": "Target user not found."}), 404
 
-        new_pin_hash = hash_secret(new_pin)
+    new_pin_hash = hash_secret(new_pin)
 
-        cur = conn.cursor()
-        cur.execute(
-            """
-            UPDATE users
-            SET pin_hash = %s,
-                has_pin = TRUE,
-                updated_at = NOW()
-            WHERE email = %s;
-            """,
-            (new_pin_hash, target_email),
-        )
-        conn.commit()
+    STORAGE.set_user_pin(target_email, new_pin_hash)
 
-        return jsonify(
-            {"message": f"PIN updated for {target_email}."}
-        ), 200
-    finally:
-        conn.close()
+    return jsonify(
+        {"message": f"PIN updated for {target_email}."}
+    ), 200
 
 
 
@@ -1087,47 +2877,32 @@ def admin_delete_user():
     if admin_email == target_email:
         return jsonify({"error": "You cannot delete your own account."}), 400
 
-    try:
-        conn = get_db_conn()
-    except Exception as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-
-    try:
-        admin_user = get_user_by_email(conn, admin_email)
-        if not admin_user:
-            return jsonify({"error": "Admin user not found."}), 404
-
-        if not admin_user.get("has_password") or not admin_user.get("password_hash"):
-            return jsonify({"error": "Admin password not set."}), 403
-        if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
-            return jsonify({"error": "Admin PIN not set."}), 403
+    admin_user = get_user_by_email(admin_email)
+    if not admin_user:
+        return jsonify({"error": "Admin user not found."}), 404
 
-        if not verify_secret(admin_password, admin_user["password_hash"]):
-            return jsonify({"error": "Invalid admin password."}), 403
-        if not verify_secret(admin_pin, admin_user["pin_hash"]):
-            return jsonify({"error": "Invalid admin PIN."}), 403
+    if not admin_user.get("has_password") or not admin_user.get("password_hash"):
+        return jsonify({"error": "Admin password not set."}), 403
+    if not admin_user.get("has_pin") or not admin_user.get("pin_hash"):
+        return jsonify({"error": "Admin PIN not set."}), 403
 
-        cur = conn.cursor()
-        cur.execute(
-            "DELETE FROM users WHERE email = %s RETURNING email;",
-            (target_email,),
-        )
-        deleted = cur.fetchone()
-        conn.commit()
+    if not verify_secret(admin_password, admin_user["password_hash"]):
+        return jsonify({"error": "Invalid admin password."}), 403
+    if not verify_secret(admin_pin, admin_user["pin_hash"]):
+        return jsonify({"error": "Invalid admin PIN."}), 403
 
-        if not deleted:
-            return jsonify({"error": "Target user not found."}), 404
+    if not STORAGE.delete_user(target_email):
+        return jsonify({"error": "Target user not found."}), 404
 
-        return jsonify(
-            {"message": f"User {target_email} deleted."}
-        ), 200
-    finally:
-        conn.close()
+    return jsonify(
+        {"message": f"User {target_email} deleted."}
+    ), 200
 
 
 
 
 @app.post("/issues")
+@idempotent
 def add_issue():
     """
     Add a new issue to the database.
@@ -1193,41 +2968,32 @@ def add_issue():
     else:
         global_num = None
 
-    
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO issues (
-            store_name, store_number, issue_name, priority,
-            computer_number, device_type, category,
-            description, narrative, replicable, global_issue, 
-            global_num, status, resolution
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        RETURNING *;
-        """,
-        (
-            store_name,
-            int(store_number) if store_number is not None else None,
-            issue_name,
-            priority,
-            computer_number,
-            device_type,
-            category,
-            description,
-            narrative,
-            replicable,
-            global_issue,
-            global_num if global_num is not None else None,
-            status,
-            resolution,
-        ),
+    normalized, error = normalize_status_priority(status, priority)
+    if error:
+        return jsonify({"error": error}), 400
+    status, status_code, priority, priority_code = normalized
+
+    new_issue = STORAGE.insert_issue(
+        {
+            "store_name": store_name,
+            "store_number": int(store_number) if store_number is not None else None,
+            "issue_name": issue_name,
+            "priority": priority,
+            "computer_number": computer_number,
+            "device_type": device_type,
+            "category": category,
+            "description": description,
+            "narrative": narrative,
+            "replicable": replicable,
+            "global_issue": global_issue,
+            "global_num": global_num,
+            "status": status,
+            "resolution": resolution,
+            "status_code": status_code,
+            "priority_code": priority_code,
+        },
+        actor=request_actor(),
     )
-    new_issue = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
 
     return jsonify({"message": "Issue added", "issue": new_issue}), 201
 
@@ -1236,26 +3002,13 @@ def add_issue():
 def get_all_issues():
     """
     Return all issues in the DB, ordered by store_number then id.
+    Resolved issues that were archived are only included with
+    ?include_archived=true.
 
     Response: JSON list of issue rows (same shape as /issues/by-store)
     """
     try:
-        conn = get_db_conn()
-    except Exception as e:
-        return jsonify({"error": f"Database connection error: {e}"}), 500
-
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT *
-            FROM issues
-            ORDER BY store_number, id;
-            """
-        )
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        rows = STORAGE.list_issues(include_archived=wants_archived())
     except Exception as e:
         return jsonify({"error": f"Database query error: {e}"}), 500
 
@@ -1270,6 +3023,7 @@ def get_issues_by_store():
 
     Query params:
       ?store_number=123   OR   ?store_name=Store%20123...
+      &include_archived=true   (optional, also return archived issues)
 
     Returns a list of issues from the DB.
     """
@@ -1279,31 +3033,10 @@ def get_issues_by_store():
     if not store_number and not store_name:
         return jsonify({"error": "store_number or store_name is required"}), 400
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-
     if store_number:
-        cur.execute(
-            """
-            SELECT * FROM issues
-            WHERE store_number = %s
-            ORDER BY id;
-            """,
-            (int(store_number),),
-        )
+        rows = STORAGE.list_issues(store_number=int(store_number), include_archived=wants_archived())
     else:
-        cur.execute(
-            """
-            SELECT * FROM issues
-            WHERE store_name = %s
-            ORDER BY id;
-            """,
-            (store_name,),
-        )
-
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+        rows = STORAGE.list_issues(store_name=store_name, include_archived=wants_archived())
 
     return jsonify(rows), 200
 
@@ -1320,8 +3053,14 @@ def get_devices_by_store():
         "devices": [
           {device row...},
           ...
-        ]
+        ],
+        "by_category": {
+          "computers": [{device row...}, ...],
+          "phones": [...], "printers": [...], "internet": [...], "other": [...]
+        }
       }
+
+    Categories come from the device_category column (see device_category_rules).
     """
     store_number = request.args.get("store_number")
     if not store_number:
@@ -1332,35 +3071,181 @@ def get_devices_by_store():
     except ValueError:
         return jsonify({"error": "store_number must be an integer"}), 400
 
-    conn = get_db_conn()
-    cur = conn.cursor()
+    rows = STORAGE.devices_by_store(store_number_int)
 
-    cur.execute(
-        """
-        SELECT
-            device_uid,
-            store_number,
-            device_type,
-            device_number,
-            manufacturer,
-            model,
-            device_notes
-        FROM store_devices
-        WHERE store_number = %s
-        ORDER BY device_type, device_number NULLS LAST, manufacturer, model;
-        """,
-        (store_number_int,),
-    )
+    by_category = {category: [] for category in DEVICE_CATEGORIES}
+    for row in rows:
+        by_category.setdefault(row["device_category"] or "other", []).append(row)
 
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    return jsonify({
+        "store_number": store_number_int,
+        "devices": rows,
+        "by_category": by_category,
+    }), 200
+
+
+
+def csv_arg(name: str) -> list[str]:
+    """?name=a,b,c -> ["a", "b", "c"] (blank entries dropped)."""
+    raw = request.args.get(name) or ""
+    return [part.strip() for part in raw.split(",") if part.strip()]
+
+
+@app.get("/devices/search")
+def search_devices():
+    """
+    Search devices across all stores.
+
+    Query params (all optional, at least one filter required):
+      manufacturer=HP            case-insensitive, comma list allowed
+      model=M404                 partial, case-insensitive
+      device_type=Printer        case-insensitive, comma list allowed
+      category=printers          device_category, comma list allowed
+      state=MA,NH                store state, comma list allowed
+      store_type=Walmart         store type, comma list allowed
+      limit=100                  page size (max 500)
+      after=123:4567             cursor from the previous page's next_after
+      mode=aggregate             counts instead of rows (see below)
+
+    Rows mode returns:
+      {"devices": [{device row + store_name, state, store_type}, ...],
+       "next_after": "125:4890" | null}
+
+    Aggregate mode returns:
+      {"by_model": [{"manufacturer", "model", "devices", "stores"}, ...],
+       "by_state": [{"state", "devices", "stores"}, ...],
+       "by_store_type": [{"store_type", "devices", "stores"}, ...]}
+    """
+    manufacturers = [m.lower() for m in csv_arg("manufacturer")]
+    device_types = [t.lower() for t in csv_arg("device_type")]
+    states = [st.upper() for st in csv_arg("state")]
+    store_types = [t.lower() for t in csv_arg("store_type")]
+    categories = [cat.lower() for cat in csv_arg("category")]
+    model = (request.args.get("model") or "").strip()
+    mode = (request.args.get("mode") or "rows").strip().lower()
+
+    if not any([manufacturers, device_types, categories, states, store_types, model]):
+        return jsonify({"error": "At least one filter is required"}), 400
+    if mode not in ("rows", "aggregate"):
+        return jsonify({"error": "mode must be rows or aggregate"}), 400
+
+    # Validate paging before a connection is checked out
+    limit = DEVICE_SEARCH_DEFAULT_LIMIT
+    after = None
+    if mode == "rows":
+        try:
+            limit = int(request.args.get("limit", DEVICE_SEARCH_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, DEVICE_SEARCH_MAX_LIMIT))
+
+        if request.args.get("after"):
+            try:
+                after = tuple(int(part) for part in request.args["after"].split(":"))
+                if len(after) != 2:
+                    raise ValueError
+            except ValueError:
+                return jsonify({"error": "after must look like <store_number>:<id>"}), 400
+
+    filters = {
+        "manufacturers": manufacturers,
+        "device_types": device_types,
+        "categories": categories,
+        "states": states,
+        "store_types": store_types,
+        "model": model,
+    }
+
+    if mode == "aggregate":
+        result = {"by_model": [], "by_state": [], "by_store_type": []}
+        for row in STORAGE.device_counts(filters):
+            counts = {"devices": row["devices"], "stores": row["stores"]}
+            if row["is_model"]:
+                result["by_model"].append(
+                    {"manufacturer": row["manufacturer"], "model": row["model"], **counts}
+                )
+            elif row["is_state"]:
+                result["by_state"].append({"state": row["state"], **counts})
+            else:
+                result["by_store_type"].append({"store_type": row["store_type"], **counts})
+
+        return jsonify(result), 200
+
+    rows = STORAGE.search_devices(filters, after=after, limit=limit + 1)
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = f"{rows[-1]['store_number']}:{rows[-1]['id']}"
+
+    return jsonify({"devices": rows, "next_after": next_after}), 200
 
-    return jsonify({"store_number": store_number_int, "devices": rows}), 200
 
+@app.post("/devices/bulk-upsert")
+def devices_bulk_upsert():
+    """
+    Admin-only: merge a device inventory CSV into store_devices.
+
+    multipart/form-data:
+      file            inventory CSV (see inventory_import.py for columns)
+      admin_email, admin_password, admin_pin
+      dry_run=1       report the diff (with sample uids) and write nothing
+      prune=1         delete devices of the listed stores missing from the CSV
+      async=1         stage the CSV in JOB_UPLOAD_DIR, queue a device_import
+                      job and return 202 with its id
+
+    Returns inserted/updated/unchanged/would_remove/removed/skipped_unknown_store
+    counts; removed is only non-zero when prune=1 actually deleted devices.
+    """
+    form = request.form
+    admin_email = form.get("admin_email", "").strip().lower()
+    admin_password = form.get("admin_password", "")
+    admin_pin = form.get("admin_pin", "")
+    dry_run = form.get("dry_run", "").strip().lower() in ("1", "true", "yes")
+    prune = form.get("prune", "").strip().lower() in ("1", "true", "yes")
+    run_async = form.get("async", "").strip().lower() in ("1", "true", "yes")
+    upload = request.files.get("file")
+
+    if upload is None:
+        return jsonify({"error": "Missing CSV file."}), 400
+
+    denied = check_admin_credentials(admin_email, admin_password, admin_pin)
+    if denied:
+        return denied
+
+    if run_async:
+        # The job payload only references the staged file, never the CSV itself
+        try:
+            staged = stage_job_upload(upload)
+        except OSError as e:
+            return jsonify({"error": f"Could not stage upload: {e}"}), 500
+        try:
+            job_id = enqueue_job(
+                "device_import",
+                {"upload": staged, "dry_run": dry_run, "prune": prune},
+                created_by=admin_email,
+            )
+        except Exception:
+            discard_job_upload(staged)
+            raise
+        return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+    # Read the upload incrementally rather than loading it into memory
+    text_stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+
+    with STORAGE.session() as conn:
+        try:
+            report = bulk_upsert_devices(conn, text_stream, dry_run=dry_run, prune=prune)
+        except InventoryImportError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": f"Database error: {e}"}), 500
+
+    return jsonify(report), 200
 
 
 @app.post("/issues/update")
+@idempotent
 def update_issue():
     """
     Update an existing issue in the DB.
@@ -1429,128 +3314,622 @@ def update_issue():
     else:
         global_num = None
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE issues
-        SET
-            store_name   = COALESCE(%s, store_name),
-            store_number = COALESCE(%s, store_number),
-            issue_name   = %s,
-            priority     = %s,
-            computer_number = %s,
-            device_type  = %s,
-            category     = %s,
-            description  = %s,
-            narrative    = %s,
-            replicable   = %s,
-            global_issue = COALESCE(%s, global_issue),
-            global_num   = COALESCE(%s, global_num),
-            status       = %s,
-            resolution   = %s,
-            updated_at   = NOW()
-        WHERE id = %s
-        RETURNING *;
-        """,
-        (
-            store_name,
-            int(store_number) if store_number is not None else None,
-            issue_name,
-            priority,
-            computer_number,
-            device_type,
-            category,
-            description,
-            narrative,
-            replicable,
-            global_issue,
-            global_num if global_num is not None else None,
-            status,
-            resolution,
-            issue_id,
-        ),
+    normalized, error = normalize_status_priority(status, priority)
+    if error:
+        return jsonify({"error": error}), 400
+    status, status_code, priority, priority_code = normalized
+
+    # store_name, store_number, global_issue and global_num keep their
+    # stored value when None (see storage.ISSUE_KEEP_IF_NONE)
+    updated_row = STORAGE.update_issue(
+        issue_id,
+        {
+            "store_name": store_name,
+            "store_number": int(store_number) if store_number is not None else None,
+            "issue_name": issue_name,
+            "priority": priority,
+            "computer_number": computer_number,
+            "device_type": device_type,
+            "category": category,
+            "description": description,
+            "narrative": narrative,
+            "replicable": replicable,
+            "global_issue": global_issue,
+            "global_num": global_num,
+            "status": status,
+            "resolution": resolution,
+            "status_code": status_code,
+            "priority_code": priority_code,
+        },
+        actor=request_actor(),
     )
-    updated_row = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
 
     if not updated_row:
         return jsonify({"error": "Issue not found"}), 404
 
     return jsonify({"message": "Issue updated", "issue": updated_row}), 200
 
+
+# Legacy payload key -> issues column, for partial updates
+ISSUE_PATCH_FIELDS = {
+    "Store Name": "store_name",
+    "Store Number": "store_number",
+    "Name": "issue_name",
+    "Issue Name": "issue_name",
+    "Priority": "priority",
+    "Computer Number": "computer_number",
+    "Device": "device_type",
+    "Category": "category",
+    "Description": "description",
+    "Narrative": "narrative",
+    "Replicable?": "replicable",
+    "Global Issue": "global_issue",
+    "Global Number": "global_num",
+    "Status": "status",
+    "Resolution": "resolution",
+}
+
+
+def normalize_issue_changes(changes: dict):
+    """
+    Turn a legacy-keyed dict of changed fields into {column: value}.
+    Returns (columns: dict, error: str | None).
+    """
+    columns = {}
+    for key, value in changes.items():
+        column = ISSUE_PATCH_FIELDS.get(key)
+        if column is None:
+            return None, f"Unknown field: {key}"
+
+        if column == "store_number":
+            if value in (None, ""):
+                return None, "Store Number cannot be blank"
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return None, "Store Number must be an integer"
+        elif column == "store_name":
+            if not value:
+                return None, "Store Name cannot be blank"
+        elif column == "global_issue":
+            if not isinstance(value, bool):
+                value = str(value).strip().lower() in ("true", "yes", "y", "1")
+        elif column == "global_num":
+            if value in (None, ""):
+                value = None
+            else:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    return None, "Global Number must be an integer"
+        elif column == "status":
+            normalized, error = normalize_status_priority(value, None)
+            if error:
+                return None, error
+            value, columns["status_code"] = normalized[0], normalized[1]
+        elif column == "priority":
+            normalized, error = normalize_status_priority(None, value)
+            if error:
+                return None, error
+            value, columns["priority_code"] = normalized[2], normalized[3]
+
+        columns[column] = value
+
+    return columns, None
+
+
+@app.patch("/issues/<int:issue_id>")
+@idempotent
+def patch_issue(issue_id):
+    """
+    Partially update an issue. Only the columns sent are written.
+
+    Expected JSON body:
+    {
+      "changes": {
+          "Status": "Resolved",
+          "Resolution": "Replaced the cable"
+      },
+      "expected_version": 4        # optional precondition
+    }
+
+    The precondition can also be sent as an If-Match header. When the
+    row has moved on since the client loaded it, nothing is written and
+    409 is returned with the current row so the client can re-apply.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "JSON body required"}), 400
+
+    changes = data.get("changes")
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({"error": "changes must be a non-empty object"}), 400
+
+    columns, error = normalize_issue_changes(changes)
+    if error:
+        return jsonify({"error": error}), 400
+
+    expected_version = data.get("expected_version")
+    if expected_version is None:
+        expected_version = request.headers.get("If-Match", "").strip('" ') or None
+    if expected_version is not None:
+        try:
+            expected_version = int(expected_version)
+        except (TypeError, ValueError):
+            return jsonify({"error": "expected_version must be an integer"}), 400
+
+    updated_row, current = STORAGE.patch_issue(
+        issue_id, columns, expected_version, actor=request_actor()
+    )
+    if updated_row:
+        return jsonify({"message": "Issue updated", "issue": updated_row}), 200
+    if not current:
+        return jsonify({"error": "Issue not found"}), 404
+
+    return jsonify({
+        "error": "Issue was changed by someone else. Reload and try again.",
+        "issue": current,
+    }), 409
+
+
+class BatchOpError(Exception):
+    """One /batch operation failed; rolled back to its savepoint."""
+
+    def __init__(self, message: str, status: int = 400, issue=None):
+        super().__init__(message)
+        self.status = status
+        self.issue = issue
+
+
+def resolve_batch_issue_id(raw, temp_ids: dict) -> int:
+    """An op's issue_id: a real id, or a temp_id created earlier in the batch."""
+    if isinstance(raw, str) and raw in temp_ids:
+        return temp_ids[raw]
+    if isinstance(raw, bool) or raw is None:
+        raise BatchOpError("issue_id is required")
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise BatchOpError(f"Unknown issue_id or temp_id: {raw!r}")
+
+
+def run_batch_op(cur, op: dict, temp_ids: dict) -> dict:
+    """Execute one validated /batch operation on cur; returns its result fields."""
+    kind = op["op"]
+
+    if kind == "create":
+        issue = op.get("issue")
+        if not isinstance(issue, dict) or not issue:
+            raise BatchOpError("issue must be a non-empty object")
+        columns, error = normalize_issue_changes(issue)
+        if error:
+            raise BatchOpError(error)
+        store_name = op.get("store_name") or columns.get("store_name")
+        if not store_name:
+            raise BatchOpError("store_name is required")
+        fields = {"narrative": "", "resolution": "", "global_issue": False}
+        fields.update(columns)
+        fields["store_name"] = store_name
+
+        cur.execute(
+            f"INSERT INTO issues ({', '.join(fields)}) VALUES ({', '.join(['%s'] * len(fields))}) RETURNING *;",
+            list(fields.values()),
+        )
+        row = cur.fetchone()
+        if op.get("temp_id"):
+            temp_ids[op["temp_id"]] = row["id"]
+        return {"issue_id": row["id"], "issue": row}
+
+    issue_id = resolve_batch_issue_id(op.get("issue_id"), temp_ids)
+
+    if kind == "update":
+        changes = op.get("changes")
+        if not isinstance(changes, dict) or not changes:
+            raise BatchOpError("changes must be a non-empty object")
+        columns, error = normalize_issue_changes(changes)
+        if error:
+            raise BatchOpError(error)
+        expected_version = op.get("expected_version")
+        if expected_version is not None:
+            try:
+                expected_version = int(expected_version)
+            except (TypeError, ValueError):
+                raise BatchOpError("expected_version must be an integer")
+
+        cur.execute(*issue_patch_sql(issue_id, columns, expected_version))
+        row = cur.fetchone()
+        if row:
+            return {"issue_id": issue_id, "issue": row}
+        cur.execute("SELECT * FROM issues WHERE id = %s;", (issue_id,))
+        current = cur.fetchone()
+        if not current:
+            raise BatchOpError("Issue not found", 404)
+        raise BatchOpError("Issue was changed by someone else. Reload and try again.", 409, current)
+
+    # delete
+    cur.execute("DELETE FROM issues WHERE id = %s RETURNING id;", (issue_id,))
+    if not cur.fetchone():
+        raise BatchOpError("Issue not found", 404)
+    return {"issue_id": issue_id}
+
+
+@app.post("/batch")
+@idempotent
+def run_batch():
+    """
+    Replay several issue mutations in one transaction (offline technicians).
+
+    Expected JSON body:
+    {
+      "mode": "atomic",            # or "continue" (default atomic)
+      "operations": [
+        {"op": "create", "temp_id": "new-1", "store_name": "Whalley Ave",
+         "issue": {"Name": "...", "Store Number": "11529", "Status": "Unresolved", ...}},
+        {"op": "update", "issue_id": "new-1", "changes": {"Priority": "1"}},
+        {"op": "update", "issue_id": 123, "changes": {...}, "expected_version": 4},
+        {"op": "delete", "issue_id": 456}
+      ]
+    }
+
+    Operations run in order, each inside its own savepoint. issue_id may be
+    a temp_id created by an earlier op. "issue" and "changes" use the same
+    legacy keys as PATCH /issues/<id>.
+    - atomic: the first failing op rolls the whole batch back (400).
+    - continue: a failing op is rolled back to its savepoint and the rest
+      still commit (200).
+
+    Returns:
+      {
+        "committed": true,
+        "results": [
+          {"index": 0, "op": "create", "status": "ok", "issue_id": 57, "issue": {...}},
+          {"index": 3, "op": "delete", "status": "error", "code": 404, "error": "Issue not found"},
+          ...
+        ],
+        "temp_ids": {"new-1": 57}
+      }
+    In an aborted atomic batch, earlier ops report "rolled_back" and later
+    ones "skipped".
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "JSON body required"}), 400
+
+    mode = data.get("mode", "atomic")
+    if mode not in ("atomic", "continue"):
+        return jsonify({"error": "mode must be 'atomic' or 'continue'"}), 400
+
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_OPERATIONS} operations per batch"}), 400
+
+    seen_temp_ids = set()
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict) or op.get("op") not in ("create", "update", "delete"):
+            return jsonify({"error": f"Operation {index}: op must be create, update or delete"}), 400
+        temp_id = op.get("temp_id")
+        if temp_id is not None:
+            if op["op"] != "create" or not isinstance(temp_id, str) or not temp_id:
+                return jsonify({"error": f"Operation {index}: temp_id must be a string on a create"}), 400
+            if temp_id in seen_temp_ids:
+                return jsonify({"error": f"Operation {index}: duplicate temp_id '{temp_id}'"}), 400
+            seen_temp_ids.add(temp_id)
+
+    temp_ids = {}
+    results = []
+    aborted = False
+
+    # Joins the Idempotency-Key transaction when there is one, so an aborted
+    # batch rolls back to its own savepoint rather than to the very start
+    with STORAGE.transaction() as conn:
+        cur = conn.cursor()
+        set_request_actor(cur)
+        cur.execute("SAVEPOINT batch;")
+
+        for index, op in enumerate(operations):
+            result = {"index": index, "op": op["op"]}
+            if op.get("temp_id"):
+                result["temp_id"] = op["temp_id"]
+            if aborted:
+                result["status"] = "skipped"
+                results.append(result)
+                continue
+
+            cur.execute("SAVEPOINT batch_op;")
+            try:
+                result.update(run_batch_op(cur, op, temp_ids))
+                cur.execute("RELEASE SAVEPOINT batch_op;")
+                result["status"] = "ok"
+            except (BatchOpError, psycopg2.DataError, psycopg2.IntegrityError) as e:
+                cur.execute("ROLLBACK TO SAVEPOINT batch_op;")
+                result["status"] = "error"
+                result["error"] = str(e).strip()
+                result["code"] = e.status if isinstance(e, BatchOpError) else 400
+                if isinstance(e, BatchOpError) and e.issue is not None:
+                    result["issue"] = e.issue
+                aborted = mode == "atomic"
+            results.append(result)
+
+        if aborted:
+            cur.execute("ROLLBACK TO SAVEPOINT batch;")
+            temp_ids = {}
+            for result in results:
+                if result["status"] == "ok":
+                    result["status"] = "rolled_back"
+                    result.pop("issue", None)
+                    result.pop("issue_id", None)
+        cur.close()
+
+    return jsonify({
+        "committed": not aborted,
+        "mode": mode,
+        "results": results,
+        "temp_ids": temp_ids,
+    }), 400 if aborted else 200
+
+
+SEARCH_CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_search_time(raw: str) -> datetime:
+    """ISO date or datetime -> aware datetime; values without an offset are UTC."""
+    value = datetime.fromisoformat(raw.strip())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def encode_search_cursor(row: dict, sort_key: str) -> str:
+    """next_after for /issues/search: "<id>" or "<sort value in epoch microseconds>:<id>"."""
+    if sort_key == "id":
+        return str(row["id"])
+    micros = (row[sort_key] - SEARCH_CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}:{row['id']}"
+
+
+def decode_search_cursor(raw: str, sort_key: str):
+    """Inverse of encode_search_cursor: (sort value, id). Raises ValueError."""
+    if sort_key == "id":
+        issue_id = int(raw)
+        return issue_id, issue_id
+    micros, issue_id = (int(part) for part in raw.split(":"))
+    return SEARCH_CURSOR_EPOCH + timedelta(microseconds=micros), issue_id
+
+
+def format_facets(counts: dict) -> dict:
+    """
+    {facet: [(value, count)]} -> {facet: [{"value", "count"}]}, largest first.
+    Status and priority values are codes; they also get their label.
+    """
+    labels = {"status": ISSUE_STATUSES, "priority": ISSUE_PRIORITIES}
+    out = {}
+    for facet, pairs in counts.items():
+        entries = []
+        for value, count in sorted(pairs, key=lambda p: (-p[1], str(p[0]))):
+            if facet in labels:
+                entries.append({
+                    "value": labels[facet].get(value, value),
+                    "code": value,
+                    "count": count,
+                })
+            else:
+                entries.append({"value": value, "count": count})
+        out[facet] = entries
+    return out
+
+
 @app.get("/issues/search")
 def search_issues():
     """
     Advanced search for issues.
 
-    Query params (all optional, at least one required):
-      store_number=12345
+    Query params (all optional, at least one filter required):
+      store_number=12345      (comma list allowed)
       category=some_text
-      status=Unresolved
+      status=Unresolved       (label, alias or code; comma list allowed: status=open,in progress)
+      priority=1              (1/2/3, "1 - Critical" or "critical"; comma list allowed)
       device=Computer
       name=Printer%20Down
       global_issue=True
-
-    All text fields use ILIKE '%value%' (case-insensitive, partial match).
+      created_since=2026-10-01, created_before=...   (ISO date/datetime, UTC if no offset;
+      updated_since=...,        updated_before=...    "since" inclusive, "before" exclusive)
+      include_archived=true   (also search archived issues)
+      facets=status,priority  (also return counts per value; see SEARCH_FACETS)
+      sort=-updated_at        (id, created_at or updated_at; "-" = descending; default id)
+      limit=100               (page size, max 500; turns on paging)
+      after=...               (next_after from the previous page, same sort)
+
+    e.g. critical open issues updated in the last week, newest first:
+      ?priority=critical&status=unresolved,in progress&updated_since=2026-10-12&sort=-updated_at&limit=50
+
+    Status and priority are normalized to codes and use index equality;
+    the other text fields use ILIKE '%value%' (case-insensitive, partial match).
+
+    Without facets or paging the response is the list of issues. Otherwise it
+    is {"issues": [...]} plus "facets" ({"status": [{"value", "count", ...}], ...},
+    counted over all matches in the same statement) and/or "next_after"
+    (null on the last page).
     """
-    store_number = request.args.get("store_number")
-    category = request.args.get("category")   # maps to device_type
-    status = request.args.get("status")
-    device = request.args.get("device")       # also maps to device_type
-    name = request.args.get("name")           # maps to issue_name
-    global_issue = request.args.get("global_issue")
-
-    if not any([store_number, category, status, device, name, global_issue]):
+    filter_params = (
+        "store_number", "category", "status", "device", "name", "global_issue",
+        "priority", *SEARCH_DATE_FILTERS,
+    )
+    if not any(request.args.get(p) for p in filter_params):
         return jsonify({"error": "At least one search parameter is required"}), 400
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-
-    query = "SELECT * FROM issues WHERE 1=1"
-    params = []
+    facets = []
+    for facet in (request.args.get("facets") or "").split(","):
+        facet = facet.strip().lower()
+        if not facet or facet in facets:
+            continue
+        if facet not in SEARCH_FACETS:
+            return jsonify({
+                "error": f"Unknown facet '{facet}'",
+                "allowed": sorted(SEARCH_FACETS),
+            }), 400
+        facets.append(facet)
+
+    filters = {
+        "category": request.args.get("category"),   # maps to category
+        "device": request.args.get("device"),       # maps to device_type
+        "name": request.args.get("name"),           # maps to issue_name
+    }
 
-    if store_number:
-        query += " AND store_number = %s"
-        params.append(int(store_number))
+    try:
+        filters["store_numbers"] = sorted({int(v) for v in csv_arg("store_number")})
+    except ValueError:
+        return jsonify({"error": "store_number must be a number or a comma list of numbers"}), 400
 
-    # In your current schema, 'category' and 'device' both map to device_type.
-    if category:
-        query += " AND category ILIKE %s"
-        params.append(f"%{category}%")
-    
-    if status:
-        query += " AND status ILIKE %s"
-        params.append(f"%{status}%")
+    statuses = csv_arg("status")
+    try:
+        filters["status_codes"] = sorted({normalize_status(v) for v in statuses})
+    except ValueError:
+        if len(statuses) > 1:
+            allowed = ", ".join(ISSUE_STATUSES.values())
+            return jsonify({"error": f"Unknown status in '{request.args['status']}'. Use: {allowed}"}), 400
+        # Unrecognised single value: fall back to the old partial text match
+        filters["status_codes"] = []
+        filters["status_text"] = statuses[0]
 
-    if device:
-        query += " AND device_type ILIKE %s"
-        params.append(f"%{device}%")
+    try:
+        filters["priority_codes"] = sorted({normalize_priority(v) for v in csv_arg("priority")})
+    except ValueError:
+        return jsonify({"error": f"Unknown priority '{request.args['priority']}'"}), 400
 
-    if name:
-        query += " AND issue_name ILIKE %s"
-        params.append(f"%{name}%")
+    for key in SEARCH_DATE_FILTERS:
+        raw = request.args.get(key)
+        if not raw:
+            continue
+        try:
+            filters[key] = parse_search_time(raw)
+        except ValueError:
+            return jsonify({"error": f"{key} must be an ISO date or datetime"}), 400
 
+    global_issue = request.args.get("global_issue")
     if global_issue is not None:
         val = str(global_issue).strip().lower()
         if val in ("true", "1", "yes", "y"):
-            query += " AND global_issue = %s"
-            params.append(True)
+            filters["global_issue"] = True
         elif val in ("false", "0", "no", "n"):
-            query += " AND global_issue = %s"
-            params.append(False)
+            filters["global_issue"] = False
+
+    sort_arg = (request.args.get("sort") or "id").strip().lower()
+    sort = (sort_arg.lstrip("-"), sort_arg.startswith("-"))
+    if sort[0] not in SEARCH_SORT_KEYS:
+        return jsonify({
+            "error": f"Unknown sort '{sort_arg}'",
+            "allowed": list(SEARCH_SORT_KEYS),
+        }), 400
+
+    paged = "limit" in request.args or "after" in request.args
+    limit = None
+    after = None
+    if paged:
+        try:
+            limit = int(request.args.get("limit", ISSUE_SEARCH_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, ISSUE_SEARCH_MAX_LIMIT))
+        if request.args.get("after"):
+            try:
+                after = decode_search_cursor(request.args["after"], sort[0])
+            except ValueError:
+                return jsonify({"error": "after must be the next_after of a search with the same sort"}), 400
+
+    def norm(value):
+        return " ".join(value.lower().split()) if isinstance(value, str) else value
+
+    # Same search typed differently (case, spacing, "1" vs "critical") -> same entry
+    cache_key = (
+        tuple(
+            (key, tuple(value) if isinstance(value, list) else norm(value))
+            for key, value in sorted(filters.items())
+        ),
+        wants_archived(),
+        tuple(facets),
+        sort,
+        after,
+        limit,
+    )
+    generation = issue_search_cache.generation
+    cached = issue_search_cache.get(cache_key)
+    if cached is not None:
+        response = jsonify(cached)
+        response.headers["X-Cache"] = "HIT"
+        return response, 200
+
+    # One extra row tells us whether there is a next page
+    fetch_limit = limit + 1 if paged else None
+    if facets:
+        rows, counts = STORAGE.search_issues_with_facets(
+            filters, facets, include_archived=wants_archived(),
+            sort=sort, after=after, limit=fetch_limit,
+        )
+    else:
+        rows = STORAGE.search_issues(
+            filters, include_archived=wants_archived(),
+            sort=sort, after=after, limit=fetch_limit,
+        )
 
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    if not facets and not paged:
+        payload = rows
+    else:
+        payload = {}
+        if paged:
+            next_after = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_after = encode_search_cursor(rows[-1], sort[0])
+            payload["next_after"] = next_after
+        payload["issues"] = rows
+        if facets:
+            payload["facets"] = format_facets(counts)
+
+    # Replica rows may predate the NOTIFY that bumped the generation
+    if STORAGE.request_settings.source != "replica":
+        issue_search_cache.put(cache_key, generation, payload)
+    response = jsonify(payload)
+    response.headers["X-Cache"] = "MISS"
+    return response, 200
+
+
+@app.get("/db/query-stats")
+def db_query_stats():
+    """Per-query call counts and latency for this worker's storage layer."""
+    return jsonify({
+        "worker_pid": os.getpid(),
+        "backend": STORAGE.name,
+        "queries": STORAGE.query_stats.snapshot(),
+    }), 200
 
-    return jsonify(rows), 200
+
+@app.get("/db/health")
+def db_health():
+    """Circuit breaker state, stale-read cache usage and replica lag for this worker."""
+    if USE_SQLITE:
+        return jsonify({"worker_pid": os.getpid(), "backend": STORAGE.name}), 200
+    return jsonify({
+        "worker_pid": os.getpid(),
+        "backend": STORAGE.name,
+        "breaker": STORAGE.breaker.snapshot(),
+        "stale_reads_served": stale_reads.served,
+        "replica": STORAGE.replica_status(),
+    }), 200
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters for this worker's caches (the search cache is Postgres only)."""
+    stats = {"worker_pid": os.getpid()}
+    if not USE_SQLITE:
+        stats["issue_search"] = issue_search_cache.snapshot()
+    return jsonify(stats), 200
 
 
 @app.post("/issues/delete")
+@idempotent
 def delete_issue():
     """
     Delete an existing issue from the DB.
@@ -1568,16 +3947,7 @@ def delete_issue():
     if issue_id is None:
         return jsonify({"error": "issue_id is required"}), 400
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM issues WHERE id = %s RETURNING *;",
-        (issue_id,),
-    )
-    deleted = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    deleted = STORAGE.delete_issue(issue_id, actor=request_actor())
 
     if not deleted:
         return jsonify({"error": "Issue not found"}), 404
@@ -1585,8 +3955,262 @@ def delete_issue():
     return jsonify({"message": "Issue deleted", "issue": deleted}), 200
 
 
+def parse_issue_ids(data):
+    """
+    The "ids" list of a batch request, as unique ints in request order.
+    Returns (ids, None) or (None, error message).
+    """
+    raw = (data or {}).get("ids")
+    if not isinstance(raw, list) or not raw:
+        return None, "ids must be a non-empty list of issue ids"
+    if len(raw) > ISSUE_BATCH_MAX:
+        return None, f"At most {ISSUE_BATCH_MAX} ids per request"
+
+    ids, seen = [], set()
+    for value in raw:
+        if isinstance(value, bool):
+            return None, f"Invalid issue id: {value!r}"
+        try:
+            issue_id = int(value)
+        except (TypeError, ValueError):
+            return None, f"Invalid issue id: {value!r}"
+        if issue_id not in seen:
+            seen.add(issue_id)
+            ids.append(issue_id)
+    return ids, None
+
+
+@app.post("/issues/batch-get")
+def batch_get_issues():
+    """
+    Fetch several issues by id in one round trip.
+
+    Expected JSON body:
+    {
+      "ids": [12, 15, 99]
+    }
+    ?include_archived=true also looks in the archive.
+
+    Returns:
+      {
+        "issues": [{issue row...}, ...],   # in the order the ids were given
+        "missing": [99]
+      }
+    """
+    ids, error = parse_issue_ids(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    by_id = {row["id"]: row for row in STORAGE.get_issues(ids, include_archived=wants_archived())}
+    return jsonify({
+        "issues": [by_id[i] for i in ids if i in by_id],
+        "missing": [i for i in ids if i not in by_id],
+    }), 200
+
+
+@app.post("/issues/batch-delete")
+@idempotent
+def batch_delete_issues():
+    """
+    Delete several issues in one transaction.
+
+    Expected JSON body:
+    {
+      "ids": [12, 15, 99]
+    }
+
+    Returns per-id outcomes (ids that do not exist are reported, not an error):
+      {
+        "results": [
+          {"issue_id": 12, "status": "deleted"},
+          {"issue_id": 99, "status": "not_found"}
+        ],
+        "deleted": 2,
+        "not_found": 1
+      }
+    """
+    ids, error = parse_issue_ids(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    deleted = {row["id"] for row in STORAGE.delete_issues(ids, actor=request_actor())}
+    results = [
+        {"issue_id": i, "status": "deleted" if i in deleted else "not_found"}
+        for i in ids
+    ]
+    return jsonify({
+        "results": results,
+        "deleted": len(deleted),
+        "not_found": len(ids) - len(deleted),
+    }), 200
+
+
+@app.get("/issues/<int:issue_id>/history")
+def get_issue_history(issue_id):
+    """
+    Change log for one issue, oldest first.
+
+    Returns:
+      {
+        "issue_id": 123,
+        "events": [
+          {"event_id": 1, "op": "I", "ts": "...", "actor": "FishbeinS", "changes": {...}},
+          {"event_id": 7, "op": "U", "ts": "...", "actor": null, "changes": {"status": "Resolved", ...}},
+          ...
+        ],
+        "hours_to_resolution": 52.5    # null until the issue is resolved
+      }
+    """
+    events = STORAGE.issue_history(issue_id)
+
+    if not events:
+        return jsonify({"error": "No history for that issue"}), 404
+
+    # Time from creation to the first move into Resolved/Closed
+    hours_to_resolution = None
+    created_at = next((e["ts"] for e in events if e["op"] == "I"), None)
+    if created_at is not None:
+        for event in events:
+            if event["op"] == "U" and event["changes"].get("status_code") in (3, 4):
+                hours_to_resolution = round(
+                    (event["ts"] - created_at).total_seconds() / 3600, 2
+                )
+                break
+
+    return jsonify({
+        "issue_id": issue_id,
+        "events": events,
+        "hours_to_resolution": hours_to_resolution,
+    }), 200
+
+
+@app.get("/reports/known-issues")
+def known_issues_report():
+    """
+    Known Issues Report for every store, built from one ordered query.
+
+    Query params:
+      format=txt|csv|md   (default txt)
+      snapshot=1          serve the latest nightly snapshot instead of
+                          generating live; falls back to live if none exists
+
+    Live reports are streamed as they are rendered. Snapshots carry their
+    content hash as ETag, so If-None-Match gets a 304.
+    """
+    fmt = (request.args.get("format") or "txt").strip().lower()
+    if fmt not in REPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(REPORT_FORMATS)}"}), 400
+
+    today = datetime.now(timezone.utc).strftime("%Y%m%d")
+    disposition = f'attachment; filename="KnownIssuesReport_{today}.{fmt}"'
+
+    if request.args.get("snapshot", "").strip().lower() in ("1", "true", "yes"):
+        entry = load_snapshot_manifest().get(fmt)
+        path = os.path.join(REPORT_SNAPSHOT_DIR, entry["file"]) if entry else None
+        if path and os.path.exists(path):
+            if entry["sha256"] in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(entry["sha256"])
+                return response
+
+            def read_snapshot():
+                with open(path, encoding="utf-8") as f:
+                    for chunk in iter(lambda: f.read(64 * 1024), ""):
+                        yield chunk
+
+            response = Response(read_snapshot(), mimetype=REPORT_FORMATS[fmt])
+            response.set_etag(entry["sha256"])
+            response.headers["Content-Disposition"] = disposition
+            response.headers["X-Report-Generated"] = entry["generated_at"]
+            return response
+
+    # The pooled connection stays checked out until the response is closed
+    session = ExitStack()
+    conn = session.enter_context(STORAGE.session(read=True))
+    response = Response(
+        render_known_issues(iter_known_issue_rows(conn), fmt),
+        mimetype=REPORT_FORMATS[fmt],
+    )
+    response.call_on_close(session.close)
+    response.headers["Content-Disposition"] = disposition
+    response.headers["X-Report-Generated"] = datetime.now(timezone.utc).isoformat()
+    return response
+
+
+@app.post("/jobs")
+def create_job():
+    """
+    Admin-only: queue a background job for job_worker.py.
+
+    Expected JSON:
+    {
+      "admin_email": "...", "admin_password": "...", "admin_pin": "...",
+      "kind": "known_issues_snapshot",   # see JOB_HANDLERS
+      "payload": {...},                  # optional, kind-specific
+      "max_attempts": 3                  # optional
+    }
+
+    Returns 202 with {"job_id", "status_url"}.
+    """
+    data = request.get_json(silent=True) or {}
+    kind = (data.get("kind") or "").strip()
+    payload = data.get("payload") or {}
+
+    if kind not in JOB_HANDLERS:
+        return jsonify({"error": f"kind must be one of: {', '.join(JOB_HANDLERS)}"}), 400
+    if not isinstance(payload, dict):
+        return jsonify({"error": "payload must be an object"}), 400
+    try:
+        max_attempts = max(1, int(data.get("max_attempts", JOB_DEFAULT_MAX_ATTEMPTS)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_attempts must be an integer"}), 400
+
+    admin_email = data.get("admin_email", "").strip().lower()
+    denied = check_admin_credentials(
+        admin_email, data.get("admin_password", ""), data.get("admin_pin", "")
+    )
+    if denied:
+        return denied
+
+    job_id = enqueue_job(kind, payload, max_attempts=max_attempts, created_by=admin_email)
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+
+@app.get("/jobs/<int:job_id>")
+def get_job(job_id):
+    """
+    Admin-only: status of a background job. Credentials go in the
+    X-Admin-Email, X-Admin-Password and X-Admin-Pin headers.
+
+    Returns {"id", "kind", "status", "attempts", "max_attempts", "progress",
+     "progress_message", "result", "last_error", "created_at", "started_at",
+     "finished_at", "run_after"}
+    """
+    denied = check_admin_credentials(
+        request.headers.get("X-Admin-Email", "").strip().lower(),
+        request.headers.get("X-Admin-Password", ""),
+        request.headers.get("X-Admin-Pin", ""),
+    )
+    if denied:
+        return denied
+
+    job = STORAGE.get_job(job_id)
+
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
 # Initialize DB schema when the app starts (works with gunicorn)
-init_db()
+if USE_SQLITE:
+    STORAGE.init_schema()
+    start_login_flusher()
+else:
+    init_db()
+    start_maintenance()
+    start_archiver()
+    start_login_flusher()
+    start_issue_change_listener()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,113 @@
+"""
+Per-store issue query latency as resolved history grows.
+
+Seeds a scratch schema with N open issues plus an increasing pile of old
+resolved issues, runs the archiver after each step, and times the default
+per-store query (hot table only) next to the include_archived variant.
+With the hot/cold split the default query should stay flat while the
+archived variant grows with history.
+
+Usage:
+    DATABASE_URL=postgres://... python benchmarks/archive_store_latency.py
+
+Everything happens in the `bench_archive` schema, which is dropped at the
+end. Nothing in the public schema is touched.
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+SCHEMA = "bench_archive"
+STORES = 200
+OPEN_ISSUES = 2_000
+HISTORY_STEPS = [0, 20_000, 100_000, 250_000]
+QUERIES_PER_STEP = 300
+
+# Route every api_server connection into the scratch schema and keep the
+# background archiver off; we call it directly.
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA}"
+os.environ["ARCHIVE_INTERVAL_SECONDS"] = "0"
+
+import psycopg2  # noqa: E402
+
+if not os.environ.get("DATABASE_URL"):
+    sys.exit("DATABASE_URL is not set")
+
+_admin = psycopg2.connect(os.environ["DATABASE_URL"], options="-c search_path=public")
+_admin.autocommit = True
+_admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_server  # noqa: E402  (runs init_db() inside the scratch schema)
+
+
+def insert_issues(cur, count: int, resolved: bool):
+    # The archiver selects on status_code, so the codes must be set too
+    status_code = 3 if resolved else 1
+    age = "400 days" if resolved else "1 day"
+    cur.execute(
+        f"""
+        INSERT INTO issues (store_name, store_number, issue_name, priority,
+                            priority_code, device_type, category, description,
+                            status, status_code, created_at, updated_at)
+        SELECT 'Store ' || s, s, 'Bench issue ' || g, '2', 2,
+               'Computer', 'Hardware', repeat('x', 200), %s, %s,
+               NOW() - INTERVAL '{age}' - (g %% 300) * INTERVAL '1 day',
+               NOW() - INTERVAL '{age}' - (g %% 300) * INTERVAL '1 day'
+        FROM generate_series(1, %s) AS g,
+             LATERAL (SELECT 1 + (g %% {STORES}) AS s) AS st;
+        """,
+        (api_server.ISSUE_STATUSES[status_code], status_code, count),
+    )
+
+
+def time_query(cur, sql: str) -> tuple[float, float]:
+    samples = []
+    for _ in range(QUERIES_PER_STEP):
+        store = random.randint(1, STORES)
+        start = time.perf_counter()
+        cur.execute(sql, (store,))
+        cur.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+
+def main():
+    conn = api_server.STORAGE.connect()
+    cur = conn.cursor()
+
+    insert_issues(cur, OPEN_ISSUES, resolved=False)
+    conn.commit()
+
+    hot_sql = f"SELECT * FROM {api_server.issues_source(False)} WHERE store_number = %s ORDER BY id;"
+    all_sql = f"SELECT * FROM {api_server.issues_source(True)} WHERE store_number = %s ORDER BY id;"
+
+    print(f"{'history':>10} {'hot p50 ms':>11} {'hot p95 ms':>11} {'all p50 ms':>11} {'all p95 ms':>11}")
+    seeded = 0
+    for target in HISTORY_STEPS:
+        if target > seeded:
+            insert_issues(cur, target - seeded, resolved=True)
+            conn.commit()
+            seeded = target
+            api_server.archive_resolved_issues(older_than_days=api_server.ARCHIVE_AFTER_DAYS,
+                                               batch_size=5_000)
+            cur.execute("ANALYZE issues; ANALYZE issues_archive;")
+            conn.commit()
+
+        hot_p50, hot_p95 = time_query(cur, hot_sql)
+        all_p50, all_p95 = time_query(cur, all_sql)
+        print(f"{target:>10} {hot_p50:>11.2f} {hot_p95:>11.2f} {all_p50:>11.2f} {all_p95:>11.2f}")
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        _admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        _admin.close()
@@ -0,0 +1,108 @@
+"""
+Write overhead of the issue_events audit trigger.
+
+Times single-row UPDATEs on issues (the shape PATCH /issues/<id> issues)
+with the trg_issue_events trigger enabled and disabled, and fails if the
+extra cost per write is above AUDIT_BUDGET_MS.
+
+Usage:
+    DATABASE_URL=postgres://... python benchmarks/issue_events_overhead.py
+
+Runs in the `bench_audit` schema, which is dropped at the end.
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+SCHEMA = "bench_audit"
+ROWS = 5_000
+WRITES = 3_000
+AUDIT_BUDGET_MS = float(os.environ.get("AUDIT_BUDGET_MS", "0.5"))
+
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA}"
+os.environ["ARCHIVE_INTERVAL_SECONDS"] = "0"
+
+import psycopg2  # noqa: E402
+
+if not os.environ.get("DATABASE_URL"):
+    sys.exit("DATABASE_URL is not set")
+
+_admin = psycopg2.connect(os.environ["DATABASE_URL"], options="-c search_path=public")
+_admin.autocommit = True
+_admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_server  # noqa: E402
+
+
+def time_writes(conn) -> list[float]:
+    cur = conn.cursor()
+    samples = []
+    for i in range(WRITES):
+        issue_id = random.randint(1, ROWS)
+        status_code = 1 + i % 3
+        start = time.perf_counter()
+        cur.execute(
+            """
+            UPDATE issues
+            SET status = %s, status_code = %s, updated_at = NOW(),
+                row_version = row_version + 1
+            WHERE id = %s;
+            """,
+            (api_server.ISSUE_STATUSES[status_code], status_code, issue_id),
+        )
+        conn.commit()
+        samples.append((time.perf_counter() - start) * 1000)
+    cur.close()
+    return samples
+
+
+def main() -> int:
+    conn = api_server.STORAGE.connect()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO issues (store_name, store_number, issue_name, priority,
+                            priority_code, status, status_code, description)
+        SELECT 'Store ' || (g %% 200), g %% 200, 'Bench issue ' || g, '2', 2,
+               'Unresolved', 1, repeat('x', 200)
+        FROM generate_series(1, %s) AS g;
+        """,
+        (ROWS,),
+    )
+    conn.commit()
+
+    cur.execute("ALTER TABLE issues DISABLE TRIGGER trg_issue_events;")
+    conn.commit()
+    time_writes(conn)  # warm-up
+    without = time_writes(conn)
+
+    cur.execute("ALTER TABLE issues ENABLE TRIGGER trg_issue_events;")
+    conn.commit()
+    with_trigger = time_writes(conn)
+
+    cur.execute("SELECT COUNT(*) AS n FROM issue_events WHERE op = 'U';")
+    events = cur.fetchone()["n"]
+    cur.close()
+    conn.close()
+
+    base = statistics.median(without)
+    audited = statistics.median(with_trigger)
+    overhead = audited - base
+    print(f"median write without trigger: {base:.3f} ms")
+    print(f"median write with trigger:    {audited:.3f} ms")
+    print(f"overhead per write:           {overhead:.3f} ms (budget {AUDIT_BUDGET_MS:.3f} ms)")
+    print(f"update events recorded:       {events}")
+
+    return 0 if overhead <= AUDIT_BUDGET_MS else 1
+
+
+if __name__ == "__main__":
+    try:
+        code = main()
+    finally:
+        _admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        _admin.close()
+    sys.exit(code)
@@ -0,0 +1,167 @@
+"""
+Query plans and latency of the common /issues/search shapes.
+
+Seeds a scratch schema with a realistic issue history, then runs each
+search shape through the exact SQL the API builds
+(PostgresStorage.search_sql). Every shape lists the composite index
+init_db() creates for it; the EXPLAIN (ANALYZE) plan of the first page and
+of the keyset-paged second page must use that index. Timings are medians
+over repeated runs.
+
+Usage:
+    DATABASE_URL=postgres://... python benchmarks/search_plans.py
+
+Exits with status 1 when a plan misses its index and prints that plan.
+Everything happens in the `bench_search` schema, which is dropped at the
+end. Nothing in the public schema is touched.
+"""
+import os
+import sys
+import json
+import time
+import statistics
+from datetime import datetime, timezone, timedelta
+
+SCHEMA = "bench_search"
+STORES = 400
+ISSUES = 300_000
+PAGE_SIZE = 50
+RUNS_PER_SHAPE = 50
+
+# Route every api_server connection into the scratch schema and keep the
+# background archiver off.
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA}"
+os.environ["ARCHIVE_INTERVAL_SECONDS"] = "0"
+
+import psycopg2  # noqa: E402
+
+if not os.environ.get("DATABASE_URL"):
+    sys.exit("DATABASE_URL is not set")
+
+_admin = psycopg2.connect(os.environ["DATABASE_URL"], options="-c search_path=public")
+_admin.autocommit = True
+_admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_server  # noqa: E402  (runs init_db() inside the scratch schema)
+
+
+def search_shapes(now: datetime) -> list:
+    """(name, filters, sort, index the plan must use)"""
+    week_ago = now - timedelta(days=7)
+    return [
+        ("recently updated, newest first",
+         {"updated_since": week_ago}, ("updated_at", True),
+         "idx_issues_updated"),
+        ("created in a date range",
+         {"created_since": now - timedelta(days=60), "created_before": now - timedelta(days=30)},
+         ("created_at", False),
+         "idx_issues_created"),
+        ("one store, newest first",
+         {"store_numbers": [7]}, ("updated_at", True),
+         "idx_issues_store_updated"),
+        ("critical open issues updated this week",
+         {"status_codes": [1, 2], "priority_codes": [1], "updated_since": week_ago},
+         ("updated_at", True),
+         "idx_issues_status_priority_updated"),
+        ("one store's open issues",
+         {"store_numbers": [7], "status_codes": [1]}, ("id", False),
+         "idx_issues_store_status"),
+    ]
+
+
+def insert_issues(cur, count: int):
+    # ~70% resolved/closed, ~10% critical, spread over two years
+    cur.execute(
+        f"""
+        INSERT INTO issues (store_name, store_number, issue_name, status, status_code,
+                            priority, priority_code, device_type, category,
+                            created_at, updated_at)
+        SELECT 'Store ' || src.s, src.s, 'Bench issue ' || src.g, st.label, src.status_code,
+               src.priority_code::text, src.priority_code, 'Computer', 'Hardware',
+               src.created_at, src.created_at + random() * (NOW() - src.created_at)
+        FROM (
+            SELECT g,
+                   1 + (g %% {STORES}) AS s,
+                   CASE WHEN random() < 0.7 THEN 3 + g %% 2 ELSE 1 + g %% 2 END AS status_code,
+                   CASE WHEN g %% 10 = 0 THEN 1 WHEN g %% 3 = 0 THEN 3 ELSE 2 END AS priority_code,
+                   NOW() - random() * INTERVAL '730 days' AS created_at
+            FROM generate_series(1, %s) AS g
+        ) AS src
+        JOIN issue_statuses st ON st.code = src.status_code;
+        """,
+        (count,),
+    )
+
+
+def plan_indexes(node: dict) -> set:
+    """Every index an EXPLAIN (FORMAT JSON) plan tree touches."""
+    found = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        found |= plan_indexes(child)
+    return found
+
+
+def check_plan(cur, query: str, params: list, expected: str) -> bool:
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params)
+    plan = cur.fetchone()["QUERY PLAN"]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    if expected in plan_indexes(plan[0]["Plan"]):
+        return True
+
+    cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+    print("\n".join(r["QUERY PLAN"] for r in cur.fetchall()))
+    return False
+
+
+def time_query(cur, query: str, params: list) -> float:
+    samples = []
+    for _ in range(RUNS_PER_SHAPE):
+        start = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> bool:
+    conn = api_server.STORAGE.connect()
+    cur = conn.cursor()
+
+    insert_issues(cur, ISSUES)
+    conn.commit()
+    cur.execute("ANALYZE issues;")
+    conn.commit()
+
+    all_ok = True
+    print(f"{'shape':<42} {'page':>4} {'p50 ms':>8}  index")
+    for name, filters, sort, expected in search_shapes(datetime.now(timezone.utc)):
+        after = None
+        for page in (1, 2):
+            query, params = api_server.STORAGE.search_sql(
+                filters, sort=sort, after=after, limit=PAGE_SIZE
+            )
+            ok = check_plan(cur, query, params, expected)
+            all_ok = all_ok and ok
+            p50 = time_query(cur, query, params)
+            print(f"{name:<42} {page:>4} {p50:>8.2f}  {expected}{'' if ok else '  NOT USED'}")
+
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            if len(rows) < PAGE_SIZE:
+                break
+            after = (rows[-1][sort[0]], rows[-1]["id"])
+
+    cur.close()
+    conn.close()
+    return all_ok
+
+
+if __name__ == "__main__":
+    try:
+        ok = main()
+    finally:
+        _admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        _admin.close()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,359 @@
+"""
+Bulk device inventory import for the store_devices table.
+
+Streams a CSV export of the tech inventory, COPYs it into a temp table and
+merges it into store_devices in one transaction, reporting how many devices
+were inserted, updated, unchanged and (optionally) removed.
+
+Used by POST /devices/bulk-upsert in api_server.py, and runnable directly:
+
+    python inventory_import.py inventory.csv --dry-run
+    python inventory_import.py inventory.csv --prune
+
+CSV columns (header names are case/space-insensitive):
+    store_number, device_type, device_number, manufacturer, model,
+    device_notes (or notes), device_uid (optional - derived if blank)
+"""
+import os
+import io
+import csv
+import sys
+import argparse
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+
+DEVICE_FIELDS = [
+    "device_uid",
+    "store_number",
+    "device_type",
+    "device_number",
+    "manufacturer",
+    "model",
+    "device_notes",
+]
+
+# Alternate header spellings seen in inventory exports
+HEADER_ALIASES = {
+    "store": "store_number",
+    "store_#": "store_number",
+    "type": "device_type",
+    "device": "device_type",
+    "number": "device_number",
+    "device_#": "device_number",
+    "manufacturer_name": "manufacturer",
+    "notes": "device_notes",
+    "uid": "device_uid",
+}
+
+SAMPLE_SIZE = 20  # uids listed per bucket in a dry-run diff
+
+
+class InventoryImportError(ValueError):
+    """Raised for input that cannot be imported (bad header, bad row)."""
+
+
+def normalize_header(name: str) -> str:
+    key = "_".join((name or "").strip().lower().split())
+    return HEADER_ALIASES.get(key, key)
+
+
+def clean(value):
+    value = (value or "").strip()
+    return value or None
+
+
+def normalize_store_number(raw, line_no: int) -> int:
+    """'19340', '19340.00' -> 19340"""
+    try:
+        return int(float(str(raw).strip()))
+    except (TypeError, ValueError):
+        raise InventoryImportError(f"Line {line_no}: store_number '{raw}' is not a number")
+
+
+def derive_device_uid(row: dict) -> str:
+    """Stable uid for rows exported without one: STORE-TYPE-NUMBER (or model)."""
+    parts = [
+        str(row["store_number"]),
+        row["device_type"] or "",
+        row["device_number"] or row["model"] or "",
+    ]
+    return "-".join("_".join(p.upper().split()) for p in parts)
+
+
+def iter_device_rows(text_stream):
+    """
+    Parse the inventory CSV incrementally, yielding normalized device dicts.
+    Raises InventoryImportError on a missing column or unusable row.
+    """
+    reader = csv.reader(text_stream)
+    try:
+        header = [normalize_header(h) for h in next(reader)]
+    except StopIteration:
+        return
+
+    for required in ("store_number", "device_type"):
+        if required not in header:
+            raise InventoryImportError(f"CSV is missing the '{required}' column")
+
+    for line_no, values in enumerate(reader, start=2):
+        if not any(v.strip() for v in values):
+            continue
+
+        raw = dict(zip(header, values))
+        row = {field: clean(raw.get(field)) for field in DEVICE_FIELDS}
+
+        if not row["device_type"]:
+            raise InventoryImportError(f"Line {line_no}: device_type is blank")
+        row["store_number"] = normalize_store_number(row["store_number"], line_no)
+
+        if not row["device_uid"]:
+            row["device_uid"] = derive_device_uid(row)
+
+        yield row
+
+
+class CopyStream(io.RawIOBase):
+    """
+    File-like adapter so COPY can pull CSV lines straight from the row
+    generator without building the whole file in memory.
+    """
+
+    def __init__(self, rows, fields=DEVICE_FIELDS):
+        self._rows = iter(rows)
+        self._fields = fields
+        self._buffer = b""
+        self.count = 0
+        self.error = None
+
+    def readable(self):
+        return True
+
+    def _next_line(self) -> bytes:
+        row = next(self._rows)
+        self.count += 1
+        out = io.StringIO()
+        csv.writer(out).writerow(
+            ["\\N" if row[f] is None else row[f] for f in self._fields]
+        )
+        return out.getvalue().encode("utf-8")
+
+    def read(self, size=-1):
+        try:
+            while size < 0 or len(self._buffer) < size:
+                self._buffer += self._next_line()
+        except StopIteration:
+            pass
+        except ValueError as e:
+            # Raising inside read() only surfaces as a generic COPY failure,
+            # so end the stream here and let the caller re-raise
+            self.error = e
+
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def bulk_upsert_devices(conn, text_stream, dry_run: bool = False, prune: bool = False) -> dict:
+    """
+    Merge a device inventory CSV into store_devices.
+
+    - inserted:  uids not yet in store_devices
+    - updated:   existing uids whose columns changed
+    - unchanged: existing uids with identical data (not written at all)
+    - would_remove: devices of the stores in the file that the file no
+                 longer lists
+    - removed:   how many of those were deleted (prune=True, not a dry run;
+                 0 otherwise)
+    - skipped_unknown_store: rows whose store_number is not in stores
+
+    With dry_run the diff (counts plus sample uids) is computed and the
+    transaction rolled back. Returns the report dict.
+    """
+    cur = conn.cursor()
+
+    cur.execute(
+        """
+        CREATE TEMP TABLE device_import (
+            seq BIGINT GENERATED ALWAYS AS IDENTITY,
+            device_uid TEXT NOT NULL,
+            store_number INTEGER NOT NULL,
+            device_type TEXT NOT NULL,
+            device_number TEXT,
+            manufacturer TEXT,
+            model TEXT,
+            device_notes TEXT
+        ) ON COMMIT DROP;
+        """
+    )
+
+    stream = CopyStream(iter_device_rows(text_stream))
+    cur.copy_expert(
+        f"COPY device_import ({', '.join(DEVICE_FIELDS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        stream,
+    )
+    if stream.error:
+        conn.rollback()
+        cur.close()
+        raise stream.error
+
+    # Last occurrence of a uid in the file wins; unknown stores are set aside
+    cur.execute(
+        """
+        CREATE TEMP TABLE device_staged ON COMMIT DROP AS
+        SELECT DISTINCT ON (i.device_uid)
+            i.device_uid, i.store_number, i.device_type, i.device_number,
+            i.manufacturer, i.model, i.device_notes
+        FROM device_import i
+        JOIN stores s ON s.store_number = i.store_number
+        ORDER BY i.device_uid, i.seq DESC;
+
+        CREATE UNIQUE INDEX ON device_staged (device_uid);
+        ANALYZE device_staged;
+        """
+    )
+
+    cur.execute(
+        """
+        SELECT COUNT(*) AS n
+        FROM device_import i
+        WHERE NOT EXISTS (SELECT 1 FROM stores s WHERE s.store_number = i.store_number);
+        """
+    )
+    skipped = cur.fetchone()["n"]
+
+    diff_sql = """
+        SELECT
+            st.device_uid,
+            CASE
+                WHEN d.id IS NULL THEN 'inserted'
+                WHEN (d.store_number, d.device_type, d.device_number,
+                      d.manufacturer, d.model, d.device_notes)
+                     IS DISTINCT FROM
+                     (st.store_number, st.device_type, st.device_number,
+                      st.manufacturer, st.model, st.device_notes) THEN 'updated'
+                ELSE 'unchanged'
+            END AS outcome
+        FROM device_staged st
+        LEFT JOIN store_devices d ON d.device_uid = st.device_uid
+    """
+    removed_sql = """
+        SELECT d.device_uid
+        FROM store_devices d
+        WHERE d.store_number IN (SELECT DISTINCT store_number FROM device_staged)
+          AND NOT EXISTS (SELECT 1 FROM device_staged st WHERE st.device_uid = d.device_uid)
+    """
+
+    cur.execute(
+        f"""
+        SELECT outcome, COUNT(*) AS n,
+               (array_agg(device_uid ORDER BY device_uid))[1:{SAMPLE_SIZE}] AS sample
+        FROM ({diff_sql}) AS diff
+        GROUP BY outcome;
+        """
+    )
+    report = {
+        "rows_read": stream.count,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "would_remove": 0,
+        "removed": 0,
+        "skipped_unknown_store": skipped,
+        "dry_run": dry_run,
+        "pruned": prune and not dry_run,
+    }
+    samples = {}
+    for row in cur.fetchall():
+        report[row["outcome"]] = row["n"]
+        samples[row["outcome"]] = row["sample"]
+
+    cur.execute(
+        f"""
+        SELECT COUNT(*) AS n,
+               (array_agg(device_uid ORDER BY device_uid))[1:{SAMPLE_SIZE}] AS sample
+        FROM ({removed_sql}) AS gone;
+        """
+    )
+    gone = cur.fetchone()
+    report["would_remove"] = gone["n"]
+    samples["would_remove"] = gone["sample"] or []
+
+    if dry_run:
+        report["sample"] = samples
+        conn.rollback()
+        cur.close()
+        return report
+
+    # Unchanged rows are filtered out by the WHERE so they are never rewritten
+    cur.execute(
+        """
+        INSERT INTO store_devices
+            (device_uid, store_number, device_type, device_number,
+             manufacturer, model, device_notes)
+        SELECT device_uid, store_number, device_type, device_number,
+               manufacturer, model, device_notes
+        FROM device_staged
+        ON CONFLICT (device_uid) DO UPDATE SET
+            store_number = EXCLUDED.store_number,
+            device_type = EXCLUDED.device_type,
+            device_number = EXCLUDED.device_number,
+            manufacturer = EXCLUDED.manufacturer,
+            model = EXCLUDED.model,
+            device_notes = EXCLUDED.device_notes,
+            updated_at = NOW()
+        WHERE (store_devices.store_number, store_devices.device_type,
+               store_devices.device_number, store_devices.manufacturer,
+               store_devices.model, store_devices.device_notes)
+              IS DISTINCT FROM
+              (EXCLUDED.store_number, EXCLUDED.device_type,
+               EXCLUDED.device_number, EXCLUDED.manufacturer,
+               EXCLUDED.model, EXCLUDED.device_notes);
+        """
+    )
+
+    if prune:
+        cur.execute(f"DELETE FROM store_devices WHERE device_uid IN ({removed_sql});")
+        report["removed"] = cur.rowcount
+
+    conn.commit()
+    cur.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk upsert a device inventory CSV into store_devices.")
+    parser.add_argument("csv_path", help="inventory CSV export")
+    parser.add_argument("--dry-run", action="store_true", help="show what would change, write nothing")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete devices of the listed stores that the CSV no longer contains")
+    args = parser.parse_args(argv)
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        sys.exit("DATABASE_URL is not set")
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        with open(args.csv_path, newline="", encoding="utf-8-sig") as f:
+            report = bulk_upsert_devices(conn, f, dry_run=args.dry_run, prune=args.prune)
+    except InventoryImportError as e:
+        sys.exit(f"Import failed: {e}")
+    finally:
+        conn.close()
+
+    label = "Dry run" if report["dry_run"] else "Imported"
+    print(f"{label}: {report['rows_read']} rows read")
+    for key in ("inserted", "updated", "unchanged", "would_remove", "removed", "skipped_unknown_store"):
+        print(f"  {key}: {report[key]}")
+    if report["would_remove"] and not report["pruned"]:
+        print("  (removed devices were kept; re-run with --prune to delete them)")
+    for outcome, uids in report.get("sample", {}).items():
+        if uids:
+            print(f"  {outcome} e.g.: {', '.join(uids)}")
+
+
+if __name__ == "__main__":
+    main()
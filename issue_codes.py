@@ -0,0 +1,67 @@
+"""
+Issue status and priority codes.
+
+Codes are stored in issues.status_code / issues.priority_code; the text
+columns are kept (canonical label / "1"-"3") so older clients keep working.
+No database or server imports here, so one-off scripts
+(migrate_known_issues.py) can normalize values without starting api_server.
+"""
+
+ISSUE_STATUSES = {1: "Unresolved", 2: "In Progress", 3: "Resolved", 4: "Closed"}
+ISSUE_PRIORITIES = {1: "Critical", 2: "Functional", 3: "Cosmetic"}
+
+STATUS_ALIASES = {
+    "unresolved": 1, "open": 1, "new": 1, "not resolved": 1,
+    "in progress": 2, "in-progress": 2, "inprogress": 2, "working": 2, "pending": 2,
+    "resolved": 3, "fixed": 3, "done": 3,
+    "closed": 4,
+}
+PRIORITY_ALIASES = {
+    "critical": 1, "crit": 1, "high": 1, "p1": 1,
+    "functional": 2, "medium": 2, "p2": 2,
+    "cosmetic": 3, "low": 3, "p3": 3,
+}
+
+
+def normalize_code(raw, labels: dict, aliases: dict):
+    """
+    Map a status/priority value to its code. Accepts the code itself (1 or
+    "1"), the label in any case, known aliases, and legacy "1 - Critical"
+    style strings. Returns None for blank input; raises ValueError if the
+    value is not recognised.
+    """
+    if raw is None:
+        return None
+    if isinstance(raw, bool):
+        raise ValueError(raw)
+    if isinstance(raw, int):
+        if raw in labels:
+            return raw
+        raise ValueError(raw)
+
+    text = " ".join(str(raw).strip().lower().split())
+    if not text:
+        return None
+
+    for code, label in labels.items():
+        if text == label.lower():
+            return code
+    if text in aliases:
+        return aliases[text]
+
+    # "1", "1 - Critical", "2-functional", ...
+    head = text.split("-")[0].split()[0] if text[0].isdigit() else ""
+    if head.isdigit() and int(head) in labels:
+        return int(head)
+
+    raise ValueError(raw)
+
+
+def normalize_status(raw):
+    """Status value (label, alias or code) -> status code."""
+    return normalize_code(raw, ISSUE_STATUSES, STATUS_ALIASES)
+
+
+def normalize_priority(raw):
+    """Priority value ("1", "1 - Critical", "critical", 1) -> priority code."""
+    return normalize_code(raw, ISSUE_PRIORITIES, PRIORITY_ALIASES)
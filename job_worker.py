@@ -0,0 +1,32 @@
+"""
+Background job worker.
+
+Claims queued rows from the jobs table (FOR UPDATE SKIP LOCKED, so any
+number of workers can run side by side) and runs them off the request
+path. Handlers live in api_server.JOB_HANDLERS.
+
+    DATABASE_URL=postgres://... python job_worker.py
+    python job_worker.py --once      # drain the queue and exit (cron)
+"""
+import os
+import argparse
+import logging
+
+# The API process already runs the archiver; workers only run jobs
+os.environ.setdefault("ARCHIVE_INTERVAL_SECONDS", "0")
+
+import api_server  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run queued background jobs.")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    parser.add_argument("--worker-id", help="name recorded in jobs.locked_by")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    api_server.run_job_worker(worker_id=args.worker_id, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+One-off migration of the "Known Issues" lists kept in legacy Stores.json
+files into the Postgres issues table.
+
+    python migrate_known_issues.py                 # default legacy folders
+    python migrate_known_issues.py path/to/Stores.json ... --dry-run
+
+- Files are read incrementally, one store entry at a time.
+- Legacy keys are mapped onto issues columns (see LEGACY_KEY_MAP) and
+  status/priority are normalized the same way POST /issues does.
+- Every issue gets a content hash; an issue already imported (from this
+  file, another copy of Stores.json or an earlier run) is skipped.
+- Issues are inserted in batches. After each batch the number of store
+  entries finished in that file is checkpointed, so an interrupted run
+  resumes where it stopped. A file whose contents changed starts over
+  (the hash check still prevents duplicates).
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+from issue_codes import ISSUE_STATUSES, normalize_status, normalize_priority
+
+
+DEFAULT_SOURCES = [
+    os.path.join("CCT_1.0.1", "Stores.json"),
+    os.path.join("CCT_2.2.5", "Stores.json"),
+    os.path.join("CCT 2.1.0", "Stores.json"),
+    os.path.join("Database Files", "Stores.json"),
+]
+
+# Legacy Known Issues key -> issues column
+LEGACY_KEY_MAP = {
+    "Issue Name": "issue_name",
+    "Priority": "priority",
+    "Store Number": "store_number",
+    "Computer Number": "computer_number",
+    "Type": "category",
+    "Description": "description",
+    "Narrative": "narrative",
+    "Replicable?": "replicable",
+    "Status": "status",
+    "Resolution": "resolution",
+}
+
+# Columns that make up an issue's identity for de-duplication
+HASH_COLUMNS = [
+    "store_name", "store_number", "issue_name", "priority", "computer_number",
+    "category", "description", "narrative", "replicable", "status", "resolution",
+]
+
+INSERT_COLUMNS = HASH_COLUMNS + ["status_code", "priority_code"]
+
+BATCH_SIZE = 500
+MIGRATION_ACTOR = "legacy-migration"
+MIGRATION_LOCK_ID = 7_311_042  # pg_advisory_lock key: one migrator at a time
+READ_CHUNK = 64 * 1024
+
+
+def ensure_tables(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS legacy_issue_imports (
+            content_hash TEXT PRIMARY KEY,
+            issue_id INTEGER,
+            source_file TEXT NOT NULL,
+            imported_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS legacy_import_checkpoints (
+            source_file TEXT PRIMARY KEY,
+            file_sha256 TEXT NOT NULL,
+            stores_done INTEGER NOT NULL DEFAULT 0,
+            completed_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """
+    )
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_json_object_items(f):
+    """
+    Yield (key, value) pairs of a top-level JSON object, decoding one value
+    at a time from READ_CHUNK-sized reads instead of loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(READ_CHUNK)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        """Skip whitespace and return the next significant character ('' at EOF)."""
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos] if pos < len(buf) else ""
+            fill()
+
+    def decode():
+        nonlocal pos
+        next_char()  # raw_decode does not skip leading whitespace
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                # A value ending exactly at the buffer edge may be cut short
+                fill()
+                continue
+            pos = end
+            return value
+
+    if next_char() != "{":
+        raise ValueError("expected a JSON object at the top level")
+    pos += 1
+
+    while True:
+        ch = next_char()
+        if ch == "}":
+            return
+        if ch == ",":
+            pos += 1
+            continue
+        key = decode()
+        if next_char() != ":":
+            raise ValueError(f"expected ':' after key {key!r}")
+        pos += 1
+        yield key, decode()
+
+
+def clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def map_legacy_issue(store_name: str, store: dict, legacy: dict) -> dict:
+    """Translate one legacy Known Issues entry into an issues row dict."""
+    row = {column: clean(legacy.get(key)) for key, column in LEGACY_KEY_MAP.items()}
+    row["store_name"] = store_name
+
+    number = row["store_number"] or clean(store.get("Store Number"))
+    try:
+        row["store_number"] = int(float(number)) if number else None
+    except ValueError:
+        row["store_number"] = None
+
+    try:
+        row["status_code"] = normalize_status(row["status"])
+        if row["status_code"] is not None:
+            row["status"] = ISSUE_STATUSES[row["status_code"]]
+    except ValueError:
+        row["status_code"] = None  # keep the legacy text as-is
+    try:
+        row["priority_code"] = normalize_priority(row["priority"])
+        if row["priority_code"] is not None:
+            row["priority"] = str(row["priority_code"])
+    except ValueError:
+        row["priority_code"] = None
+
+    return row
+
+
+def content_hash(row: dict) -> str:
+    """Hash of the normalized issue content (case/whitespace-insensitive)."""
+    canonical = [
+        " ".join(str(row[c]).lower().split()) if row[c] is not None else None
+        for c in HASH_COLUMNS
+    ]
+    return hashlib.sha256(json.dumps(canonical).encode("utf-8")).hexdigest()
+
+
+def flush_batch(cur, batch: list, source_file: str, dry_run: bool) -> int:
+    """Insert the not-yet-imported issues of a batch; return how many were new."""
+    if not batch:
+        return 0
+
+    cur.execute(
+        "SELECT content_hash FROM legacy_issue_imports WHERE content_hash = ANY(%s);",
+        ([h for h, _ in batch],),
+    )
+    seen = {r["content_hash"] for r in cur.fetchall()}
+    fresh = [(h, row) for h, row in batch if h not in seen]
+    if not fresh or dry_run:
+        return len(fresh)
+
+    inserted = execute_values(
+        cur,
+        f"INSERT INTO issues ({', '.join(INSERT_COLUMNS)}) VALUES %s RETURNING id;",
+        [tuple(row[c] for c in INSERT_COLUMNS) for _, row in fresh],
+        page_size=BATCH_SIZE,
+        fetch=True,
+    )
+    execute_values(
+        cur,
+        "INSERT INTO legacy_issue_imports (content_hash, issue_id, source_file) VALUES %s;",
+        [(h, r["id"], source_file) for (h, _), r in zip(fresh, inserted)],
+    )
+    return len(fresh)
+
+
+def migrate_file(conn, path: str, seen: set, dry_run: bool = False) -> dict:
+    """
+    Migrate one Stores.json. `seen` collects content hashes across files so
+    copies of the same issue in several files are only counted once.
+    """
+    source_file = os.path.normpath(path)
+    sha = file_sha256(path)
+    cur = conn.cursor()
+
+    cur.execute(
+        "SELECT file_sha256, stores_done, completed_at FROM legacy_import_checkpoints WHERE source_file = %s;",
+        (source_file,),
+    )
+    checkpoint = cur.fetchone()
+    resume_from = 0
+    if checkpoint and checkpoint["file_sha256"] == sha:
+        if checkpoint["completed_at"] is not None:
+            return {"file": source_file, "status": "already migrated", "read": 0, "inserted": 0}
+        resume_from = checkpoint["stores_done"]
+
+    stats = {"file": source_file, "status": "migrated", "read": 0, "inserted": 0,
+             "resumed_at_store": resume_from}
+    batch = []
+    stores_done = 0
+
+    def save_checkpoint(completed: bool):
+        if dry_run:
+            return
+        cur.execute(
+            """
+            INSERT INTO legacy_import_checkpoints (source_file, file_sha256, stores_done, completed_at)
+            VALUES (%s, %s, %s, CASE WHEN %s THEN NOW() END)
+            ON CONFLICT (source_file) DO UPDATE SET
+                file_sha256 = EXCLUDED.file_sha256,
+                stores_done = EXCLUDED.stores_done,
+                completed_at = EXCLUDED.completed_at,
+                updated_at = NOW();
+            """,
+            (source_file, sha, stores_done, completed),
+        )
+        conn.commit()
+
+    with open(path, encoding="utf-8-sig") as f:
+        for store_name, store in iter_json_object_items(f):
+            stores_done += 1
+            if stores_done <= resume_from or not isinstance(store, dict):
+                continue
+
+            for legacy in store.get("Known Issues") or []:
+                if not isinstance(legacy, dict):
+                    continue
+                stats["read"] += 1
+                row = map_legacy_issue(store_name, store, legacy)
+                h = content_hash(row)
+                if h in seen:
+                    continue
+                seen.add(h)
+                batch.append((h, row))
+
+            # Flush on store boundaries so the checkpoint never splits a store
+            if len(batch) >= BATCH_SIZE:
+                stats["inserted"] += flush_batch(cur, batch, source_file, dry_run)
+                save_checkpoint(False)
+                batch = []
+
+    stats["inserted"] += flush_batch(cur, batch, source_file, dry_run)
+    save_checkpoint(True)
+    cur.close()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate legacy Stores.json Known Issues into Postgres.")
+    parser.add_argument("files", nargs="*", help="Stores.json files (default: the legacy CCT folders)")
+    parser.add_argument("--dry-run", action="store_true", help="count what would be imported, write nothing")
+    args = parser.parse_args(argv)
+
+    files = args.files or [p for p in DEFAULT_SOURCES if os.path.exists(p)]
+    if not files:
+        sys.exit("No Stores.json files found")
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        sys.exit("DATABASE_URL is not set")
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (MIGRATION_LOCK_ID,))
+    if not cur.fetchone()["locked"]:
+        sys.exit("Another migration is already running")
+
+    try:
+        ensure_tables(cur)
+        conn.commit()
+        # Session-level so every batch's issue_events rows carry the same actor
+        cur.execute("SELECT set_config('app.actor', %s, false);", (MIGRATION_ACTOR,))
+        conn.commit()
+
+        seen = set()
+
+        for path in files:
+            stats = migrate_file(conn, path, seen, dry_run=args.dry_run)
+            if stats["status"] == "already migrated":
+                print(f"{stats['file']}: already migrated, skipped")
+                continue
+            resumed = f" (resumed after {stats['resumed_at_store']} stores)" if stats["resumed_at_store"] else ""
+            verb = "would insert" if args.dry_run else "inserted"
+            print(f"{stats['file']}: {stats['read']} issues read, {stats['inserted']} {verb}{resumed}")
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2309 @@
+"""
+Storage backends for the core API data: issues, users, stores and
+store_devices.
+
+api_server.py talks to these through the Storage interface, so the core
+endpoints (login, stores, issue CRUD/search, devices by store) run either
+on Postgres or on a local SQLite file:
+
+    DATABASE_URL=postgres://user:pw@host/db     -> PostgresStorage
+    DATABASE_URL=sqlite:///issue_tracker.db     -> SqliteStorage (relative path)
+    DATABASE_URL=sqlite:////srv/jh/tracker.db   -> SqliteStorage (absolute path)
+
+Postgres-only features (archive, audit history, jobs, reports, dashboards,
+bulk imports...) answer 501 on SQLite. Their queries are PostgresStorage
+methods too, or, for work that runs its own transactions (migrations,
+archiving, report rendering, bulk imports), api_server code on a pooled
+connection from PostgresStorage.session().
+
+Storage.transaction() runs a block of storage calls on one connection and
+commits them together; api_server's Idempotency-Key handling uses it on
+both backends to store a response in the same transaction as its writes.
+
+PostgresStorage borrows connections from a per-process pool and runs the
+hot statements (PREPARED_STATEMENTS) through server-side PREPARE, once per
+pooled connection. Every storage call is timed per query label; see
+Storage.query_stats and GET /db/query-stats.
+
+Request-scoped settings (begin_request/end_request) give Postgres queries
+a statement_timeout and let a watchdog cancel them once the client has
+disconnected. A CircuitBreaker trips when too many calls fail and then
+fails fast with DatabaseUnavailable until the retry window has passed.
+
+With a read URL (DATABASE_READ_URL), reads made by requests that opted in
+(use_replica) go to the replica through its own pool, unless the replica is
+down, lags by more than DB_REPLICA_MAX_LAG_SECONDS, or has not yet replayed
+the client's last write (min_lsn); those reads fall back to the primary.
+
+Search filters (both backends) are a dict with any of:
+    store_numbers, status_codes, priority_codes (lists of int; any of the
+        values matches, see SEARCH_IN_FILTERS)
+    category, device, name, status_text (substring, case-insensitive;
+        status_text is the fallback for a status that is not a known code)
+    global_issue (bool)
+    created_since, created_before, updated_since, updated_before (aware
+        datetimes; "since" inclusive, "before" exclusive, see SEARCH_DATE_FILTERS)
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2.extras import RealDictCursor, execute_values
+
+
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "500"))  # logged at WARNING
+DB_POOL_WAIT_SECONDS = float(os.environ.get("DB_POOL_WAIT_SECONDS", "10"))
+
+# Circuit breaker: open when, within the window, at least MIN_CALLS calls
+# were made and ERROR_RATE of them failed; stay open for OPEN_SECONDS
+DB_BREAKER_WINDOW_SECONDS = float(os.environ.get("DB_BREAKER_WINDOW_SECONDS", "30"))
+DB_BREAKER_MIN_CALLS = int(os.environ.get("DB_BREAKER_MIN_CALLS", "10"))
+DB_BREAKER_ERROR_RATE = float(os.environ.get("DB_BREAKER_ERROR_RATE", "0.5"))
+DB_BREAKER_OPEN_SECONDS = float(os.environ.get("DB_BREAKER_OPEN_SECONDS", "15"))
+
+CANCEL_POLL_SECONDS = 0.5  # how often the watchdog checks for gone clients
+
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get("DB_REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_LAG_CHECK_SECONDS = 5.0
+
+# OperationalErrors a retry can fix: the connection was lost (class 08),
+# the server is shutting down / restarting / still starting, or it is out
+# of connection slots. Authentication and configuration errors are not.
+TRANSIENT_SQLSTATES = {"57P01", "57P02", "57P03", "53300"}
+# libpq reports connect-time failures without a SQLSTATE; when the server
+# did answer (FATAL), only these messages are transient
+TRANSIENT_FATAL_MESSAGES = (
+    "the database system is starting up",
+    "the database system is shutting down",
+    "the database system is in recovery mode",
+    "too many clients",
+    "remaining connection slots are reserved",
+    "terminating connection",
+)
+
+
+STORE_COLUMNS = [
+    "store_number", "store_name", "type", "state", "num_comp",
+    "address", "city", "zip", "phone", "kiosk",
+]
+
+DEVICE_COLUMNS = [
+    "device_uid", "store_number", "device_type", "device_number",
+    "manufacturer", "model", "device_notes", "device_category",
+]
+
+USER_COLUMNS = [
+    "id", "email", "username", "password_hash", "pin_hash", "has_password",
+    "has_pin", "last_login_at", "created_at", "updated_at",
+]
+
+# Columns written by insert_issue / update_issue
+ISSUE_WRITE_COLUMNS = [
+    "store_name", "store_number", "issue_name", "priority", "computer_number",
+    "device_type", "category", "description", "narrative", "replicable",
+    "global_issue", "global_num", "status", "resolution", "status_code",
+    "priority_code",
+]
+
+# update_issue keeps the stored value when these are None
+ISSUE_KEEP_IF_NONE = {"store_name", "store_number", "global_issue", "global_num"}
+
+# Search facet name -> issues column (search_issues_with_facets)
+SEARCH_FACETS = {
+    "status": "status_code",
+    "category": "category",
+    "device_type": "device_type",
+    "store_number": "store_number",
+    "priority": "priority_code",
+}
+SEARCH_FACET_INT_COLUMNS = {"status_code", "store_number", "priority_code"}
+
+# search_issues filters: list-valued key -> column (matches any of the values)
+SEARCH_IN_FILTERS = (
+    ("store_numbers", "store_number"),
+    ("status_codes", "status_code"),
+    ("priority_codes", "priority_code"),
+)
+# Date range key -> (column, operator); "since" is inclusive, "before" exclusive
+SEARCH_DATE_FILTERS = {
+    "created_since": ("created_at", ">="),
+    "created_before": ("created_at", "<"),
+    "updated_since": ("updated_at", ">="),
+    "updated_before": ("updated_at", "<"),
+}
+# Sort keys search_issues accepts; every sort is tie-broken on id
+SEARCH_SORT_KEYS = ("id", "created_at", "updated_at")
+
+
+def like_escape(text: str) -> str:
+    """Escape LIKE/ILIKE wildcards so user input matches literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def issue_patch_sql(issue_id: int, columns: dict, expected_version: int | None = None):
+    """Postgres UPDATE ... RETURNING * for a normalized column dict; (query, params)."""
+    # Column names come from api_server.ISSUE_PATCH_FIELDS, never from the request
+    query = "UPDATE issues SET "
+    query += ", ".join(f"{column} = %s" for column in columns)
+    query += ", updated_at = NOW(), row_version = row_version + 1"
+    query += " WHERE id = %s"
+    params = list(columns.values()) + [issue_id]
+
+    if expected_version is not None:
+        query += " AND row_version = %s"
+        params.append(expected_version)
+
+    query += " RETURNING *;"
+    return query, params
+
+
+class DatabaseUnavailable(Exception):
+    """The circuit breaker is open (or the pool is exhausted); retry later."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(Exception):
+    """A query was cancelled because the client that asked for it went away."""
+
+
+def is_transient_db_error(e: psycopg2.OperationalError) -> bool:
+    """Is this a lost/refused connection or a server restart, worth retrying later?"""
+    if e.pgcode:
+        return e.pgcode.startswith("08") or e.pgcode in TRANSIENT_SQLSTATES
+    message = str(e).lower()
+    if "fatal:" not in message:
+        return True  # no answer from the server at all: network or socket level
+    return any(m in message for m in TRANSIENT_FATAL_MESSAGES)
+
+
+class _ReplicaFailed(Exception):
+    """A replica read failed on a connection error; it is retried on the primary."""
+
+
+class QueryStats:
+    """Per-label call count and latency for storage queries (this process only)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, label: str, seconds: float, failed: bool = False):
+        ms = seconds * 1000
+        with self._lock:
+            entry = self._stats.setdefault(
+                label, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            entry["calls"] += 1
+            entry["errors"] += int(failed)
+            entry["total_ms"] += ms
+            entry["max_ms"] = max(entry["max_ms"], ms)
+        if ms >= SLOW_QUERY_MS:
+            logging.warning("Slow query %s: %.1f ms", label, ms)
+
+    @contextmanager
+    def timed(self, label: str):
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(label, time.perf_counter() - started, failed)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                label: {
+                    "calls": e["calls"],
+                    "errors": e["errors"],
+                    "avg_ms": round(e["total_ms"] / e["calls"], 3),
+                    "max_ms": round(e["max_ms"], 3),
+                    "total_ms": round(e["total_ms"], 3),
+                }
+                for label, e in sorted(self._stats.items())
+            }
+
+
+class CircuitBreaker:
+    """
+    Error-rate breaker over a sliding time window.
+
+    closed: calls go through and outcomes are recorded.
+    open: retry_after() > 0; callers fail fast.
+    half-open: after DB_BREAKER_OPEN_SECONDS calls go through again; the
+    first failure re-opens the breaker, the first success closes it.
+    """
+
+    def __init__(self, name: str = "primary"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (monotonic time, ok)
+        self._open_until = 0.0
+        self._half_open = False
+        self.trips = 0
+
+    def retry_after(self) -> float:
+        """Seconds until calls are allowed again; 0 when closed/half-open."""
+        with self._lock:
+            remaining = self._open_until - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._open_until:
+                self._open_until = 0.0
+                self._half_open = True
+            return 0.0
+
+    def check(self):
+        remaining = self.retry_after()
+        if remaining > 0:
+            raise DatabaseUnavailable("Database circuit breaker is open", remaining)
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self._half_open:
+                self._half_open = False
+                if not ok:
+                    self._trip(now)
+                    return
+                self._outcomes.clear()
+
+            self._outcomes.append((now, ok))
+            while self._outcomes and self._outcomes[0][0] < now - DB_BREAKER_WINDOW_SECONDS:
+                self._outcomes.popleft()
+
+            failures = sum(1 for _, o in self._outcomes if not o)
+            if (
+                len(self._outcomes) >= DB_BREAKER_MIN_CALLS
+                and failures / len(self._outcomes) >= DB_BREAKER_ERROR_RATE
+            ):
+                self._trip(now)
+
+    def _trip(self, now):
+        self._open_until = now + DB_BREAKER_OPEN_SECONDS
+        self._outcomes.clear()
+        self.trips += 1
+        logging.warning("Database circuit breaker (%s) opened for %.0f s", self.name, DB_BREAKER_OPEN_SECONDS)
+
+    def snapshot(self) -> dict:
+        remaining = self.retry_after()
+        with self._lock:
+            failures = sum(1 for _, o in self._outcomes if not o)
+            return {
+                "state": "open" if remaining > 0 else ("half-open" if self._half_open else "closed"),
+                "retry_after_seconds": round(remaining, 1),
+                "window_calls": len(self._outcomes),
+                "window_failures": failures,
+                "trips": self.trips,
+            }
+
+
+class _Watch:
+    def __init__(self, conn, disconnected):
+        self.conn = conn
+        self.disconnected = disconnected
+        self.cancelled = False
+
+
+class QueryWatchdog:
+    """
+    One background thread that cancels in-flight queries whose client has
+    disconnected (conn.cancel() is safe to call from another thread).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watches = set()
+        self._thread = None
+
+    def watch(self, conn, disconnected) -> _Watch:
+        watch = _Watch(conn, disconnected)
+        with self._lock:
+            self._watches.add(watch)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-watchdog", daemon=True)
+                self._thread.start()
+        return watch
+
+    def unwatch(self, watch: _Watch):
+        with self._lock:
+            self._watches.discard(watch)
+
+    def _run(self):
+        while True:
+            time.sleep(CANCEL_POLL_SECONDS)
+            with self._lock:
+                watches = list(self._watches)
+            for watch in watches:
+                try:
+                    if watch.cancelled or not watch.disconnected():
+                        continue
+                    with self._lock:
+                        # Re-checked under the lock: once unwatch() returns the
+                        # connection may already be serving someone else
+                        if watch in self._watches:
+                            watch.cancelled = True
+                            watch.conn.cancel()
+                except Exception:
+                    logging.exception("Cancelling a query for a disconnected client failed")
+
+
+class RequestSettings(threading.local):
+    """Per-thread settings for the request being served (see Storage.begin_request)."""
+
+    timeout_ms = None
+    disconnected = None
+    use_replica = False
+    min_lsn = None  # the client's last write; the replica must have replayed it
+    source = None  # "primary"/"replica": where this request's last read went
+    conn = None  # connection of the open transaction() block, if any
+
+
+class Storage:
+    """Data access used by the core endpoints."""
+
+    name = "base"
+    query_stats: QueryStats
+    request_settings = RequestSettings()
+
+    has_replica = False
+
+    def begin_request(self, timeout_ms=None, disconnected=None, use_replica=False, min_lsn=None):
+        """
+        Scope the calls made by this thread: statement timeout in ms (None =
+        server default), an optional disconnected() -> bool probe, and
+        whether reads may go to the replica (at or past min_lsn).
+        """
+        settings = self.request_settings
+        settings.timeout_ms = timeout_ms
+        settings.disconnected = disconnected
+        settings.use_replica = use_replica
+        settings.min_lsn = min_lsn
+        settings.source = None
+
+    def end_request(self):
+        self.begin_request()
+
+    def current_lsn(self):
+        """Primary WAL position after this request's writes (None without a replica)."""
+        return None
+
+    def init_schema(self):
+        raise NotImplementedError
+
+    def transaction(self):
+        """
+        Context manager: every storage call this thread makes inside the block
+        runs on one connection and is committed when the block exits (rolled
+        back if it raises). A nested block joins the outer one. Yields the
+        connection.
+        """
+        raise NotImplementedError
+
+    # --- idempotency keys ---
+    def claim_idempotency_key(self, idem_key: str, endpoint: str, request_hash: str):
+        """
+        Inside transaction(): claim the key for this request (returns None),
+        or return the {request_hash, status_code, response_body} stored by the
+        request that used it first. A claim racing an uncommitted one waits
+        for that transaction to end.
+        """
+        raise NotImplementedError
+
+    def save_idempotent_response(self, idem_key: str, endpoint: str, status_code: int, body: str):
+        raise NotImplementedError
+
+    def prune_idempotency_keys(self, ttl_hours: int):
+        """Drop stored responses older than ttl_hours."""
+        raise NotImplementedError
+
+    # --- users ---
+    def get_user_by_email(self, email: str):
+        raise NotImplementedError
+
+    def get_user_by_username(self, username: str):
+        raise NotImplementedError
+
+    def upsert_user(self, email: str, username: str, password_hash: str, pin_hash: str):
+        raise NotImplementedError
+
+    def record_logins(self, logins: dict):
+        """Write {email: login datetime}, never moving last_login_at backwards."""
+        raise NotImplementedError
+
+    # --- stores / devices ---
+    def list_stores(self) -> list:
+        raise NotImplementedError
+
+    def issue_count_rows(self, store_numbers=None) -> list:
+        """[{store_number, status_code, priority_code, issue_count}], codes 0 when unknown."""
+        raise NotImplementedError
+
+    def devices_by_store(self, store_number: int) -> list:
+        raise NotImplementedError
+
+    def lookup_stores(self, q: str, limit: int, fuzzy: bool = False) -> list:
+        """
+        Stores matching q (number/ZIP prefix, name/city text), best first,
+        each row with a "score". fuzzy adds pg_trgm similarity matches.
+        """
+        raise NotImplementedError
+
+    # --- issues ---
+    def list_issues(self, store_number=None, store_name=None, include_archived=False) -> list:
+        raise NotImplementedError
+
+    def search_issues(self, filters: dict, include_archived=False,
+                      sort=None, after=None, limit=None) -> list:
+        """
+        Issues matching `filters`, ordered by sort = (key, descending) from
+        SEARCH_SORT_KEYS (default id ascending), then id in the same direction.
+        after = (sort value, id) of the previous page's last row (keyset).
+        """
+        raise NotImplementedError
+
+    def search_issues_with_facets(self, filters: dict, facets: list, include_archived=False,
+                                  sort=None, after=None, limit=None):
+        """
+        search_issues() plus counts over all the matches (not just this page)
+        for each facet name (see SEARCH_FACETS): (rows, {facet: [(value, count), ...]}).
+        """
+        raise NotImplementedError
+
+    def insert_issue(self, fields: dict, actor=None) -> dict:
+        raise NotImplementedError
+
+    def update_issue(self, issue_id: int, fields: dict, actor=None):
+        raise NotImplementedError
+
+    def patch_issue(self, issue_id: int, columns: dict, expected_version=None, actor=None):
+        """
+        Write only `columns`, if row_version still equals expected_version
+        (when given). Returns (updated row, None), or (None, current row or
+        None when the issue does not exist).
+        """
+        raise NotImplementedError
+
+    def delete_issue(self, issue_id: int, actor=None):
+        raise NotImplementedError
+
+    def get_issues(self, issue_ids: list, include_archived=False) -> list:
+        """Issues whose id is in issue_ids (any order; missing ids are skipped)."""
+        raise NotImplementedError
+
+    def delete_issues(self, issue_ids: list, actor=None) -> list:
+        """Delete the given ids in one transaction; returns the deleted rows."""
+        raise NotImplementedError
+
+
+# =========================================
+#               POSTGRES
+# =========================================
+
+# Hot statements, PREPAREd once per pooled connection and run with EXECUTE.
+# Only the hot (non-archived) issues table is used, so plans stay simple.
+# Columns are always listed ({issue_columns} is filled in per storage): a
+# PREPAREd SELECT * fails with "cached plan must not change result type"
+# once init_db() adds a column to the table.
+PREPARED_STATEMENTS = {
+    "user_by_email": f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE email = $1",
+    "user_by_username": f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE username = $1",
+    "issues_by_store_number": "SELECT {issue_columns} FROM issues WHERE store_number = $1 ORDER BY id",
+    "issues_by_store_name": "SELECT {issue_columns} FROM issues WHERE store_name = $1 ORDER BY id",
+    "devices_by_store": f"""
+        SELECT {', '.join(DEVICE_COLUMNS)}
+        FROM store_devices
+        WHERE store_number = $1
+        ORDER BY device_type, device_number NULLS LAST, manufacturer, model
+    """,
+    "insert_issue": f"""
+        INSERT INTO issues ({', '.join(ISSUE_WRITE_COLUMNS)})
+        VALUES ({', '.join(f'${n}' for n in range(1, len(ISSUE_WRITE_COLUMNS) + 1))})
+        RETURNING {{issue_columns}}
+    """,
+}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Pool connection that remembers its PREPAREd statements and statement_timeout."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.statement_timeout = None  # None = server default
+
+
+class ConnectionPool:
+    """
+    Lazily created ThreadedConnectionPool for one server, with its own
+    circuit breaker. Callers wait up to DB_POOL_WAIT_SECONDS for a free
+    connection (ThreadedConnectionPool itself raises instead of waiting).
+    """
+
+    def __init__(self, dsn: str, name: str):
+        self.dsn = dsn
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+    def _get_pool(self):
+        with self._lock:
+            # A forked worker must not share its parent's sockets
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    self.dsn,
+                    connection_factory=PooledConnection,
+                    cursor_factory=RealDictCursor,
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def acquire(self):
+        self.breaker.check()
+        if not self._slots.acquire(timeout=DB_POOL_WAIT_SECONDS):
+            raise DatabaseUnavailable(f"Database connection pool ({self.name}) exhausted", DB_POOL_WAIT_SECONDS)
+        try:
+            return self._get_pool().getconn()
+        except psycopg2.OperationalError:
+            self._slots.release()
+            self.breaker.record(False)
+            raise
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Return a connection rolled back, or closed if it is broken."""
+        try:
+            broken = conn.closed != 0
+            if not broken:
+                try:
+                    conn.rollback()  # no-op after a commit
+                except psycopg2.Error:
+                    broken = True
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+
+class PostgresStorage(Storage):
+    """The production backend; schema is owned by api_server.init_db()."""
+
+    name = "postgres"
+
+    def __init__(self, dsn, issue_columns, read_dsn=None):
+        self.dsn = dsn
+        self.read_dsn = read_dsn
+        self.issue_columns = issue_columns
+        self.prepared_statements = {
+            name: sql.format(issue_columns=", ".join(issue_columns))
+            for name, sql in PREPARED_STATEMENTS.items()
+        }
+        self.query_stats = QueryStats()
+        self._primary = ConnectionPool(dsn, "primary")
+        self._replica = ConnectionPool(read_dsn, "replica") if read_dsn else None
+        self.has_replica = self._replica is not None
+        self.breaker = self._primary.breaker
+        self.watchdog = QueryWatchdog()
+        # Replica lag, re-measured at most every REPLICA_LAG_CHECK_SECONDS
+        self.replica_lag_seconds = None
+        self._lag_checked_at = 0.0
+        self._lag_lock = threading.Lock()
+        # Store rows keyed by the 'stores' cache generation (trigger-bumped)
+        self._stores_cache = {"generation": None, "rows": None}
+        self._stores_cache_lock = threading.Lock()
+
+    def connect(self, read=False):
+        """
+        A standalone connection outside the pool, for a LISTEN that holds it
+        for good and for tooling; everything else uses session() or the
+        storage calls. Inside a request it carries that request's
+        statement_timeout; background threads keep the server default.
+        read=True may return a replica connection (same rules as pooled reads).
+        """
+        if not self.dsn:
+            raise RuntimeError("DATABASE_URL is not set")
+
+        kwargs = {"cursor_factory": RealDictCursor}
+        timeout_ms = self.request_settings.timeout_ms
+        if timeout_ms:
+            # An explicit options argument replaces the DSN's options and
+            # PGOPTIONS (e.g. search_path), so carry those over
+            base = psycopg2.extensions.parse_dsn(self.dsn).get("options") or os.environ.get("PGOPTIONS", "")
+            kwargs["options"] = f"{base} -c statement_timeout={int(timeout_ms)}".strip()
+
+        if read and self._replica_allowed():
+            try:
+                conn = psycopg2.connect(self.read_dsn, **kwargs)
+            except psycopg2.OperationalError:
+                self._replica.breaker.record(False)
+            else:
+                self._replica.breaker.record(True)
+                if self._caught_up(conn):
+                    self.request_settings.source = "replica"
+                    return conn
+                conn.close()
+
+        self.breaker.check()
+        try:
+            conn = psycopg2.connect(self.dsn, **kwargs)
+        except psycopg2.OperationalError:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        if read:
+            self.request_settings.source = "primary"
+        return conn
+
+    def init_schema(self):
+        pass  # api_server.init_db() runs the Postgres DDL
+
+    @contextmanager
+    def transaction(self):
+        settings = self.request_settings
+        if settings.conn is not None:
+            yield settings.conn
+            return
+        # Always the primary: reads inside see the block's own writes
+        with self._pooled() as conn:
+            settings.conn = conn
+            try:
+                yield conn
+                conn.commit()
+            finally:
+                settings.conn = None
+
+    @contextmanager
+    def session(self, read=False):
+        """
+        A pooled connection for work that runs its own transactions (commits
+        as it goes, session advisory locks, server-side cursors): schema
+        migrations, archiving, report rendering, bulk imports. Whatever is
+        left uncommitted is rolled back when the block exits. read=True may
+        use the replica (same rules as pooled reads).
+        """
+        try:
+            with self._pooled(read) as conn:
+                yield conn
+        except _ReplicaFailed as e:
+            raise e.__cause__
+
+    # --- replica routing ---
+    def _replica_allowed(self) -> bool:
+        """Should this read try the replica at all (opted in, healthy, not lagging)?"""
+        if self._replica is None or not self.request_settings.use_replica:
+            return False
+        if self._replica.breaker.retry_after() > 0:
+            return False
+
+        now = time.monotonic()
+        if now - self._lag_checked_at >= REPLICA_LAG_CHECK_SECONDS and self._lag_lock.acquire(blocking=False):
+            # One thread re-measures; the others use the last value meanwhile
+            try:
+                self._lag_checked_at = now
+                self.replica_lag_seconds = self._measure_replica_lag()
+            finally:
+                self._lag_lock.release()
+
+        lag = self.replica_lag_seconds
+        return lag is not None and lag <= DB_REPLICA_MAX_LAG_SECONDS
+
+    def _measure_replica_lag(self):
+        """Seconds the replica is behind (0 when fully replayed), or None if unreachable."""
+        try:
+            conn = self._replica.acquire()
+        except (DatabaseUnavailable, psycopg2.OperationalError):
+            return None
+        try:
+            cur = conn.cursor()
+            # An idle primary makes the replay timestamp look old, so a fully
+            # replayed replica counts as 0 lag
+            cur.execute(
+                """
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() THEN 0
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END AS lag_seconds;
+                """
+            )
+            lag = float(cur.fetchone()["lag_seconds"])
+            cur.close()
+            self._replica.breaker.record(True)
+            return lag
+        except psycopg2.Error:
+            self._replica.breaker.record(False)
+            return None
+        finally:
+            self._replica.release(conn)
+
+    def _caught_up(self, conn) -> bool:
+        """Has the replica replayed the client's last write (request_settings.min_lsn)?"""
+        min_lsn = self.request_settings.min_lsn
+        if not min_lsn:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, TRUE) AS caught_up;",
+                (min_lsn,),
+            )
+            caught_up = cur.fetchone()["caught_up"]
+            cur.close()
+            return caught_up
+        except psycopg2.Error:
+            return False
+
+    def replica_status(self):
+        if self._replica is None:
+            return None
+        return {
+            "breaker": self._replica.breaker.snapshot(),
+            "lag_seconds": self.replica_lag_seconds,
+            "max_lag_seconds": DB_REPLICA_MAX_LAG_SECONDS,
+        }
+
+    def current_lsn(self):
+        if self._replica is None:
+            return None
+        row = self._fetch("current_lsn", "SELECT pg_current_wal_lsn()::text AS lsn;", one=True)
+        return row["lsn"]
+
+    # --- connections ---
+    def _apply_statement_timeout(self, conn):
+        """Bring the connection's statement_timeout in line with the current request."""
+        wanted = self.request_settings.timeout_ms
+        if conn.statement_timeout == wanted:
+            return
+        cur = conn.cursor()
+        if wanted:
+            cur.execute("SELECT set_config('statement_timeout', %s, false);", (str(int(wanted)),))
+        else:
+            cur.execute("RESET statement_timeout;")
+        # Committed so the checkout's final rollback does not undo it
+        conn.commit()
+        cur.close()
+        conn.statement_timeout = wanted
+
+    def _checkout(self, read: bool):
+        """(pool, connection) for this call: the replica for eligible reads, else the primary."""
+        if read and self._replica_allowed():
+            try:
+                conn = self._replica.acquire()
+            except (DatabaseUnavailable, psycopg2.OperationalError):
+                conn = None
+            if conn is not None:
+                if self._caught_up(conn):
+                    self.request_settings.source = "replica"
+                    return self._replica, conn
+                self._replica.release(conn)
+
+        conn = self._primary.acquire()
+        if read:
+            self.request_settings.source = "primary"
+        return self._primary, conn
+
+    @contextmanager
+    def _pooled(self, read=False):
+        """
+        Borrow a pooled connection (see _checkout). Outcomes feed that pool's
+        circuit breaker; a query cancelled because the client went away
+        raises ClientDisconnected and is not counted.
+        """
+        if not self.dsn:
+            raise RuntimeError("DATABASE_URL is not set")
+        pool, conn = self._checkout(read)
+
+        watch = None
+        try:
+            self._apply_statement_timeout(conn)
+            if self.request_settings.disconnected is not None:
+                watch = self.watchdog.watch(conn, self.request_settings.disconnected)
+            yield conn
+        except psycopg2.OperationalError as e:
+            # Includes QueryCanceledError (statement_timeout or our cancel)
+            if watch is not None and watch.cancelled:
+                raise ClientDisconnected("Client disconnected; query cancelled") from e
+            pool.breaker.record(False)
+            if pool is self._replica and not isinstance(e, psycopg2.extensions.QueryCanceledError):
+                raise _ReplicaFailed() from e
+            raise
+        else:
+            pool.breaker.record(True)
+        finally:
+            if watch is not None:
+                self.watchdog.unwatch(watch)
+            pool.release(conn)
+
+    def _commit(self, conn):
+        """Commit, unless conn belongs to an open transaction() block (it commits at the end)."""
+        if conn is not self.request_settings.conn:
+            conn.commit()
+
+    def _run(self, label, work, read=False):
+        """
+        Time work(conn) on a pooled connection, or on the transaction() block's
+        connection inside one; a failed replica read is retried on the primary.
+        """
+        with self.query_stats.timed(label):
+            if self.request_settings.conn is not None:
+                return work(self.request_settings.conn)
+            try:
+                with self._pooled(read) as conn:
+                    return work(conn)
+            except _ReplicaFailed:
+                self.request_settings.source = "primary"
+                with self._pooled() as conn:
+                    return work(conn)
+
+    def _fetch(self, label, query, params=(), one=False, actor=None, write=False, read=False):
+        def work(conn):
+            cur = conn.cursor()
+            if actor:
+                cur.execute("SELECT set_config('app.actor', %s, true);", (actor,))
+            cur.execute(query, params)
+            result = cur.fetchone() if one else cur.fetchall()
+            if write:
+                self._commit(conn)
+            cur.close()
+            return result
+
+        return self._run(label, work, read)
+
+    def _execute_prepared(self, name, params, one=False, actor=None, write=False, read=False):
+        """Run a PREPARED_STATEMENTS entry, preparing it first on this connection if needed."""
+        def work(conn):
+            cur = conn.cursor()
+            if name not in conn.prepared:
+                cur.execute(f"PREPARE {name} AS {self.prepared_statements[name]};")
+                conn.prepared.add(name)
+            if actor:
+                cur.execute("SELECT set_config('app.actor', %s, true);", (actor,))
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", list(params))
+            result = cur.fetchone() if one else cur.fetchall()
+            if write:
+                self._commit(conn)
+            cur.close()
+            return result
+
+        return self._run(name, work, read)
+
+    def issues_source(self, include_archived: bool) -> str:
+        """
+        FROM-clause target for issue reads. Hot table only by default; with
+        include_archived the archive is unioned in under the same name.
+        """
+        if not include_archived:
+            return "issues"
+
+        cols = ", ".join(self.issue_columns)
+        return (
+            f"(SELECT {cols}, FALSE AS archived FROM issues"
+            f" UNION ALL SELECT {cols}, TRUE AS archived FROM issues_archive) AS issues"
+        )
+
+    # --- idempotency keys ---
+    def claim_idempotency_key(self, idem_key, endpoint, request_hash):
+        def work(conn):
+            cur = conn.cursor()
+            # Committed rows always carry a response; one without can only be
+            # left over from an older server version and is taken over
+            cur.execute(
+                """
+                INSERT INTO idempotency_keys (idem_key, endpoint, request_hash)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (idem_key, endpoint) DO UPDATE
+                    SET request_hash = EXCLUDED.request_hash, created_at = NOW()
+                    WHERE idempotency_keys.status_code IS NULL
+                RETURNING idem_key;
+                """,
+                (idem_key, endpoint, request_hash),
+            )
+            if cur.fetchone():
+                cur.close()
+                return None
+            cur.execute(
+                """
+                SELECT request_hash, status_code, response_body
+                FROM idempotency_keys
+                WHERE idem_key = %s AND endpoint = %s;
+                """,
+                (idem_key, endpoint),
+            )
+            stored = cur.fetchone()
+            cur.close()
+            return stored
+
+        return self._run("claim_idempotency_key", work)
+
+    def save_idempotent_response(self, idem_key, endpoint, status_code, body):
+        self._fetch(
+            "save_idempotent_response",
+            """
+            UPDATE idempotency_keys
+            SET status_code = %s, response_body = %s
+            WHERE idem_key = %s AND endpoint = %s
+            RETURNING idem_key;
+            """,
+            (status_code, body, idem_key, endpoint),
+            one=True,
+            write=True,
+        )
+
+    def prune_idempotency_keys(self, ttl_hours):
+        self._fetch(
+            "prune_idempotency_keys",
+            """
+            DELETE FROM idempotency_keys
+            WHERE created_at < NOW() - %s * INTERVAL '1 hour'
+            RETURNING idem_key;
+            """,
+            (ttl_hours,),
+            write=True,
+        )
+
+    # --- users ---
+    def get_user_by_email(self, email):
+        return self._execute_prepared("user_by_email", (email.lower(),), one=True, read=True)
+
+    def get_user_by_username(self, username):
+        return self._execute_prepared("user_by_username", (username,), one=True, read=True)
+
+    def upsert_user(self, email, username, password_hash, pin_hash):
+        self._fetch(
+            "upsert_user",
+            """
+            INSERT INTO users (email, username, password_hash, pin_hash, has_password, has_pin)
+            VALUES (%s, %s, %s, %s, TRUE, TRUE)
+            ON CONFLICT (email)
+            DO UPDATE SET
+                username = EXCLUDED.username,
+                password_hash = EXCLUDED.password_hash,
+                pin_hash = EXCLUDED.pin_hash,
+                has_password = TRUE,
+                has_pin = TRUE,
+                updated_at = NOW()
+            RETURNING id;
+            """,
+            (email.lower(), username, password_hash, pin_hash),
+            one=True,
+            write=True,
+        )
+
+    def record_logins(self, logins):
+        def work(conn):
+            cur = conn.cursor()
+            # GREATEST keeps a newer value another worker may have flushed
+            execute_values(
+                cur,
+                """
+                UPDATE users AS u
+                SET last_login_at = GREATEST(u.last_login_at, v.ts),
+                    updated_at = NOW()
+                FROM (VALUES %s) AS v(email, ts)
+                WHERE u.email = v.email;
+                """,
+                list(logins.items()),
+                template="(%s, %s::timestamptz)",
+            )
+            self._commit(conn)
+
+        self._run("record_logins", work)
+
+    def set_user_password(self, email, password_hash) -> bool:
+        """Store a new password hash; False if there is no such user."""
+        return self._fetch(
+            "set_user_password",
+            """
+            UPDATE users
+            SET password_hash = %s,
+                has_password = TRUE,
+                updated_at = NOW()
+            WHERE email = %s
+            RETURNING id;
+            """,
+            (password_hash, email.lower()),
+            one=True,
+            write=True,
+        ) is not None
+
+    def set_user_pin(self, email, pin_hash) -> bool:
+        """Store a new PIN hash; False if there is no such user."""
+        return self._fetch(
+            "set_user_pin",
+            """
+            UPDATE users
+            SET pin_hash = %s,
+                has_pin = TRUE,
+                updated_at = NOW()
+            WHERE email = %s
+            RETURNING id;
+            """,
+            (pin_hash, email.lower()),
+            one=True,
+            write=True,
+        ) is not None
+
+    def list_users(self):
+        """Every user without the secret hashes, by email."""
+        return self._fetch(
+            "list_users",
+            """
+            SELECT id, username, email, has_password, has_pin, last_login_at
+            FROM users
+            ORDER BY email ASC;
+            """,
+        )
+
+    def delete_user(self, email) -> bool:
+        return self._fetch(
+            "delete_user",
+            "DELETE FROM users WHERE email = %s RETURNING email;",
+            (email.lower(),),
+            one=True,
+            write=True,
+        ) is not None
+
+    # --- stores / devices ---
+    def list_stores(self):
+        def work(conn):
+            cur = conn.cursor()
+            cur.execute("SELECT generation FROM cache_generations WHERE name = 'stores';")
+            generation = cur.fetchone()["generation"]
+
+            with self._stores_cache_lock:
+                if self._stores_cache["generation"] == generation:
+                    return generation, None
+
+            cur.execute(f"SELECT {', '.join(STORE_COLUMNS)} FROM stores ORDER BY store_number;")
+            return generation, cur.fetchall()
+
+        generation, rows = self._run("list_stores", work, read=True)
+        if rows is None:
+            with self._stores_cache_lock:
+                return self._stores_cache["rows"]
+
+        with self._stores_cache_lock:
+            self._stores_cache["generation"] = generation
+            self._stores_cache["rows"] = rows
+        return rows
+
+    def issue_count_rows(self, store_numbers=None):
+        query = """
+            SELECT store_number, status_code, priority_code, issue_count
+            FROM store_issue_counts
+            WHERE issue_count > 0
+        """
+        params = []
+        if store_numbers is not None:
+            query += " AND store_number = ANY(%s)"
+            params.append(list(store_numbers))
+        return self._fetch("issue_count_rows", query, params, read=True)
+
+    def devices_by_store(self, store_number):
+        return self._execute_prepared("devices_by_store", (store_number,), read=True)
+
+    def lookup_stores(self, q, limit, fuzzy=False):
+        fuzzy_score = ""
+        fuzzy_where = ""
+        if fuzzy:
+            fuzzy_score = """,
+                    similarity(store_name, %(q)s) * 50,
+                    similarity(COALESCE(city, ''), %(q)s) * 40"""
+            fuzzy_where = """
+                   OR store_name %% %(q)s
+                   OR city %% %(q)s"""
+
+        return self._fetch(
+            "lookup_stores",
+            f"""
+            SELECT *
+            FROM (
+                SELECT
+                    store_number, store_name, type, state, num_comp,
+                    address, city, zip, phone, kiosk,
+                    GREATEST(
+                        CASE WHEN store_number::text = %(q)s THEN 100
+                             WHEN store_number::text LIKE %(prefix)s THEN 90
+                             ELSE 0 END,
+                        CASE WHEN zip LIKE %(prefix)s THEN 80 ELSE 0 END,
+                        CASE WHEN LOWER(store_name) = LOWER(%(q)s) THEN 95
+                             WHEN store_name ILIKE %(prefix)s THEN 70
+                             WHEN store_name ILIKE %(contains)s THEN 60
+                             ELSE 0 END,
+                        CASE WHEN city ILIKE %(prefix)s THEN 55
+                             WHEN city ILIKE %(contains)s THEN 50
+                             ELSE 0 END{fuzzy_score}
+                    ) AS score
+                FROM stores
+                WHERE store_number::text LIKE %(prefix)s
+                   OR zip LIKE %(prefix)s
+                   OR store_name ILIKE %(contains)s
+                   OR city ILIKE %(contains)s{fuzzy_where}
+            ) AS ranked
+            ORDER BY score DESC, store_number
+            LIMIT %(limit)s;
+            """,
+            {
+                "q": q,
+                "prefix": like_escape(q) + "%",
+                "contains": "%" + like_escape(q) + "%",
+                "limit": limit,
+            },
+            read=True,
+        )
+
+
+    def store_dashboard(self, store_number, known_etags=()):
+        """
+        (etag, row) for one store's dashboard: row has store (None when there
+        is no such store), devices grouped by device_category, device_count
+        and open_issues. The etag fingerprints the store row, its devices and
+        its open issues' versions; when it is in known_etags, row is None and
+        the dashboard is not built.
+        """
+        def work(conn):
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT md5(
+                    COALESCE((SELECT s::text FROM stores s WHERE s.store_number = %(store)s), '')
+                    || '|' ||
+                    COALESCE((SELECT string_agg(d::text, ',' ORDER BY d.id)
+                              FROM store_devices d WHERE d.store_number = %(store)s), '')
+                    || '|' ||
+                    COALESCE((SELECT string_agg(i.id || ':' || i.row_version, ',' ORDER BY i.id)
+                              FROM issues i
+                              WHERE i.store_number = %(store)s
+                                AND i.status_code IS DISTINCT FROM 3
+                                AND i.status_code IS DISTINCT FROM 4), '')
+                ) AS fingerprint;
+                """,
+                {"store": store_number},
+            )
+            etag = cur.fetchone()["fingerprint"]
+            if etag in known_etags:
+                cur.close()
+                return etag, None
+
+            cur.execute(
+                f"""
+                WITH store AS (
+                    SELECT {', '.join(STORE_COLUMNS)}
+                    FROM stores
+                    WHERE store_number = %(store)s
+                ),
+                devices AS (
+                    SELECT device_uid, store_number, device_type, device_number,
+                           manufacturer, model, device_notes, device_category
+                    FROM store_devices
+                    WHERE store_number = %(store)s
+                ),
+                device_groups AS (
+                    SELECT COALESCE(device_category, 'other') AS category,
+                           jsonb_agg(to_jsonb(d)
+                                     ORDER BY d.device_number NULLS LAST, d.manufacturer, d.model) AS items
+                    FROM devices d
+                    GROUP BY 1
+                ),
+                open_issues AS (
+                    SELECT {', '.join(self.issue_columns)}
+                    FROM issues
+                    WHERE store_number = %(store)s
+                      AND status_code IS DISTINCT FROM 3
+                      AND status_code IS DISTINCT FROM 4
+                )
+                SELECT
+                    (SELECT to_jsonb(store) FROM store) AS store,
+                    COALESCE((SELECT jsonb_object_agg(category, items) FROM device_groups),
+                             '{{}}'::jsonb) AS devices,
+                    (SELECT COUNT(*) FROM devices) AS device_count,
+                    COALESCE((SELECT jsonb_agg(to_jsonb(o) ORDER BY o.priority_code NULLS LAST, o.id)
+                              FROM open_issues o),
+                             '[]'::jsonb) AS open_issues;
+                """,
+                {"store": store_number},
+            )
+            row = cur.fetchone()
+            cur.close()
+            return etag, row
+
+        return self._run("store_dashboard", work, read=True)
+
+    @staticmethod
+    def _device_filters(filters):
+        """WHERE clause and params for search_devices/device_counts (d = store_devices, s = stores)."""
+        where = "WHERE 1=1"
+        params = []
+        for key, clause in (
+            ("manufacturers", "LOWER(d.manufacturer) = ANY(%s)"),
+            ("device_types", "LOWER(d.device_type) = ANY(%s)"),
+            ("categories", "d.device_category = ANY(%s)"),
+            ("states", "UPPER(s.state) = ANY(%s)"),
+            ("store_types", "LOWER(s.type) = ANY(%s)"),
+        ):
+            if filters.get(key):
+                where += f" AND {clause}"
+                params.append(list(filters[key]))
+        if filters.get("model"):
+            where += " AND d.model ILIKE %s"
+            params.append("%" + like_escape(filters["model"]) + "%")
+        return where, params
+
+    def search_devices(self, filters, after=None, limit=None):
+        """
+        Devices (with store_name, state, store_type) matching filters, ordered
+        by (store_number, id). filters may hold manufacturers, device_types
+        and store_types (lowercase lists), categories, states (uppercase
+        list) and model (substring). after = (store_number, id) of the
+        previous page's last row.
+        """
+        where, params = self._device_filters(filters)
+        if after:
+            where += " AND (d.store_number, d.id) > (%s, %s)"
+            params.extend(after)
+        page = ""
+        if limit is not None:
+            page = "LIMIT %s"
+            params.append(limit)
+
+        return self._fetch(
+            "search_devices",
+            f"""
+            SELECT
+                d.id,
+                d.device_uid,
+                d.store_number,
+                d.device_type,
+                d.device_number,
+                d.manufacturer,
+                d.model,
+                d.device_notes,
+                d.device_category,
+                s.store_name,
+                s.state,
+                s.type AS store_type
+            FROM store_devices d
+            JOIN stores s ON s.store_number = d.store_number
+            {where}
+            ORDER BY d.store_number, d.id
+            {page};
+            """,
+            params,
+            read=True,
+        )
+
+    def device_counts(self, filters):
+        """
+        Device and store counts over search_devices(filters), one grouping
+        set each by (manufacturer, model), state and store_type; rows flag
+        their set with is_model / is_state (neither = store_type).
+        """
+        where, params = self._device_filters(filters)
+        return self._fetch(
+            "device_counts",
+            f"""
+            SELECT
+                GROUPING(d.manufacturer, d.model) = 0 AS is_model,
+                GROUPING(s.state) = 0 AS is_state,
+                d.manufacturer, d.model, s.state, s.type AS store_type,
+                COUNT(*) AS devices,
+                COUNT(DISTINCT d.store_number) AS stores
+            FROM store_devices d
+            JOIN stores s ON s.store_number = d.store_number
+            {where}
+            GROUP BY GROUPING SETS ((d.manufacturer, d.model), (s.state), (s.type))
+            ORDER BY devices DESC;
+            """,
+            params,
+            read=True,
+        )
+
+    # --- issues ---
+    def list_issues(self, store_number=None, store_name=None, include_archived=False):
+        if not include_archived and store_number is not None:
+            return self._execute_prepared("issues_by_store_number", (store_number,), read=True)
+        if not include_archived and store_name is not None:
+            return self._execute_prepared("issues_by_store_name", (store_name,), read=True)
+
+        source = self.issues_source(include_archived)
+        if store_number is not None:
+            return self._fetch(
+                "issues_by_store_number_archived",
+                f"SELECT * FROM {source} WHERE store_number = %s ORDER BY id;",
+                (store_number,),
+                read=True,
+            )
+        if store_name is not None:
+            return self._fetch(
+                "issues_by_store_name_archived",
+                f"SELECT * FROM {source} WHERE store_name = %s ORDER BY id;",
+                (store_name,),
+                read=True,
+            )
+        return self._fetch(
+            "list_issues_archived" if include_archived else "list_issues",
+            f"SELECT * FROM {source} ORDER BY store_number, id;",
+            read=True,
+        )
+
+    def _search_query(self, filters, include_archived):
+        query = f"SELECT * FROM {self.issues_source(include_archived)} WHERE 1=1"
+        params = []
+
+        for key, column in SEARCH_IN_FILTERS:
+            values = list(filters.get(key) or [])
+            if len(values) == 1:
+                # Plain equality, so a (column, sort key) index can also
+                # supply the ORDER BY; = ANY(array) cannot
+                query += f" AND {column} = %s"
+                params.append(values[0])
+            elif values:
+                query += f" AND {column} = ANY(%s)"
+                params.append(values)
+
+        if filters.get("global_issue") is not None:
+            query += " AND global_issue = %s"
+            params.append(filters["global_issue"])
+
+        for key, (column, op) in SEARCH_DATE_FILTERS.items():
+            if filters.get(key) is not None:
+                query += f" AND {column} {op} %s"
+                params.append(filters[key])
+
+        for key, column in (("category", "category"), ("status_text", "status"),
+                            ("device", "device_type"), ("name", "issue_name")):
+            if filters.get(key):
+                query += f" AND {column} ILIKE %s"
+                params.append(f"%{filters[key]}%")
+
+        return query, params
+
+    @staticmethod
+    def _search_page(sort, after, limit):
+        """
+        (where, order_by, limit, params) for one page of search results.
+        The sort key and id share a direction, so "after the last row" is a
+        single row comparison an index on (key, id) can seek to.
+        """
+        key, descending = sort or ("id", False)
+        if key not in SEARCH_SORT_KEYS:
+            raise ValueError(f"unsupported sort key {key!r}")
+        direction = "DESC" if descending else "ASC"
+        op = "<" if descending else ">"
+
+        where, params = "", []
+        if after is not None:
+            if key == "id":
+                where = f" WHERE id {op} %s"
+                params.append(after[1])
+            else:
+                where = f" WHERE ({key}, id) {op} (%s, %s)"
+                params.extend(after)
+
+        order_by = f"id {direction}" if key == "id" else f"{key} {direction}, id {direction}"
+        limit_sql = ""
+        if limit:
+            limit_sql = " LIMIT %s"
+            params.append(int(limit))
+        return where, order_by, limit_sql, params
+
+    def search_sql(self, filters, include_archived=False, sort=None, after=None, limit=None):
+        """
+        (query, params) of the search_issues statement, so benchmarks/search_plans.py
+        EXPLAINs exactly what the API runs.
+        """
+        base, params = self._search_query(filters, include_archived)
+        where, order_by, limit_sql, page_params = self._search_page(sort, after, limit)
+        query = f"SELECT * FROM ({base}) AS matched{where} ORDER BY {order_by}{limit_sql}"
+        return query, params + page_params
+
+    def search_issues(self, filters, include_archived=False, sort=None, after=None, limit=None):
+        query, params = self.search_sql(filters, include_archived, sort, after, limit)
+        return self._fetch("search_issues", query, params, read=True)
+
+    def search_issues_with_facets(self, filters, facets, include_archived=False,
+                                  sort=None, after=None, limit=None):
+        """
+        One statement: the matches are computed once (CTE) and feed both the
+        returned page and a GROUPING SETS aggregate with one set per facet.
+        Facet rows come back in the same result set, tagged in _facet.
+        """
+        base, params = self._search_query(filters, include_archived)
+        where, order_by, limit_sql, page_params = self._search_page(sort, after, limit)
+        columns = [SEARCH_FACETS[f] for f in facets]
+        which = " ".join(f"WHEN GROUPING({c}) = 0 THEN '{f}'" for f, c in zip(facets, columns))
+        value = " ".join(f"WHEN GROUPING({c}) = 0 THEN {c}::text" for c in columns)
+
+        rows = self._fetch(
+            "search_issues_facets",
+            f"""
+            WITH matched AS ({base}),
+            facet_counts AS (
+                SELECT CASE {which} END AS facet,
+                       CASE {value} END AS value,
+                       COUNT(*) AS count
+                FROM matched
+                GROUP BY GROUPING SETS ({', '.join(f'({c})' for c in columns)})
+            )
+            SELECT * FROM (
+                SELECT NULL::json AS _facet, m.*
+                FROM (SELECT * FROM matched{where} ORDER BY {order_by}{limit_sql}) m
+                UNION ALL
+                SELECT json_build_object('facet', f.facet, 'value', f.value, 'count', f.count), m.*
+                FROM facet_counts f LEFT JOIN matched m ON FALSE
+            ) AS results
+            ORDER BY (_facet IS NOT NULL), {order_by};
+            """,
+            params + page_params,
+            read=True,
+        )
+
+        issues = []
+        counts = {f: [] for f in facets}
+        for row in rows:
+            facet = row.pop("_facet")
+            if facet is None:
+                issues.append(row)
+                continue
+            raw = facet["value"]
+            if raw is not None and SEARCH_FACETS[facet["facet"]] in SEARCH_FACET_INT_COLUMNS:
+                raw = int(raw)
+            counts[facet["facet"]].append((raw, facet["count"]))
+        return issues, counts
+
+    def insert_issue(self, fields, actor=None):
+        return self._execute_prepared(
+            "insert_issue",
+            [fields.get(c) for c in ISSUE_WRITE_COLUMNS],
+            one=True,
+            actor=actor,
+            write=True,
+        )
+
+    def update_issue(self, issue_id, fields, actor=None):
+        sets = [
+            f"{c} = COALESCE(%s, {c})" if c in ISSUE_KEEP_IF_NONE else f"{c} = %s"
+            for c in ISSUE_WRITE_COLUMNS
+        ]
+        return self._fetch(
+            "update_issue",
+            f"""
+            UPDATE issues
+            SET {', '.join(sets)},
+                updated_at = NOW(),
+                row_version = row_version + 1
+            WHERE id = %s
+            RETURNING *;
+            """,
+            [fields.get(c) for c in ISSUE_WRITE_COLUMNS] + [issue_id],
+            one=True,
+            actor=actor,
+            write=True,
+        )
+
+    def patch_issue(self, issue_id, columns, expected_version=None, actor=None):
+        query, params = issue_patch_sql(issue_id, columns, expected_version)
+
+        def work(conn):
+            cur = conn.cursor()
+            if actor:
+                cur.execute("SELECT set_config('app.actor', %s, true);", (actor,))
+            cur.execute(query, params)
+            updated = cur.fetchone()
+            if updated:
+                self._commit(conn)
+                cur.close()
+                return updated, None
+            # Nothing was written; the pool rolls back on release
+            cur.execute("SELECT * FROM issues WHERE id = %s;", (issue_id,))
+            current = cur.fetchone()
+            cur.close()
+            return None, current
+
+        return self._run("patch_issue", work)
+
+    def delete_issue(self, issue_id, actor=None):
+        return self._fetch(
+            "delete_issue",
+            "DELETE FROM issues WHERE id = %s RETURNING *;",
+            (issue_id,),
+            one=True,
+            actor=actor,
+            write=True,
+        )
+
+    def get_issues(self, issue_ids, include_archived=False):
+        return self._fetch(
+            "issues_by_ids",
+            f"SELECT * FROM {self.issues_source(include_archived)} WHERE id = ANY(%s) ORDER BY id;",
+            (list(issue_ids),),
+            read=True,
+        )
+
+    def delete_issues(self, issue_ids, actor=None):
+        return self._fetch(
+            "delete_issues",
+            "DELETE FROM issues WHERE id = ANY(%s) RETURNING *;",
+            (list(issue_ids),),
+            actor=actor,
+            write=True,
+        )
+
+    def issue_history(self, issue_id):
+        """The issue's issue_events rows (event_id, op, ts, actor, changes), oldest first."""
+        return self._fetch(
+            "issue_history",
+            """
+            SELECT event_id, op, ts, actor, changes
+            FROM issue_events
+            WHERE issue_id = %s
+            ORDER BY ts, event_id;
+            """,
+            (issue_id,),
+            read=True,
+        )
+
+    # --- jobs ---
+    def insert_job(self, kind, payload, max_attempts, created_by=None) -> int:
+        row = self._fetch(
+            "insert_job",
+            """
+            INSERT INTO jobs (kind, payload, max_attempts, created_by)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id;
+            """,
+            (kind, json.dumps(payload or {}), max_attempts, created_by),
+            one=True,
+            write=True,
+        )
+        return row["id"]
+
+    def get_job(self, job_id):
+        return self._fetch(
+            "get_job",
+            """
+            SELECT id, kind, status, attempts, max_attempts, progress,
+                   progress_message, result, last_error,
+                   created_at, started_at, finished_at, run_after
+            FROM jobs
+            WHERE id = %s;
+            """,
+            (job_id,),
+            one=True,
+        )
+
+    def claim_job(self, worker_id, lease_seconds):
+        """
+        Send jobs whose worker stopped heartbeating for lease_seconds back to
+        the queue (or fail them when out of attempts), then take the next due
+        job, skipping rows other workers hold. Returns the job row or None.
+        """
+        def work(conn):
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+                    last_error = 'Worker lease expired (' || COALESCE(locked_by, '?') || ')',
+                    locked_by = NULL,
+                    run_after = NOW()
+                WHERE status = 'running'
+                  AND heartbeat_at < NOW() - %s * INTERVAL '1 second';
+                """,
+                (lease_seconds,),
+            )
+            cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'running',
+                    attempts = attempts + 1,
+                    locked_by = %s,
+                    heartbeat_at = NOW(),
+                    started_at = COALESCE(started_at, NOW())
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND run_after <= NOW()
+                    ORDER BY run_after, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING *;
+                """,
+                (worker_id,),
+            )
+            job = cur.fetchone()
+            self._commit(conn)
+            cur.close()
+            return job
+
+        return self._run("claim_job", work)
+
+    def touch_job(self, job_id, locked_by):
+        """Refresh the lease heartbeat while locked_by still holds the job."""
+        self._fetch(
+            "touch_job",
+            """
+            UPDATE jobs SET heartbeat_at = NOW()
+            WHERE id = %s AND locked_by = %s
+            RETURNING id;
+            """,
+            (job_id, locked_by),
+            one=True,
+            write=True,
+        )
+
+    def set_job_progress(self, job_id, percent, message=None):
+        """Record progress (0-100) and refresh the lease heartbeat."""
+        self._fetch(
+            "set_job_progress",
+            """
+            UPDATE jobs
+            SET progress = %s, progress_message = %s, heartbeat_at = NOW()
+            WHERE id = %s
+            RETURNING id;
+            """,
+            (max(0, min(100, int(percent))), message, job_id),
+            one=True,
+            write=True,
+        )
+
+    def finish_job(self, job_id, locked_by, result):
+        """Mark the job succeeded with result (JSON-encoded), if locked_by still holds it."""
+        self._fetch(
+            "finish_job",
+            """
+            UPDATE jobs
+            SET status = 'succeeded', progress = 100, result = %s,
+                last_error = NULL, locked_by = NULL, finished_at = NOW()
+            WHERE id = %s AND locked_by = %s
+            RETURNING id;
+            """,
+            (json.dumps(result, default=str), job_id, locked_by),
+            one=True,
+            write=True,
+        )
+
+    def fail_job(self, job_id, locked_by, error, permanent, retry_base_seconds):
+        """
+        Record a failed attempt, if locked_by still holds the job: queued
+        again after retry_base_seconds * 2^(attempts-1), or failed for good
+        when permanent or out of attempts.
+        """
+        self._fetch(
+            "fail_job",
+            """
+            UPDATE jobs
+            SET status = CASE WHEN %s OR attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                finished_at = CASE WHEN %s OR attempts >= max_attempts THEN NOW() END,
+                run_after = NOW() + %s * power(2, attempts - 1) * INTERVAL '1 second',
+                last_error = %s,
+                locked_by = NULL
+            WHERE id = %s AND locked_by = %s
+            RETURNING id;
+            """,
+            (permanent, permanent, retry_base_seconds, error, job_id, locked_by),
+            one=True,
+            write=True,
+        )
+
+
+# =========================================
+#                SQLITE
+# =========================================
+
+SQLITE_TS_FORMAT = "%Y-%m-%d %H:%M:%f"  # SQL side; sortable as text, always UTC
+SQLITE_NOW = f"(strftime('{SQLITE_TS_FORMAT}', 'now'))"
+
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS issues (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    store_name TEXT NOT NULL,
+    store_number INTEGER,
+    issue_name TEXT,
+    priority TEXT,
+    computer_number TEXT,
+    device_type TEXT,
+    category TEXT,
+    description TEXT,
+    narrative TEXT,
+    replicable TEXT,
+    status TEXT,
+    resolution TEXT,
+    created_at TEXT DEFAULT {SQLITE_NOW},
+    updated_at TEXT DEFAULT {SQLITE_NOW},
+    global_issue INTEGER NOT NULL DEFAULT 0,
+    global_num INTEGER,
+    row_version INTEGER NOT NULL DEFAULT 1,
+    status_code INTEGER,
+    priority_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_issues_store_number ON issues(store_number);
+CREATE INDEX IF NOT EXISTS idx_issues_store_status ON issues(store_number, status_code);
+CREATE INDEX IF NOT EXISTS idx_issues_updated ON issues(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_issues_created ON issues(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_issues_store_updated ON issues(store_number, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_issues_status_priority_updated
+    ON issues(status_code, priority_code, updated_at, id);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    password_hash TEXT,
+    pin_hash TEXT,
+    has_password INTEGER NOT NULL DEFAULT 0,
+    has_pin INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT {SQLITE_NOW},
+    updated_at TEXT DEFAULT {SQLITE_NOW},
+    last_login_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+
+CREATE TABLE IF NOT EXISTS stores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    store_number INTEGER UNIQUE NOT NULL,
+    store_name TEXT NOT NULL,
+    type TEXT,
+    state TEXT,
+    num_comp INTEGER,
+    address TEXT,
+    city TEXT,
+    zip TEXT,
+    phone TEXT,
+    kiosk TEXT
+);
+
+CREATE TABLE IF NOT EXISTS store_devices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_uid TEXT UNIQUE NOT NULL,
+    store_number INTEGER NOT NULL REFERENCES stores(store_number),
+    device_type TEXT NOT NULL,
+    device_number TEXT,
+    manufacturer TEXT,
+    model TEXT,
+    device_notes TEXT,
+    device_category TEXT,
+    created_at TEXT DEFAULT {SQLITE_NOW},
+    updated_at TEXT DEFAULT {SQLITE_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_store_devices_store_number ON store_devices(store_number);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idem_key TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    status_code INTEGER,
+    response_body TEXT,
+    created_at TEXT NOT NULL DEFAULT {SQLITE_NOW},
+    PRIMARY KEY (idem_key, endpoint)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys(created_at);
+"""
+
+# External-content FTS5 index over the searchable issue text. The trigram
+# tokenizer matches any 3+ character substring, like ILIKE '%x%'.
+SQLITE_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5(
+    issue_name, category, device_type, status,
+    content='issues', content_rowid='id', tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS issues_fts_ai AFTER INSERT ON issues BEGIN
+    INSERT INTO issues_fts (rowid, issue_name, category, device_type, status)
+    VALUES (new.id, new.issue_name, new.category, new.device_type, new.status);
+END;
+CREATE TRIGGER IF NOT EXISTS issues_fts_ad AFTER DELETE ON issues BEGIN
+    INSERT INTO issues_fts (issues_fts, rowid, issue_name, category, device_type, status)
+    VALUES ('delete', old.id, old.issue_name, old.category, old.device_type, old.status);
+END;
+CREATE TRIGGER IF NOT EXISTS issues_fts_au AFTER UPDATE ON issues BEGIN
+    INSERT INTO issues_fts (issues_fts, rowid, issue_name, category, device_type, status)
+    VALUES ('delete', old.id, old.issue_name, old.category, old.device_type, old.status);
+    INSERT INTO issues_fts (rowid, issue_name, category, device_type, status)
+    VALUES (new.id, new.issue_name, new.category, new.device_type, new.status);
+END;
+"""
+
+SQLITE_BOOL_COLUMNS = {"global_issue", "has_password", "has_pin"}
+SQLITE_TS_COLUMNS = {"created_at", "updated_at", "last_login_at"}
+FTS_MIN_TERM = 3  # trigram needs at least 3 characters; shorter terms use LIKE
+
+
+def _sqlite_ts(value: datetime) -> str:
+    value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+
+
+def _sqlite_row(cursor, row):
+    """Row factory: dicts with booleans and aware UTC datetimes, like RealDictCursor."""
+    out = {}
+    for (name, *_), value in zip(cursor.description, row):
+        if value is not None and name in SQLITE_BOOL_COLUMNS:
+            value = bool(value)
+        elif value is not None and name in SQLITE_TS_COLUMNS:
+            value = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+        out[name] = value
+    return out
+
+
+class SqliteStorage(Storage):
+    """Single-file backend for laptops, branch offices and tests (WAL + FTS5)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fts_available = False
+        self.query_stats = QueryStats()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = _sqlite_row
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA synchronous = NORMAL;")  # safe with WAL
+        return conn
+
+    def init_schema(self):
+        conn = self.connect()
+        try:
+            # WAL lets readers run alongside the single writer; persists in the file
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.executescript(SQLITE_SCHEMA)
+            try:
+                conn.executescript(SQLITE_FTS_SCHEMA)
+                conn.execute("INSERT INTO issues_fts (issues_fts) VALUES ('rebuild');")
+                self.fts_available = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5/trigram: search falls back to LIKE
+                self.fts_available = False
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        settings = self.request_settings
+        if settings.conn is not None:
+            yield settings.conn
+            return
+        conn = self.connect()
+        settings.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            settings.conn = None
+            conn.close()  # rolls back anything uncommitted
+
+    @contextmanager
+    def _connection(self):
+        """The transaction() block's connection, or a fresh one closed afterwards."""
+        if self.request_settings.conn is not None:
+            yield self.request_settings.conn
+            return
+        conn = self.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _commit(self, conn):
+        if conn is not self.request_settings.conn:
+            conn.commit()
+
+    def _fetch(self, label, query, params=(), one=False, write=False):
+        with self._connection() as conn:
+            with self.query_stats.timed(label):
+                cur = conn.execute(query, params)
+                result = cur.fetchone() if one else cur.fetchall()
+                if write:
+                    self._commit(conn)
+            return result
+
+    # --- idempotency keys ---
+    def claim_idempotency_key(self, idem_key, endpoint, request_hash):
+        # The INSERT takes the database write lock, so a concurrent claim of
+        # the same key waits (busy timeout) until this transaction ends
+        claimed = self._fetch(
+            "claim_idempotency_key",
+            f"""
+            INSERT INTO idempotency_keys (idem_key, endpoint, request_hash)
+            VALUES (?, ?, ?)
+            ON CONFLICT (idem_key, endpoint) DO UPDATE
+                SET request_hash = excluded.request_hash, created_at = {SQLITE_NOW}
+                WHERE idempotency_keys.status_code IS NULL
+            RETURNING idem_key;
+            """,
+            (idem_key, endpoint, request_hash),
+            one=True,
+            write=True,
+        )
+        if claimed:
+            return None
+        return self._fetch(
+            "claim_idempotency_key",
+            """
+            SELECT request_hash, status_code, response_body
+            FROM idempotency_keys
+            WHERE idem_key = ? AND endpoint = ?;
+            """,
+            (idem_key, endpoint),
+            one=True,
+        )
+
+    def save_idempotent_response(self, idem_key, endpoint, status_code, body):
+        self._fetch(
+            "save_idempotent_response",
+            """
+            UPDATE idempotency_keys
+            SET status_code = ?, response_body = ?
+            WHERE idem_key = ? AND endpoint = ?
+            RETURNING idem_key;
+            """,
+            (status_code, body, idem_key, endpoint),
+            one=True,
+            write=True,
+        )
+
+    def prune_idempotency_keys(self, ttl_hours):
+        self._fetch(
+            "prune_idempotency_keys",
+            f"""
+            DELETE FROM idempotency_keys
+            WHERE created_at < strftime('{SQLITE_TS_FORMAT}', 'now', ?)
+            RETURNING idem_key;
+            """,
+            (f"-{int(ttl_hours)} hours",),
+            write=True,
+        )
+
+    # --- users ---
+    def get_user_by_email(self, email):
+        return self._fetch(
+            "user_by_email",
+            f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE email = ?;",
+            (email.lower(),),
+            one=True,
+        )
+
+    def get_user_by_username(self, username):
+        return self._fetch(
+            "user_by_username",
+            f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE username = ?;",
+            (username,),
+            one=True,
+        )
+
+    def upsert_user(self, email, username, password_hash, pin_hash):
+        self._fetch(
+            "upsert_user",
+            f"""
+            INSERT INTO users (email, username, password_hash, pin_hash, has_password, has_pin)
+            VALUES (?, ?, ?, ?, 1, 1)
+            ON CONFLICT (email)
+            DO UPDATE SET
+                username = excluded.username,
+                password_hash = excluded.password_hash,
+                pin_hash = excluded.pin_hash,
+                has_password = 1,
+                has_pin = 1,
+                updated_at = {SQLITE_NOW}
+            RETURNING id;
+            """,
+            (email.lower(), username, password_hash, pin_hash),
+            one=True,
+            write=True,
+        )
+
+    def record_logins(self, logins):
+        with self._connection() as conn:
+            with self.query_stats.timed("record_logins"):
+                conn.executemany(
+                    f"""
+                    UPDATE users
+                    SET last_login_at = MAX(COALESCE(last_login_at, ''), ?),
+                        updated_at = {SQLITE_NOW}
+                    WHERE email = ?;
+                    """,
+                    [(_sqlite_ts(ts), email) for email, ts in logins.items()],
+                )
+                self._commit(conn)
+
+    # --- stores / devices ---
+    def list_stores(self):
+        return self._fetch("list_stores", f"SELECT {', '.join(STORE_COLUMNS)} FROM stores ORDER BY store_number;")
+
+    def issue_count_rows(self, store_numbers=None):
+        query = """
+            SELECT store_number,
+                   COALESCE(status_code, 0) AS status_code,
+                   COALESCE(priority_code, 0) AS priority_code,
+                   COUNT(*) AS issue_count
+            FROM issues
+            WHERE store_number IS NOT NULL
+        """
+        params = []
+        if store_numbers is not None:
+            store_numbers = list(store_numbers)
+            if not store_numbers:
+                return []
+            query += f" AND store_number IN ({', '.join('?' * len(store_numbers))})"
+            params.extend(store_numbers)
+        return self._fetch("issue_count_rows", query + " GROUP BY 1, 2, 3;", params)
+
+    def devices_by_store(self, store_number):
+        return self._fetch(
+            "devices_by_store",
+            f"""
+            SELECT {', '.join(DEVICE_COLUMNS)}
+            FROM store_devices
+            WHERE store_number = ?
+            ORDER BY device_type, device_number NULLS LAST, manufacturer, model;
+            """,
+            (store_number,),
+        )
+
+    def lookup_stores(self, q, limit, fuzzy=False):
+        # Same ranking as Postgres minus the trigram matches; LIKE is
+        # already case-insensitive for ASCII here
+        return self._fetch(
+            "lookup_stores",
+            """
+            SELECT *
+            FROM (
+                SELECT
+                    store_number, store_name, type, state, num_comp,
+                    address, city, zip, phone, kiosk,
+                    MAX(
+                        CASE WHEN CAST(store_number AS TEXT) = :q THEN 100
+                             WHEN CAST(store_number AS TEXT) LIKE :prefix ESCAPE '\\' THEN 90
+                             ELSE 0 END,
+                        CASE WHEN zip LIKE :prefix ESCAPE '\\' THEN 80 ELSE 0 END,
+                        CASE WHEN LOWER(store_name) = LOWER(:q) THEN 95
+                             WHEN store_name LIKE :prefix ESCAPE '\\' THEN 70
+                             WHEN store_name LIKE :contains ESCAPE '\\' THEN 60
+                             ELSE 0 END,
+                        CASE WHEN city LIKE :prefix ESCAPE '\\' THEN 55
+                             WHEN city LIKE :contains ESCAPE '\\' THEN 50
+                             ELSE 0 END
+                    ) AS score
+                FROM stores
+                WHERE CAST(store_number AS TEXT) LIKE :prefix ESCAPE '\\'
+                   OR zip LIKE :prefix ESCAPE '\\'
+                   OR store_name LIKE :contains ESCAPE '\\'
+                   OR city LIKE :contains ESCAPE '\\'
+            ) AS ranked
+            ORDER BY score DESC, store_number
+            LIMIT :limit;
+            """,
+            {
+                "q": q,
+                "prefix": like_escape(q) + "%",
+                "contains": "%" + like_escape(q) + "%",
+                "limit": limit,
+            },
+        )
+
+    # --- issues ---
+    def list_issues(self, store_number=None, store_name=None, include_archived=False):
+        # No archive on SQLite: every issue stays in the one table
+        if store_number is not None:
+            return self._fetch("issues_by_store_number", "SELECT * FROM issues WHERE store_number = ? ORDER BY id;", (store_number,))
+        if store_name is not None:
+            return self._fetch("issues_by_store_name", "SELECT * FROM issues WHERE store_name = ? ORDER BY id;", (store_name,))
+        return self._fetch("list_issues", "SELECT * FROM issues ORDER BY store_number, id;")
+
+    def search_issues(self, filters, include_archived=False, sort=None, after=None, limit=None):
+        query = "SELECT * FROM issues WHERE 1=1"
+        params = []
+
+        for key, column in SEARCH_IN_FILTERS:
+            values = filters.get(key)
+            if values:
+                query += f" AND {column} IN ({', '.join('?' * len(values))})"
+                params.extend(int(v) for v in values)
+
+        if filters.get("global_issue") is not None:
+            query += " AND global_issue = ?"
+            params.append(int(filters["global_issue"]))
+
+        for key, (column, op) in SEARCH_DATE_FILTERS.items():
+            if filters.get(key) is not None:
+                query += f" AND {column} {op} ?"
+                params.append(_sqlite_ts(filters[key]))
+
+        fts_terms = []
+        for key, column in (("category", "category"), ("status_text", "status"),
+                            ("device", "device_type"), ("name", "issue_name")):
+            value = filters.get(key)
+            if not value:
+                continue
+            if self.fts_available and len(value) >= FTS_MIN_TERM:
+                fts_terms.append(f'{column} : "{value.replace(chr(34), chr(34) * 2)}"')
+            else:
+                query += f" AND {column} LIKE ? ESCAPE '\\'"
+                params.append(f"%{like_escape(value)}%")
+
+        if fts_terms:
+            query += " AND id IN (SELECT rowid FROM issues_fts WHERE issues_fts MATCH ?)"
+            params.append(" AND ".join(fts_terms))
+
+        key, descending = sort or ("id", False)
+        if key not in SEARCH_SORT_KEYS:
+            raise ValueError(f"unsupported sort key {key!r}")
+        direction = "DESC" if descending else "ASC"
+        op = "<" if descending else ">"
+        if after is not None:
+            if key == "id":
+                query += f" AND id {op} ?"
+                params.append(after[1])
+            else:
+                query += f" AND ({key}, id) {op} (?, ?)"
+                params.extend([_sqlite_ts(after[0]), after[1]])
+
+        query += f" ORDER BY id {direction}" if key == "id" else f" ORDER BY {key} {direction}, id {direction}"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        return self._fetch("search_issues", query + ";", params)
+
+    def search_issues_with_facets(self, filters, facets, include_archived=False,
+                                  sort=None, after=None, limit=None):
+        # No GROUPING SETS in SQLite; the matches are counted here instead,
+        # and the page is a second query when it is not all of them
+        rows = self.search_issues(filters, include_archived)
+        counts = {}
+        for facet in facets:
+            column = SEARCH_FACETS[facet]
+            tally = {}
+            for row in rows:
+                tally[row[column]] = tally.get(row[column], 0) + 1
+            counts[facet] = list(tally.items())
+        if sort is not None or after is not None or limit:
+            rows = self.search_issues(filters, include_archived, sort, after, limit)
+        return rows, counts
+
+    @staticmethod
+    def _issue_params(fields):
+        return [
+            int(fields[c]) if c == "global_issue" and fields.get(c) is not None else fields.get(c)
+            for c in ISSUE_WRITE_COLUMNS
+        ]
+
+    def insert_issue(self, fields, actor=None):
+        cols = ISSUE_WRITE_COLUMNS
+        return self._fetch(
+            "insert_issue",
+            f"""
+            INSERT INTO issues ({', '.join(cols)})
+            VALUES ({', '.join('?' * len(cols))})
+            RETURNING *;
+            """,
+            self._issue_params(fields),
+            one=True,
+            write=True,
+        )
+
+    def update_issue(self, issue_id, fields, actor=None):
+        sets = [
+            f"{c} = COALESCE(?, {c})" if c in ISSUE_KEEP_IF_NONE else f"{c} = ?"
+            for c in ISSUE_WRITE_COLUMNS
+        ]
+        return self._fetch(
+            "update_issue",
+            f"""
+            UPDATE issues
+            SET {', '.join(sets)},
+                updated_at = {SQLITE_NOW},
+                row_version = row_version + 1
+            WHERE id = ?
+            RETURNING *;
+            """,
+            self._issue_params(fields) + [issue_id],
+            one=True,
+            write=True,
+        )
+
+    def patch_issue(self, issue_id, columns, expected_version=None, actor=None):
+        # Column names come from api_server.ISSUE_PATCH_FIELDS, never from the request
+        query = f"""
+            UPDATE issues
+            SET {', '.join(f'{column} = ?' for column in columns)},
+                updated_at = {SQLITE_NOW},
+                row_version = row_version + 1
+            WHERE id = ?
+        """
+        params = list(columns.values()) + [issue_id]
+        if expected_version is not None:
+            query += " AND row_version = ?"
+            params.append(expected_version)
+
+        with self._connection() as conn:
+            with self.query_stats.timed("patch_issue"):
+                updated = conn.execute(query + " RETURNING *;", params).fetchone()
+                if updated:
+                    self._commit(conn)
+                    return updated, None
+                current = conn.execute("SELECT * FROM issues WHERE id = ?;", (issue_id,)).fetchone()
+            return None, current
+
+    def delete_issue(self, issue_id, actor=None):
+        return self._fetch("delete_issue", "DELETE FROM issues WHERE id = ? RETURNING *;", (issue_id,), one=True, write=True)
+
+    def get_issues(self, issue_ids, include_archived=False):
+        issue_ids = list(issue_ids)
+        if not issue_ids:
+            return []
+        return self._fetch(
+            "issues_by_ids",
+            f"SELECT * FROM issues WHERE id IN ({', '.join('?' * len(issue_ids))}) ORDER BY id;",
+            issue_ids,
+        )
+
+    def delete_issues(self, issue_ids, actor=None):
+        issue_ids = list(issue_ids)
+        if not issue_ids:
+            return []
+        return self._fetch(
+            "delete_issues",
+            f"DELETE FROM issues WHERE id IN ({', '.join('?' * len(issue_ids))}) RETURNING *;",
+            issue_ids,
+            write=True,
+        )
+
+
+def open_storage(database_url, issue_columns, read_url=None) -> Storage:
+    """
+    Pick the backend from DATABASE_URL (sqlite:/// -> SQLite, else Postgres).
+    read_url (DATABASE_READ_URL) adds a Postgres read replica.
+    """
+    if database_url and database_url.startswith("sqlite:"):
+        path = database_url[len("sqlite:"):]
+        if path.startswith("///"):
+            path = path[3:]  # sqlite:///rel.db -> rel.db, sqlite:////abs.db -> /abs.db
+        return SqliteStorage(path or os.path.join(os.getcwd(), "issue_tracker.db"))
+    return PostgresStorage(database_url, issue_columns, read_dsn=read_url)
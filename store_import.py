@@ -0,0 +1,234 @@
+"""
+Store metadata import for the stores table.
+
+Streams the CCT Metadata export (Database Files/CCT Metadata.txt), COPYs it
+into a temp table and merges it into stores keyed on store_number. Rows that
+already match are not rewritten, so re-running the same export is a cheap
+no-op; any real change bumps the 'stores' cache generation (via the stores
+trigger) so every API worker drops its cached /stores rows.
+
+    python store_import.py "Database Files/CCT Metadata.txt" --dry-run
+
+Export layout (no header row):
+    store_number,"Name","Address","City","ST","ZIP","Phone","Type",computers,"Kiosk"
+e.g.
+    11529,"Whalley Ave","363 Whalley Ave","New Haven","CT","06511","(203) 497-9489","Store Front",3.00,"N/A"
+"""
+import os
+import csv
+import sys
+import argparse
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from inventory_import import CopyStream, clean
+
+
+EXPORT_COLUMNS = [
+    "store_number",
+    "store_name",
+    "address",
+    "city",
+    "state",
+    "zip",
+    "phone",
+    "type",
+    "num_comp",
+    "kiosk",
+]
+
+# Placeholder values in the export that mean "nothing here"
+EMPTY_VALUES = {"N/A", "NA", "NONE", "-"}
+
+
+class StoreImportError(ValueError):
+    """Raised for export rows that cannot be imported."""
+
+
+def normalize_int(raw, field: str, line_no: int):
+    """'3.00' -> 3, '' -> None"""
+    raw = clean(raw)
+    if raw is None:
+        return None
+    try:
+        return int(float(raw))
+    except ValueError:
+        raise StoreImportError(f"Line {line_no}: {field} '{raw}' is not a number")
+
+
+def iter_store_rows(text_stream):
+    """
+    Parse the export incrementally, yielding normalized store dicts.
+    A leading header row (non-numeric store number) is skipped.
+    """
+    reader = csv.reader(text_stream)
+    for line_no, values in enumerate(reader, start=1):
+        if not any(v.strip() for v in values):
+            continue
+        if line_no == 1 and not values[0].strip().replace(".", "").isdigit():
+            continue
+        if len(values) != len(EXPORT_COLUMNS):
+            raise StoreImportError(
+                f"Line {line_no}: expected {len(EXPORT_COLUMNS)} fields, got {len(values)}"
+            )
+
+        row = {}
+        for column, value in zip(EXPORT_COLUMNS, values):
+            value = clean(value)
+            if value is not None and value.upper() in EMPTY_VALUES:
+                value = None
+            row[column] = value
+
+        row["store_number"] = normalize_int(row["store_number"], "store_number", line_no)
+        row["num_comp"] = normalize_int(row["num_comp"], "computers", line_no)
+        if row["store_number"] is None:
+            raise StoreImportError(f"Line {line_no}: store_number is blank")
+        if not row["store_name"]:
+            raise StoreImportError(f"Line {line_no}: store name is blank")
+        if row["state"]:
+            row["state"] = row["state"].upper()
+
+        yield row
+
+
+def upsert_stores(conn, text_stream, dry_run: bool = False) -> dict:
+    """
+    Merge a CCT Metadata export into stores.
+
+    Returns {"rows_read", "inserted", "updated", "unchanged", "dry_run"}.
+    Stores missing from the export are left alone (issues and devices
+    reference them).
+    """
+    cur = conn.cursor()
+
+    cur.execute(
+        """
+        CREATE TEMP TABLE store_import (
+            seq BIGINT GENERATED ALWAYS AS IDENTITY,
+            store_number INTEGER NOT NULL,
+            store_name TEXT NOT NULL,
+            address TEXT,
+            city TEXT,
+            state TEXT,
+            zip TEXT,
+            phone TEXT,
+            type TEXT,
+            num_comp INTEGER,
+            kiosk TEXT
+        ) ON COMMIT DROP;
+        """
+    )
+
+    stream = CopyStream(iter_store_rows(text_stream), EXPORT_COLUMNS)
+    cur.copy_expert(
+        f"COPY store_import ({', '.join(EXPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        stream,
+    )
+    if stream.error:
+        conn.rollback()
+        cur.close()
+        raise stream.error
+
+    # Last occurrence of a store number in the export wins
+    cur.execute(
+        """
+        CREATE TEMP TABLE store_staged ON COMMIT DROP AS
+        SELECT DISTINCT ON (store_number)
+            store_number, store_name, address, city, state, zip, phone,
+            type, num_comp, kiosk
+        FROM store_import
+        ORDER BY store_number, seq DESC;
+        """
+    )
+
+    cur.execute(
+        """
+        SELECT
+            COUNT(*) FILTER (WHERE s.id IS NULL) AS inserted,
+            COUNT(*) FILTER (
+                WHERE s.id IS NOT NULL
+                  AND (s.store_name, s.address, s.city, s.state, s.zip,
+                       s.phone, s.type, s.num_comp, s.kiosk)
+                      IS DISTINCT FROM
+                      (st.store_name, st.address, st.city, st.state, st.zip,
+                       st.phone, st.type, st.num_comp, st.kiosk)
+            ) AS updated,
+            COUNT(s.id) AS matched
+        FROM store_staged st
+        LEFT JOIN stores s ON s.store_number = st.store_number;
+        """
+    )
+    counts = cur.fetchone()
+    report = {
+        "rows_read": stream.count,
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["matched"] - counts["updated"],
+        "dry_run": dry_run,
+    }
+
+    if dry_run:
+        conn.rollback()
+        cur.close()
+        return report
+
+    cur.execute(
+        """
+        INSERT INTO stores
+            (store_number, store_name, address, city, state, zip, phone,
+             type, num_comp, kiosk)
+        SELECT store_number, store_name, address, city, state, zip, phone,
+               type, num_comp, kiosk
+        FROM store_staged
+        ON CONFLICT (store_number) DO UPDATE SET
+            store_name = EXCLUDED.store_name,
+            address = EXCLUDED.address,
+            city = EXCLUDED.city,
+            state = EXCLUDED.state,
+            zip = EXCLUDED.zip,
+            phone = EXCLUDED.phone,
+            type = EXCLUDED.type,
+            num_comp = EXCLUDED.num_comp,
+            kiosk = EXCLUDED.kiosk
+        WHERE (stores.store_name, stores.address, stores.city, stores.state,
+               stores.zip, stores.phone, stores.type, stores.num_comp, stores.kiosk)
+              IS DISTINCT FROM
+              (EXCLUDED.store_name, EXCLUDED.address, EXCLUDED.city, EXCLUDED.state,
+               EXCLUDED.zip, EXCLUDED.phone, EXCLUDED.type, EXCLUDED.num_comp,
+               EXCLUDED.kiosk);
+        """
+    )
+
+    conn.commit()
+    cur.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the CCT Metadata store export into stores.")
+    parser.add_argument("export_path", nargs="?", default=os.path.join("Database Files", "CCT Metadata.txt"))
+    parser.add_argument("--dry-run", action="store_true", help="show what would change, write nothing")
+    args = parser.parse_args(argv)
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        sys.exit("DATABASE_URL is not set")
+
+    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        with open(args.export_path, newline="", encoding="utf-8-sig") as f:
+            report = upsert_stores(conn, f, dry_run=args.dry_run)
+    except StoreImportError as e:
+        sys.exit(f"Import failed: {e}")
+    finally:
+        conn.close()
+
+    label = "Dry run" if report["dry_run"] else "Imported"
+    print(f"{label}: {report['rows_read']} rows read")
+    for key in ("inserted", "updated", "unchanged"):
+        print(f"  {key}: {report[key]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+"""
+Endpoint tests for the core API, run against every storage backend.
+
+SQLite always runs (a scratch file per test module). Postgres runs when
+TEST_DATABASE_URL is set; everything happens in the `test_endpoints`
+schema, which is dropped afterwards:
+
+    python -m pytest tests
+    TEST_DATABASE_URL=postgres://... python -m pytest tests
+
+api_server picks its backend from DATABASE_URL at import time, so each
+backend gets a fresh import of the module.
+"""
+import os
+import sys
+import importlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+PG_SCHEMA = "test_endpoints"
+
+# No background work while the tests run; the search cache is off so a
+# search always sees the write made just before it
+QUIET_ENV = {
+    "ARCHIVE_INTERVAL_SECONDS": "0",
+    "MAINTENANCE_INTERVAL_SECONDS": "0",
+    "SEARCH_CACHE_SIZE": "0",
+}
+
+BACKENDS = [
+    "sqlite",
+    pytest.param("postgres", marks=pytest.mark.skipif(
+        not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")),
+]
+
+USER = {
+    "email": "pat.tester@jtax.com",
+    "username": "TesterP",
+    "password": "Sup3r!Secret",
+    "pin": "4821",
+}
+
+
+def _reset_pg_schema(create: bool):
+    import psycopg2
+
+    admin = psycopg2.connect(TEST_DATABASE_URL, options="-c search_path=public")
+    try:
+        admin.autocommit = True
+        admin.cursor().execute(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE;")
+        if create:
+            admin.cursor().execute(f"CREATE SCHEMA {PG_SCHEMA};")
+    finally:
+        admin.close()
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def api(request, tmp_path_factory):
+    """api_server imported against a fresh, empty database of one backend."""
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in QUIET_ENV.items():
+            mp.setenv(name, value)
+        mp.delenv("DATABASE_READ_URL", raising=False)
+        if request.param == "sqlite":
+            path = tmp_path_factory.mktemp("sqlite") / "tracker.db"
+            mp.setenv("DATABASE_URL", f"sqlite:///{path}")
+        else:
+            _reset_pg_schema(create=True)
+            mp.setenv("DATABASE_URL", TEST_DATABASE_URL)
+            # A non-UTC session, so anything that depends on TimeZone shows up
+            mp.setenv("PGOPTIONS", f"-c search_path={PG_SCHEMA} -c TimeZone=America/New_York")
+
+        sys.modules.pop("api_server", None)
+        module = importlib.import_module("api_server")
+        module.app.config["TESTING"] = True
+        try:
+            yield module
+        finally:
+            module.flush_login_buffer()  # before the database goes away
+            sys.modules.pop("api_server", None)
+            if request.param == "postgres":
+                _reset_pg_schema(create=False)
+
+
+def execute(api, query: str, params=()):
+    """Run seed SQL (%s placeholders) on whichever backend `api` uses."""
+    if api.USE_SQLITE:
+        query = query.replace("%s", "?")
+    conn = api.STORAGE.connect()
+    try:
+        conn.cursor().execute(query, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def client(api):
+    for table in ("store_devices", "issues", "stores", "users", "idempotency_keys"):
+        execute(api, f"DELETE FROM {table};")
+    return api.app.test_client()
+
+
+def add_store(api, store_number, store_name, city=None, zip_code=None):
+    execute(
+        api,
+        "INSERT INTO stores (store_number, store_name, city, zip) VALUES (%s, %s, %s, %s);",
+        (store_number, store_name, city, zip_code),
+    )
+
+
+def add_issue(client, store_number=101, store_name="Harbor Point", **fields):
+    issue = {
+        "Store Number": store_number,
+        "Name": "Printer offline",
+        "Priority": "Critical",
+        "Status": "Unresolved",
+        "Device": "Printer",
+        "Category": "Hardware",
+        "Global Issue": False,
+    }
+    issue.update(fields)
+    resp = client.post("/issues", json={"store_name": store_name, "issue": issue})
+    assert resp.status_code == 201, resp.get_json()
+    return resp.get_json()["issue"]
+
+
+def test_home(client):
+    resp = client.get("/")
+    assert resp.status_code == 200
+    assert resp.get_json()["status"] == "ok"
+
+
+def test_register_login_and_quick_login(client):
+    assert client.post("/auth/register", json=USER).status_code == 200
+
+    assert client.post("/auth/login", json=USER).status_code == 200
+    bad = dict(USER, password="Wr0ng!Password")
+    assert client.post("/auth/login", json=bad).status_code == 401
+
+    resp = client.post("/auth/quick-login", json={
+        "username": USER["username"], "password": USER["password"],
+    })
+    assert resp.status_code == 200
+    assert resp.get_json()["email"] == USER["email"]
+
+
+def test_register_rejects_other_domains(client):
+    resp = client.post("/auth/register", json=dict(USER, email="pat@example.com"))
+    assert resp.status_code == 403
+
+
+def test_issue_create_update_delete(client):
+    issue = add_issue(client)
+    assert issue["status"] == "Unresolved"
+    assert issue["status_code"] == 1
+    assert issue["row_version"] == 1
+
+    rows = client.get("/issues/by-store?store_number=101").get_json()
+    assert [r["id"] for r in rows] == [issue["id"]]
+
+    resp = client.post("/issues/update", json={
+        "issue_id": issue["id"],
+        "updated_issue": {"Name": "Printer offline", "Priority": "Functional", "Status": "In Progress"},
+    })
+    assert resp.status_code == 200
+    updated = resp.get_json()["issue"]
+    assert (updated["status_code"], updated["priority_code"]) == (2, 2)
+    assert updated["store_name"] == "Harbor Point"  # kept when not sent
+
+    assert client.post("/issues/delete", json={"issue_id": issue["id"]}).status_code == 200
+    assert client.post("/issues/delete", json={"issue_id": issue["id"]}).status_code == 404
+    assert client.get("/issues/all").get_json() == []
+
+
+def test_patch_issue_checks_version(client):
+    issue = add_issue(client)
+
+    resp = client.patch(f"/issues/{issue['id']}", json={
+        "changes": {"Status": "Resolved", "Resolution": "Replaced the cable"},
+        "expected_version": 1,
+    })
+    assert resp.status_code == 200
+    patched = resp.get_json()["issue"]
+    assert patched["status"] == "Resolved"
+    assert patched["resolution"] == "Replaced the cable"
+    assert patched["issue_name"] == "Printer offline"  # untouched column
+    assert patched["row_version"] == 2
+
+    stale = client.patch(f"/issues/{issue['id']}", json={
+        "changes": {"Status": "Unresolved"},
+        "expected_version": 1,
+    })
+    assert stale.status_code == 409
+    assert stale.get_json()["issue"]["row_version"] == 2
+
+    resp = client.patch(f"/issues/{issue['id']}", json={"changes": {"Status": "Closed"}},
+                        headers={"If-Match": '"2"'})
+    assert resp.status_code == 200
+
+    assert client.patch("/issues/999999", json={"changes": {"Status": "Closed"}}).status_code == 404
+    assert client.patch(f"/issues/{issue['id']}", json={"changes": {"Color": "red"}}).status_code == 400
+
+
+def test_search_filters_and_pages(client):
+    ids = [add_issue(client, Name=f"Scanner jam {n}")["id"] for n in range(3)]
+    add_issue(client, Name="Scanner jam resolved", Status="Resolved")
+    add_issue(client, store_number=202, store_name="Elm Road")
+
+    resp = client.get("/issues/search?store_number=101&status=open&name=scanner")
+    assert resp.status_code == 200
+    assert sorted(r["id"] for r in resp.get_json()) == ids
+
+    first = client.get("/issues/search?store_number=101&status=open&sort=-id&limit=2").get_json()
+    assert [r["id"] for r in first["issues"]] == ids[:0:-1]
+    assert first["next_after"]
+
+    second = client.get(
+        f"/issues/search?store_number=101&status=open&sort=-id&limit=2&after={first['next_after']}"
+    ).get_json()
+    assert [r["id"] for r in second["issues"]] == ids[:1]
+    assert second["next_after"] is None
+
+    assert client.get("/issues/search").status_code == 400
+    assert client.get("/issues/search?store_number=101&facets=colour").status_code == 400
+
+
+def test_search_facets_count_every_match(client):
+    add_issue(client)
+    add_issue(client, Priority="Cosmetic")
+    add_issue(client, Status="Resolved", Priority="Cosmetic")
+
+    body = client.get("/issues/search?store_number=101&facets=status,priority&limit=1").get_json()
+    assert len(body["issues"]) == 1
+    status = {f["value"]: f["count"] for f in body["facets"]["status"]}
+    priority = {f["value"]: f["count"] for f in body["facets"]["priority"]}
+    assert status == {"Unresolved": 2, "Resolved": 1}
+    assert priority == {"Critical": 1, "Cosmetic": 2}
+
+
+def test_stores_and_lookup(api, client):
+    add_store(api, 101, "Harbor Point", city="Boston", zip_code="02110")
+    add_store(api, 1015, "Elm Road", city="Cambridge", zip_code="02139")
+    add_issue(client)
+
+    stores = client.get("/stores").get_json()
+    assert set(stores) == {"Harbor Point", "Elm Road"}
+    assert stores["Harbor Point"]["Issue Counts"]["open"] == 1
+
+    resp = client.get("/stores/lookup?q=101")
+    assert resp.status_code == 200
+    matches = resp.get_json()["matches"]
+    assert [m["Store Number"] for m in matches] == [101, 1015]
+    assert matches[0]["Score"] == 100
+    assert matches[0]["Issue Counts"]["total"] == 1
+
+    names = client.get("/stores/lookup?q=cambr").get_json()["matches"]
+    assert [m["Store Number"] for m in names] == [1015]
+    assert client.get("/stores/lookup").status_code == 400
+
+
+def test_devices_by_store(api, client):
+    add_store(api, 101, "Harbor Point")
+    execute(
+        api,
+        "INSERT INTO store_devices (device_uid, store_number, device_type, device_number) "
+        "VALUES (%s, %s, %s, %s);",
+        ("101-PC-1", 101, "Computer", "1"),
+    )
+
+    body = client.get("/devices/by-store?store_number=101").get_json()
+    assert [d["device_uid"] for d in body["devices"]] == ["101-PC-1"]
+    assert set(api.DEVICE_CATEGORIES) <= set(body["by_category"])
+    assert client.get("/devices/by-store?store_number=abc").status_code == 400
+
+
+def test_batch_get_and_delete(client):
+    a = add_issue(client)["id"]
+    b = add_issue(client)["id"]
+
+    body = client.post("/issues/batch-get", json={"ids": [b, a, 999999]}).get_json()
+    assert [r["id"] for r in body["issues"]] == [b, a]
+    assert body["missing"] == [999999]
+
+    body = client.post("/issues/batch-delete", json={"ids": [a, 999999]}).get_json()
+    assert (body["deleted"], body["not_found"]) == (1, 1)
+    assert [r["id"] for r in client.get("/issues/all").get_json()] == [b]
+
+
+def test_idempotency_key_replays_the_first_response(client):
+    body = {"store_name": "Harbor Point", "issue": {"Store Number": 101, "Name": "Till frozen"}}
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post("/issues", json=body, headers=headers)
+    again = client.post("/issues", json=body, headers=headers)
+    assert first.status_code == again.status_code == 201
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.get_json() == first.get_json()
+    assert len(client.get("/issues/all").get_json()) == 1
+
+    other = dict(body, store_name="Elm Road")
+    assert client.post("/issues", json=other, headers=headers).status_code == 422
+
+
+def test_failed_transaction_frees_the_key_with_its_writes(api, client):
+    storage = api.STORAGE
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            assert storage.claim_idempotency_key("retry-2", "POST /issues", "h") is None
+            storage.insert_issue({"store_name": "Harbor Point", "store_number": 101, "global_issue": False})
+            raise RuntimeError("worker died before answering")
+
+    assert client.get("/issues/all").get_json() == []
+    with storage.transaction():
+        assert storage.claim_idempotency_key("retry-2", "POST /issues", "h") is None
+
+
+def test_aborted_batch_with_idempotency_key(api, client):
+    if api.USE_SQLITE:
+        pytest.skip("/batch is Postgres only")
+    issue = add_issue(client)
+    body = {"operations": [
+        {"op": "update", "issue_id": issue["id"], "changes": {"Status": "Resolved"}},
+        {"op": "delete", "issue_id": 999999},
+    ]}
+
+    first = client.post("/batch", json=body, headers={"Idempotency-Key": "batch-1"})
+    assert first.status_code == 400
+    assert [r["status"] for r in first.get_json()["results"]] == ["rolled_back", "error"]
+    assert client.get("/issues/all").get_json()[0]["status"] == "Unresolved"
+
+    again = client.post("/batch", json=body, headers={"Idempotency-Key": "batch-1"})
+    assert again.headers["Idempotent-Replayed"] == "true"
+
+
+def test_postgres_only_endpoints_answer_501_on_sqlite(api, client):
+    if not api.USE_SQLITE:
+        pytest.skip("SQLite backend only")
+    assert client.get("/stores/101/dashboard").status_code == 501
+    assert client.post("/batch", json={"operations": []}).status_code == 501
+
+
+def test_issue_history_on_postgres(api, client):
+    if api.USE_SQLITE:
+        pytest.skip("issue_events is Postgres only")
+    issue = add_issue(client)
+    client.patch(f"/issues/{issue['id']}", json={"changes": {"Status": "Resolved"}},
+                 headers={"X-User": "TesterP"})
+
+    body = client.get(f"/issues/{issue['id']}/history").get_json()
+    assert [e["op"] for e in body["events"]] == ["I", "U"]
+    assert body["events"][1]["actor"] == "TesterP"
+    assert body["hours_to_resolution"] is not None
+
+
+def test_conflict_merge_keeps_other_users_changes(client):
+    gui = pytest.importorskip("JHReportsNEW_secured")
+    issue = add_issue(client)
+    loaded = gui.EditIssueFrame._row_to_issue(issue)
+
+    # Someone else resolves the issue while this user edits the description
+    client.patch(f"/issues/{issue['id']}", json={
+        "changes": {"Status": "Resolved", "Resolution": "Replaced the cable"},
+    })
+    edited = dict(loaded, Description="Jams on every third page")
+    stale = client.patch(f"/issues/{issue['id']}", json={
+        "changes": gui.issue_edits(loaded, edited),
+        "expected_version": issue["row_version"],
+    })
+    assert stale.status_code == 409
+
+    latest = stale.get_json()["issue"]
+    changes = gui.issue_edits(loaded, edited, gui.EditIssueFrame._row_to_issue(latest))
+    assert changes == {"Description": "Jams on every third page"}
+
+    resp = client.patch(f"/issues/{issue['id']}", json={
+        "changes": changes, "expected_version": latest["row_version"],
+    })
+    assert resp.status_code == 200
+    merged = resp.get_json()["issue"]
+    assert (merged["status"], merged["resolution"]) == ("Resolved", "Replaced the cable")
+    assert merged["description"] == "Jams on every third page"
+
+
+def test_archive_partitions_are_utc_months(api, client):
+    if api.USE_SQLITE:
+        pytest.skip("the archive is Postgres only")
+    issue = add_issue(client, Status="Resolved")
+    # Still June in New York (the session TimeZone), July in UTC
+    execute(api, "UPDATE issues SET updated_at = %s WHERE id = %s;",
+            ("2026-07-01 02:00:00+00", issue["id"]))
+
+    assert api.archive_resolved_issues(older_than_days=1) == 1
+    conn = api.STORAGE.connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT tableoid::regclass::text AS part FROM issues_archive WHERE id = %s;",
+                    (issue["id"],))
+        assert cur.fetchone()["part"] == "issues_archive_2026_07"
+    finally:
+        conn.close()
+
+
+def test_snapshot_is_not_rebuilt_after_another_worker_wrote_it(api, client, tmp_path, monkeypatch):
+    if api.USE_SQLITE:
+        pytest.skip("report snapshots are Postgres only")
+    monkeypatch.setattr(api, "REPORT_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(api, "REPORT_SNAPSHOT_HOUR_UTC", 0)
+    add_issue(client)
+    assert api.snapshot_known_issues_if_due()
+    assert not api.snapshot_known_issues_if_due()
+    # An explicit snapshot job always renders, taking its turn on the lock
+    assert set(api._job_known_issues_snapshot({}, api.JobContext(0))) == set(api.REPORT_FORMATS)
+
+    # This worker read the manifest just before another one finished writing
+    load = api.load_snapshot_manifest
+    reads = iter([{}])
+    monkeypatch.setattr(api, "load_snapshot_manifest", lambda: next(reads, None) or load())
+    monkeypatch.setattr(api, "write_known_issues_snapshots", lambda conn: pytest.fail("rebuilt"))
+    assert not api.snapshot_known_issues_if_due()
+
+
+def test_only_transient_database_errors_answer_503(api, client, monkeypatch):
+    if api.USE_SQLITE:
+        pytest.skip("psycopg2 errors only come from Postgres")
+    import psycopg2
+
+    def failing(message):
+        def get_issues(*args, **kwargs):
+            raise psycopg2.OperationalError(message)
+        return get_issues
+
+    monkeypatch.setattr(api.STORAGE, "get_issues", failing("server closed the connection unexpectedly"))
+    resp = client.post("/issues/batch-get", json={"ids": [1]})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"]
+
+    monkeypatch.setattr(api.STORAGE, "get_issues", failing(
+        'connection to server failed: FATAL:  password authentication failed for user "jh"'))
+    assert client.post("/issues/batch-get", json={"ids": [1]}).status_code == 500
+
+
+def test_prepared_statements_survive_a_new_issue_column(api, client):
+    if api.USE_SQLITE:
+        pytest.skip("PREPAREd statements are Postgres only")
+    add_issue(client)
+    assert len(client.get("/issues/by-store?store_number=101").get_json()) == 1
+
+    # A later init_db() migration adding a column must not break the cached plans
+    execute(api, "ALTER TABLE issues ADD COLUMN scratch_note TEXT;")
+    try:
+        resp = client.get("/issues/by-store?store_number=101")
+        assert resp.status_code == 200
+        assert "scratch_note" not in resp.get_json()[0]
+        add_issue(client)
+    finally:
+        execute(api, "ALTER TABLE issues DROP COLUMN scratch_note;")
+
+
+ADMIN = {
+    "email": "sammi.fishbein@jtax.com",
+    "username": "FishbeinS",
+    "password": "Adm1n!Secret",
+    "pin": "7391",
+}
+ADMIN_AUTH = {"admin_email": ADMIN["email"], "admin_password": ADMIN["password"],
+              "admin_pin": ADMIN["pin"]}
+ADMIN_HEADERS = {"X-Admin-Email": ADMIN["email"], "X-Admin-Password": ADMIN["password"],
+                 "X-Admin-Pin": ADMIN["pin"]}
+
+
+def test_password_pin_and_admin_user_changes_on_postgres(api, client):
+    if api.USE_SQLITE:
+        pytest.skip("admin endpoints are Postgres only")
+    assert client.post("/auth/register", json=ADMIN).status_code == 200
+    assert client.post("/auth/register", json=USER).status_code == 200
+
+    resp = client.post("/auth/change-password", json={
+        "email": USER["email"], "username": USER["username"], "current_password": USER["password"],
+        "pin": USER["pin"], "new_password": "N3w!Password",
+    })
+    assert resp.status_code == 200, resp.get_json()
+    resp = client.post("/auth/change-pin", json={
+        "email": USER["email"], "username": USER["username"], "password": "N3w!Password",
+        "current_pin": USER["pin"], "new_pin": "5682",
+    })
+    assert resp.status_code == 200, resp.get_json()
+    assert client.post("/auth/login", json={**USER, "password": "N3w!Password",
+                                            "pin": "5682"}).status_code == 200
+
+    target = {**ADMIN_AUTH, "target_email": USER["email"]}
+    assert client.post("/admin/change-user-password",
+                       json={**target, "new_password": "Th1rd!Password"}).status_code == 200
+    assert client.post("/admin/change-user-pin", json={**target, "new_pin": "6093"}).status_code == 200
+    assert client.post("/auth/login", json={**USER, "password": "Th1rd!Password",
+                                            "pin": "6093"}).status_code == 200
+
+    users = client.post("/admin/users", json=ADMIN_AUTH).get_json()["users"]
+    assert [u["email"] for u in users] == [USER["email"], ADMIN["email"]]
+    assert client.post("/admin/delete-user", json=target).status_code == 200
+    assert client.post("/admin/delete-user", json=target).status_code == 404
+    users = client.post("/admin/users", json=ADMIN_AUTH).get_json()["users"]
+    assert [u["email"] for u in users] == [ADMIN["email"]]
+
+
+def test_device_import_dashboard_and_search_on_postgres(api, client, tmp_path, monkeypatch):
+    if api.USE_SQLITE:
+        pytest.skip("device imports and dashboards are Postgres only")
+    import io
+
+    monkeypatch.setattr(api, "JOB_UPLOAD_DIR", str(tmp_path))
+    assert client.post("/auth/register", json=ADMIN).status_code == 200
+    add_store(api, 101, "Harbor Point")
+    csv_text = (
+        "store_number,device_type,device_number,manufacturer,model\n"
+        "101,Printer,1,HP,M404\n"
+        "101,Computer,1,Dell,Optiplex 7090\n"
+    )
+
+    resp = client.post("/devices/bulk-upsert", data={**ADMIN_AUTH, "file": (
+        io.BytesIO(csv_text.encode()), "devices.csv")})
+    assert resp.status_code == 200, resp.get_json()
+    assert resp.get_json()["inserted"] == 2
+
+    resp = client.post("/devices/bulk-upsert", data={**ADMIN_AUTH, "async": "1", "file": (
+        io.BytesIO(csv_text.encode()), "devices.csv")})
+    assert resp.status_code == 202
+    job_id = resp.get_json()["job_id"]
+    api.run_job_worker(worker_id="test-worker", once=True)
+    job = client.get(f"/jobs/{job_id}", headers=ADMIN_HEADERS).get_json()
+    assert (job["status"], job["result"]["unchanged"]) == ("succeeded", 2)
+
+    add_issue(client)
+    resp = client.get("/stores/101/dashboard")
+    body = resp.get_json()
+    assert (body["device_count"], len(body["open_issues"])) == (2, 1)
+    assert client.get("/stores/101/dashboard",
+                      headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+    assert client.get("/stores/999/dashboard").status_code == 404
+
+    body = client.get("/devices/search?manufacturer=hp").get_json()
+    assert [d["model"] for d in body["devices"]] == ["M404"]
+    body = client.get("/devices/search?device_type=printer,computer&limit=1").get_json()
+    assert len(body["devices"]) == 1 and body["next_after"]
+    body = client.get(f"/devices/search?device_type=printer,computer&after={body['next_after']}").get_json()
+    assert len(body["devices"]) == 1 and body["next_after"] is None
+    body = client.get("/devices/search?state=&store_type=&manufacturer=hp,dell&mode=aggregate").get_json()
+    assert sorted(m["manufacturer"] for m in body["by_model"]) == ["Dell", "HP"]
+
+
+def test_jobs_and_live_report_on_postgres(api, client):
+    if api.USE_SQLITE:
+        pytest.skip("jobs and reports are Postgres only")
+    assert client.post("/auth/register", json=ADMIN).status_code == 200
+    add_issue(client, Name="Scanner beeps")
+
+    resp = client.post("/jobs", json={**ADMIN_AUTH, "kind": "rebuild_store_issue_counts"})
+    assert resp.status_code == 202
+    job_id = resp.get_json()["job_id"]
+    assert client.get(f"/jobs/{job_id}", headers=ADMIN_HEADERS).get_json()["status"] == "queued"
+    api.run_job_worker(worker_id="test-worker", once=True)
+    job = client.get(f"/jobs/{job_id}", headers=ADMIN_HEADERS).get_json()
+    assert (job["status"], job["progress"], job["result"]) == ("succeeded", 100, {"counter_rows": 1})
+    assert client.get("/jobs/999999", headers=ADMIN_HEADERS).status_code == 404
+
+    resp = client.get("/reports/known-issues?format=csv")
+    assert resp.status_code == 200
+    assert "Scanner beeps" in resp.get_data(as_text=True)